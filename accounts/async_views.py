@@ -0,0 +1,35 @@
+from rest_framework import permissions
+
+from social_network.async_views import AsyncListAPIView
+
+from .blocklist import BlocklistManager
+from .models import CustomUser
+from .permissions import RoleBasedPermission
+from .search import SearchPagination, UserSearchCache, get_search_query
+from .serializers import UserSerializer
+
+
+class AsyncUserSearchView(AsyncListAPIView):
+    serializer_class = UserSerializer
+    permission_classes = (permissions.IsAuthenticated, RoleBasedPermission)
+
+    pagination_class = SearchPagination
+    throttle_scope = 'search'
+
+    async def aget_queryset(self):
+        request_user = self.request.user
+        user_ids, self.truncated = UserSearchCache.truncate(await UserSearchCache.aget_ids(get_search_query(self.request)))
+
+        excluded_ids = await BlocklistManager.aget_blocked_by_ids(request_user.id) | {request_user.id}
+
+        return [user_id for user_id in user_ids if user_id not in excluded_ids]
+
+    def filter_queryset(self, user_ids):
+        # the fieldset applies to the users loaded in apaginate_queryset()
+        return user_ids
+
+    async def apaginate_queryset(self, user_ids):
+        # the ids are paginated as a plain list and only the page's users are loaded, like LazyUserList
+        user_ids = self.paginator.paginate_queryset(user_ids, self.request, view=self)
+        users = await self.apply_fieldset(CustomUser.objects.all()).ain_bulk(user_ids)
+        return [users[user_id] for user_id in user_ids if user_id in users]
@@ -0,0 +1,167 @@
+from django.conf import settings
+from django.db import models
+from django.utils.functional import cached_property
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .models import CustomUser
+
+
+class ClaimsRefreshToken(RefreshToken):
+    """
+    Refresh token carrying the claims ClaimsUser needs; access tokens made from it copy them.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token['role'] = user.role
+        token['is_active'] = user.is_active
+        return token
+
+
+class ClaimsUser:
+    """
+    Stand-in for CustomUser built from the access token claims.
+
+    id, role, is_active and is_staff come from the token, which is all the permission
+    classes need. Any other attribute loads the CustomUser row on first use. Code that
+    passes the user to the ORM should pass request.user.id instead.
+    Role and active-status changes apply once the user's current access token expires.
+    """
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, token):
+        self.token = token
+        self.id = self.pk = token[api_settings.USER_ID_CLAIM]
+        self.role = token['role']
+        self.is_active = token['is_active']
+
+    def __str__(self):
+        return f"ClaimsUser {self.id}"
+
+    @property
+    def is_staff(self):
+        return self.role == "admin"
+
+    @cached_property
+    def user(self):
+        return CustomUser.objects.get(id=self.id)
+
+    def __getattr__(self, name):
+        if name.startswith('__') or name in ('token', 'user'):
+            raise AttributeError(name)
+        return getattr(self.user, name)
+
+    def __eq__(self, other):
+        if not isinstance(other, (ClaimsUser, models.Model)):
+            return NotImplemented
+        return self.pk == other.pk
+
+    def __hash__(self):
+        return hash(self.pk)
+
+
+class RequestCachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that remembers its outcome on the underlying HttpRequest, so the token
+    is decoded and the user fetched at most once per request, whether DRF or
+    LoggingMiddleware asks first.
+    """
+
+    cache_attribute = '_jwt_authentication'
+
+    def authenticate(self, request):
+        http_request = getattr(request, '_request', request)
+
+        if hasattr(http_request, self.cache_attribute):
+            result, error = getattr(http_request, self.cache_attribute)
+            if error is not None:
+                raise error
+            return result
+
+        try:
+            result = super().authenticate(request)
+        except AuthenticationFailed as e:
+            setattr(http_request, self.cache_attribute, (None, e))
+            raise
+
+        setattr(http_request, self.cache_attribute, (result, None))
+        return result
+
+    async def aauthenticate(self, request):
+        """
+        authenticate() for async views, loading the user with the async ORM.
+        """
+        http_request = getattr(request, '_request', request)
+
+        if hasattr(http_request, self.cache_attribute):
+            result, error = getattr(http_request, self.cache_attribute)
+            if error is not None:
+                raise error
+            return result
+
+        try:
+            result = None
+            header = self.get_header(request)
+            raw_token = self.get_raw_token(header) if header is not None else None
+            if raw_token is not None:
+                validated_token = self.get_validated_token(raw_token)
+                result = (await self.aget_user(validated_token), validated_token)
+        except AuthenticationFailed as e:
+            setattr(http_request, self.cache_attribute, (None, e))
+            raise
+
+        setattr(http_request, self.cache_attribute, (result, None))
+        return result
+
+    def get_user(self, validated_token):
+        if not settings.JWT_CLAIMS_USER or 'role' not in validated_token:
+            return super().get_user(validated_token)
+
+        if not validated_token.get('is_active', False):
+            raise AuthenticationFailed("User is inactive", code="user_inactive")
+
+        return ClaimsUser(validated_token)
+
+    async def aget_user(self, validated_token):
+        if settings.JWT_CLAIMS_USER and 'role' in validated_token:
+            return self.get_user(validated_token)
+
+        # JWTAuthentication.get_user with the async ORM
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken("Token contained no recognizable user identification")
+
+        try:
+            user = await self.user_model.objects.aget(**{api_settings.USER_ID_FIELD: user_id})
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed("User not found", code="user_not_found")
+
+        if not user.is_active:
+            raise AuthenticationFailed("User is inactive", code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed("The user's password has been changed.", code="password_changed")
+
+        return user
+
+
+def get_authenticated_user(request):
+    """
+    The JWT user of the request, or None if it has no valid token.
+    """
+    try:
+        auth_result = RequestCachedJWTAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return None
+
+    return auth_result[0] if auth_result is not None else None
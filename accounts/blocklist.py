@@ -0,0 +1,309 @@
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from friend_management.cache import IdSetCache, SuggestionRefreshQueue, UserCacheVersions, get_redis_client
+from friend_management.changes import ChangeFeed
+from .models import BlockedUser
+
+logger = logging.getLogger(__name__)
+
+
+class BlockedByCache(IdSetCache):
+    """
+    Ids of the users who have blocked each user.
+    """
+
+    key_template = "blocked_by_cache_{user_id}"
+
+
+class BlockingCache(IdSetCache):
+    """
+    Ids of the users each user has blocked.
+    """
+
+    key_template = "blocking_cache_{user_id}"
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over integer ids. No false negatives, false positives at about error_rate.
+    """
+
+    def __init__(self, capacity, error_rate):
+        capacity = max(capacity, 1)
+        self.size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(str(item).encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'big'), int.from_bytes(digest[8:], 'big')
+        return ((first + i * second) % self.size for i in range(self.hash_count))
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position // 8] |= 1 << (position % 8)
+
+    def __contains__(self, item):
+        return all(self.bits[position // 8] & (1 << (position % 8)) for position in self._positions(item))
+
+
+class BlockedUsersFilter:
+    """
+    Per-process Bloom filter of every user that somebody has blocked, so the common
+    "nobody blocked this user" case needs no cache round-trip.
+
+    add() puts a newly blocked user in the filter and publishes it on a Redis channel; a
+    listener thread in every other worker adds it to theirs, the way LocalCache spreads
+    invalidations. The filter is built from the database in a background thread once the
+    listener has subscribed, again whenever it reconnects (as blocks may have been missed)
+    and every REFRESH_INTERVAL seconds. Until it is built every user might be blocked.
+    Only used with the Redis cache backend, which carries the block events.
+    """
+
+    def __init__(self):
+        self._filter = None
+        self._built_at = 0
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._generation = 0  # bumped when the listener (re)subscribes
+        self._added = None  # users added while a rebuild runs, put in the new filter too
+        self._listener_pid = None
+
+    @property
+    def enabled(self):
+        return settings.BLOCKLIST_BLOOM['ENABLED'] and get_redis_client() is not None
+
+    @staticmethod
+    def channel():
+        return cache.make_key(settings.BLOCKLIST_BLOOM['CHANNEL'])
+
+    def might_be_blocked(self, user_id):
+        if not self.enabled:
+            return True
+        self._start_listener()
+
+        bloom = self._filter
+        if bloom is None or time.monotonic() - self._built_at > settings.BLOCKLIST_BLOOM['REFRESH_INTERVAL']:
+            self._rebuild_in_background()
+
+        return bloom is None or user_id in bloom
+
+    async def amight_be_blocked(self, user_id):
+        # never waits for the database: the filter is built in a background thread
+        return self.might_be_blocked(user_id)
+
+    def add(self, user_id):
+        """
+        Add the user in this process and publish it to the other workers.
+        """
+        if not self.enabled:
+            return
+
+        self._add(user_id)
+        get_redis_client().publish(self.channel(), user_id)
+
+    def _add(self, user_id):
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(user_id)
+            if self._added is not None:
+                self._added.append(user_id)
+
+    def rebuild(self):
+        """
+        Build the filter from the database. Returns False, keeping the current filter, when
+        the listener resubscribed meanwhile, as blocks may have been missed during the scan.
+        """
+        with self._lock:
+            generation = self._generation
+            self._added = []
+
+        try:
+            blocked_user_ids = BlockedUser.objects.values_list('blocked_user_id', flat=True).distinct()
+            bloom = BloomFilter(
+                max(settings.BLOCKLIST_BLOOM['CAPACITY'], blocked_user_ids.count() * 2),
+                settings.BLOCKLIST_BLOOM['ERROR_RATE'],
+            )
+            for user_id in blocked_user_ids.iterator():
+                bloom.add(user_id)
+        finally:
+            with self._lock:
+                added, self._added = self._added, None
+
+        with self._lock:
+            if generation != self._generation:
+                return False
+
+            for user_id in added:
+                bloom.add(user_id)
+            self._filter = bloom
+            self._built_at = time.monotonic()
+        return True
+
+    def _rebuild_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                while not self.rebuild():
+                    pass
+            except Exception:
+                logger.exception("Blocked users filter rebuild failed")
+            finally:
+                self._refreshing = False
+                connection.close()
+
+        threading.Thread(target=run, name="blocklist-bloom-refresh", daemon=True).start()
+
+    def _start_listener(self):
+        # started lazily and again after a fork, as threads do not survive it
+        if self._listener_pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._listener_pid == os.getpid():
+                return
+            self._listener_pid = os.getpid()
+            self._filter = None
+            self._refreshing = False
+
+        threading.Thread(target=self._listen, name="blocklist-bloom-events", daemon=True).start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = get_redis_client().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel())
+                # anything published while not subscribed was missed: rebuild, and treat every
+                # user as possibly blocked until then
+                with self._lock:
+                    self._generation += 1
+                    self._filter = None
+                self._rebuild_in_background()
+                for message in pubsub.listen():
+                    if message['type'] == 'message':
+                        self._add(int(message['data']))
+            except Exception:
+                logger.exception("Blocked users filter listener failed, reconnecting")
+                time.sleep(1)
+
+
+blocked_users_filter = BlockedUsersFilter()
+
+
+class BlocklistManager:
+
+    @classmethod
+    def get_blocked_by_ids(cls, user_id):
+        """
+        Ids of the users who have blocked the user.
+        """
+        if not blocked_users_filter.might_be_blocked(user_id):
+            return set()
+
+        return BlockedByCache.get_or_load(
+            user_id, lambda: BlockedUser.objects.filter(blocked_user_id=user_id).values_list('user_id', flat=True)
+        )
+
+    @classmethod
+    async def aget_blocked_by_ids(cls, user_id):
+        if not await blocked_users_filter.amight_be_blocked(user_id):
+            return set()
+
+        async def aload():
+            return {
+                blocker_id async for blocker_id in
+                BlockedUser.objects.filter(blocked_user_id=user_id).values_list('user_id', flat=True)
+            }
+
+        return await BlockedByCache.aget_or_load(user_id, aload)
+
+    @classmethod
+    def is_blocked_by(cls, user_id, other_user_id):
+        """
+        Whether other_user_id has blocked user_id.
+        """
+        if not blocked_users_filter.might_be_blocked(user_id):
+            return False
+
+        is_blocked = BlockedByCache.contains(user_id, other_user_id)
+        if is_blocked is not None:
+            return is_blocked
+
+        return other_user_id in cls.get_blocked_by_ids(user_id)
+
+    @classmethod
+    def get_blocking_ids(cls, user_id):
+        """
+        Ids of the users the user has blocked.
+        """
+        return BlockingCache.get_or_load(
+            user_id, lambda: BlockedUser.objects.filter(user_id=user_id).values_list('blocked_user_id', flat=True)
+        )
+
+    @classmethod
+    async def aget_blocking_ids(cls, user_id):
+        async def aload():
+            return {
+                blocked_user_id async for blocked_user_id in
+                BlockedUser.objects.filter(user_id=user_id).values_list('blocked_user_id', flat=True)
+            }
+
+        return await BlockingCache.aget_or_load(user_id, aload)
+
+    @classmethod
+    async def afilter_blocking_ids(cls, user_id, user_ids):
+        blocking_ids = await BlockingCache.acontains_many(user_id, user_ids)
+        if blocking_ids is not None:
+            return blocking_ids
+
+        return (await cls.aget_blocking_ids(user_id)).intersection(user_ids)
+
+    @classmethod
+    def filter_blocking_ids(cls, user_id, user_ids):
+        """
+        Return which of user_ids the user has blocked.
+        """
+        blocking_ids = BlockingCache.contains_many(user_id, user_ids)
+        if blocking_ids is not None:
+            return blocking_ids
+
+        return cls.get_blocking_ids(user_id).intersection(user_ids)
+
+    @classmethod
+    def block(cls, user_id, blocked_user_id):
+        with transaction.atomic():
+            blocked_user = BlockedUser.objects.create(user_id=user_id, blocked_user_id=blocked_user_id)
+            ChangeFeed.record([(user_id, ChangeFeed.BLOCKED_USERS, ChangeFeed.ADDED, blocked_user_id)])
+
+        BlockedByCache.add([(blocked_user_id, user_id)])
+        BlockingCache.add([(user_id, blocked_user_id)])
+        # is_blocked is part of the user's friend list
+        UserCacheVersions.incr(user_id, "friends")
+        blocked_users_filter.add(blocked_user_id)
+        SuggestionRefreshQueue.push([user_id, blocked_user_id])
+
+        return blocked_user
+
+    @classmethod
+    def unblock(cls, blocked_user):
+        with transaction.atomic():
+            blocked_user.delete()
+            ChangeFeed.record([(blocked_user.user_id, ChangeFeed.BLOCKED_USERS, ChangeFeed.REMOVED, blocked_user.blocked_user_id)])
+
+        BlockedByCache.remove([(blocked_user.blocked_user_id, blocked_user.user_id)])
+        BlockingCache.remove([(blocked_user.user_id, blocked_user.blocked_user_id)])
+        UserCacheVersions.incr(blocked_user.user_id, "friends")
+        SuggestionRefreshQueue.push([blocked_user.user_id, blocked_user.blocked_user_id])
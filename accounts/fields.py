@@ -0,0 +1,97 @@
+import functools
+
+from django.conf import settings
+from django.db.models.query_utils import DeferredAttribute
+from django.utils.functional import Promise
+from encrypted_model_fields.fields import EncryptedEmailField, decrypt_str
+
+
+@functools.lru_cache(maxsize=settings.EMAIL_DECRYPTION_CACHE_SIZE)
+def decrypt(ciphertext):
+    # Fernet ciphertexts are salted, so a row keeps the same one until its email is written again
+    return decrypt_str(ciphertext)
+
+
+class EncryptedValue(Promise):
+    """
+    A value as loaded from the database, decrypted only once it is used as a string.
+    Model attributes swap it for the plaintext on first read; values() querysets return it as is.
+    """
+
+    def __init__(self, ciphertext):
+        self.ciphertext = ciphertext
+
+    def __str__(self):
+        return decrypt(self.ciphertext)
+
+    def __repr__(self):
+        return repr(str(self))
+
+    def __eq__(self, other):
+        if isinstance(other, EncryptedValue):
+            other = str(other)
+        return str(self) == other
+
+    def __hash__(self):
+        return hash(str(self))
+
+
+class LazyDecryptionAttribute(DeferredAttribute):
+    """
+    Decrypts the field on first read and remembers the ciphertext it came from, so saving
+    the instance again writes that ciphertext back instead of encrypting the same value anew.
+    """
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+
+        value = super().__get__(instance, cls)
+        if isinstance(value, EncryptedValue):
+            plaintext = str(value)
+            instance.__dict__[self.field.attname] = plaintext
+            instance.__dict__[self.field.loaded_value_attname] = (plaintext, value)
+            return plaintext
+        return value
+
+    def __set__(self, instance, value):
+        # a data descriptor, so reads still come through __get__ once the value is in __dict__
+        instance.__dict__[self.field.attname] = value
+
+
+class LazyEncryptedEmailField(EncryptedEmailField):
+    """
+    EncryptedEmailField that decrypts on attribute access instead of on load, through a
+    bounded per-process cache of ciphertext -> plaintext.
+    """
+    descriptor_class = LazyDecryptionAttribute
+
+    @property
+    def loaded_value_attname(self):
+        return f"_{self.attname}_loaded"
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return EncryptedValue(value)
+
+    def to_python(self, value):
+        if isinstance(value, EncryptedValue):
+            return str(value)
+        return super().to_python(value)
+
+    def pre_save(self, model_instance, add):
+        value = model_instance.__dict__.get(self.attname)
+        if isinstance(value, EncryptedValue):
+            # never read, so never changed
+            return value
+
+        plaintext, loaded = model_instance.__dict__.get(self.loaded_value_attname, (None, None))
+        if loaded is not None and value == plaintext:
+            return loaded
+        return super().pre_save(model_instance, add)
+
+    def get_db_prep_save(self, value, connection):
+        if isinstance(value, EncryptedValue):
+            return value.ciphertext
+        return super().get_db_prep_save(value, connection)
@@ -0,0 +1,54 @@
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+
+class AddPostgresIndex(migrations.AddIndex):
+    """
+    AddIndex for index types only PostgreSQL has (here GIN with trigram operator classes):
+    the model state always gets the index, other databases are left without it.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_remove_customuser_is_staff_customuser_role'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        AddPostgresIndex(
+            model_name='customuser',
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass('first_name', name='gin_trgm_ops'),
+                name='customuser_first_name_trgm',
+            ),
+        ),
+        AddPostgresIndex(
+            model_name='customuser',
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass('last_name', name='gin_trgm_ops'),
+                name='customuser_last_name_trgm',
+            ),
+        ),
+        AddPostgresIndex(
+            model_name='customuser',
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Concat('first_name', models.Value(' '), 'last_name'),
+                    name='gin_trgm_ops',
+                ),
+                name='customuser_full_name_trgm',
+            ),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:40
+
+import accounts.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_search_trigram_indexes'),
+    ]
+
+    operations = [
+        # same column, only the Python side of the field changes
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='customuser',
+                    name='email',
+                    field=accounts.fields.LazyEncryptedEmailField(unique=True),
+                ),
+            ],
+        ),
+    ]
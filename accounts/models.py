@@ -1,11 +1,13 @@
 from accounts.utils import consistent_encrypt
 
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.contrib.postgres.search import TrigramSimilarity
 
-from django.db import models
+from django.db import connections, models
+from django.db.models.functions import Concat
 
-from encrypted_model_fields.fields import EncryptedEmailField, EncryptedCharField
+from .fields import LazyEncryptedEmailField
 
 
 
@@ -42,28 +44,42 @@ class CustomUserManager(BaseUserManager):
 
         return self.create_user(email, password, **extra_fields)
 
+# Same expression as the customuser_full_name_trgm index, so the planner can match it.
+FULL_NAME = Concat('first_name', models.Value(' '), 'last_name')
+
+
 class CustomUserQuerySet(models.QuerySet):
     
     def search(self, q):
+        if not q.strip():
+            return self.none()
+
         encrypted_query = consistent_encrypt(q)
-        
-        # include the user if its email matches the query
-        queryset = self.filter(
-            models.Q(email_hash=encrypted_query)
-        )
 
-        if queryset.exists():
-            return queryset
-        
+        # include only the user if its email matches the query
+        email_match = models.Q(email_hash=encrypted_query)
+        no_email_match = ~models.Exists(self.model.objects.filter(email_hash=encrypted_query))
+
+        if connections[self.db].vendor != 'postgresql':
+            return self.filter(
+                email_match | (no_email_match & (models.Q(first_name__icontains=q) | models.Q(last_name__icontains=q)))
+            ).order_by('first_name', 'last_name', 'id')
+
         # If the search keyword contains any part of the name, return a list of all matching users.
-        # Implement full-text search using PostgreSQL for name-based queries to enhance performance and accuracy.
+        # The % operator (trigram_similar) can use the GIN trigram indexes, unlike a filter on similarity().
         queryset = self.annotate(
+            full_name=FULL_NAME
+        ).filter(
+            email_match | (no_email_match & (
+                models.Q(first_name__trigram_similar=q) |
+                models.Q(last_name__trigram_similar=q) |
+                models.Q(full_name__trigram_similar=q)
+            ))
+        ).annotate(
             first_name_similarity=TrigramSimilarity('first_name', q)
         ).annotate(
             last_name_similarity=TrigramSimilarity('last_name', q)
-        ).filter(
-            models.Q(first_name_similarity__gt=0.1) | models.Q(last_name_similarity__gt=0.1)
-        ).order_by('-first_name_similarity', '-last_name_similarity')
+        ).order_by('-first_name_similarity', '-last_name_similarity', 'id')
 
         return queryset
     
@@ -74,7 +90,7 @@ class CustomUserQuerySet(models.QuerySet):
 
 class CustomUser(AbstractBaseUser, PermissionsMixin):
     email_hash = models.CharField(max_length=64, unique=True)
-    email = EncryptedEmailField(max_length=255, unique=True)
+    email = LazyEncryptedEmailField(max_length=255, unique=True)
     first_name = models.CharField(max_length=30, blank=True)
     last_name = models.CharField(max_length=30, blank=True)
     is_active = models.BooleanField(default=True)
@@ -87,6 +103,14 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
 
     objects = CustomUserManager.from_queryset(CustomUserQuerySet)()
 
+    class Meta:
+        # trigram indexes for search(); created on PostgreSQL only
+        indexes = [
+            GinIndex(OpClass('first_name', name='gin_trgm_ops'), name='customuser_first_name_trgm'),
+            GinIndex(OpClass('last_name', name='gin_trgm_ops'), name='customuser_last_name_trgm'),
+            GinIndex(OpClass(FULL_NAME, name='gin_trgm_ops'), name='customuser_full_name_trgm'),
+        ]
+
     def __str__(self):
         return self.email
     
@@ -1,5 +1,5 @@
 from rest_framework import permissions
-from .models import BlockedUser
+from .blocklist import BlocklistManager
 
 class BaseBlocklistPermission(permissions.BasePermission):
 
@@ -17,7 +17,7 @@ class BaseBlocklistPermission(permissions.BasePermission):
         except ValueError:
             return False
         
-        is_blocked = BlockedUser.objects.filter(user=accessed_user_id, blocked_user=request_user).exists()
+        is_blocked = BlocklistManager.is_blocked_by(request_user.id, accessed_user_id)
 
         return not is_blocked
 
@@ -44,6 +44,11 @@ class RoleBasedPermission(permissions.BasePermission):
         return request_user_role in roles_allowed
 
 
+class AdminRolePermission(permissions.BasePermission):
+    def has_permission(self, request, view):
+        return request.user.is_authenticated and request.user.role == 'admin'
+
+
 def create_blocklist_permissions(get_user_id):
     class BlocklistPermission(BaseBlocklistPermission):
 
@@ -0,0 +1,66 @@
+from django.utils.functional import cached_property
+
+from friend_management.utils import FriendshipManager
+from .blocklist import BlocklistManager
+
+
+def get_request_user(context):
+    """
+    The user a serializer should compute relationships against.
+    """
+    if 'request_user' in context:
+        return context['request_user']
+    return context['request'].user
+
+
+class UserRelationships:
+    """
+    Friend and block status of a page of users relative to the request user.
+
+    Each kind of relationship is resolved for the whole page the first time it is
+    asked for, so a page costs one lookup per kind instead of one per row.
+    """
+
+    def __init__(self, request_user, user_ids):
+        self.request_user = request_user
+        self.user_ids = set(user_ids)
+
+    @cached_property
+    def friend_ids(self):
+        if not self.user_ids:
+            return set()
+        return FriendshipManager.filter_friend_ids(self.request_user.id, self.user_ids)
+
+    @cached_property
+    def blocked_ids(self):
+        if not self.user_ids:
+            return set()
+        return BlocklistManager.filter_blocking_ids(self.request_user.id, self.user_ids)
+
+    async def aload(self, friends=True, blocked=True):
+        """
+        Resolve the kinds asked for up front with the async cache clients, so serializing needs no I/O.
+        """
+        if not self.user_ids:
+            return self
+        if friends:
+            self.friend_ids = await FriendshipManager.afilter_friend_ids(self.request_user.id, self.user_ids)
+        if blocked:
+            self.blocked_ids = await BlocklistManager.afilter_blocking_ids(self.request_user.id, self.user_ids)
+        return self
+
+    def is_friend(self, user):
+        """
+        None if the user is not part of this page.
+        """
+        if user.id not in self.user_ids:
+            return None
+        return user.id in self.friend_ids
+
+    def is_blocked(self, user):
+        """
+        None if the user is not part of this page.
+        """
+        if user.id not in self.user_ids:
+            return None
+        return user.id in self.blocked_ids
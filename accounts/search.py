@@ -0,0 +1,152 @@
+from collections.abc import Sequence
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import LimitOffsetPagination
+
+from friend_management.cache import RecomputeLock, aget_value, aset_value, await_for, wait_for
+
+from .models import CustomUser
+from .utils import consistent_encrypt
+
+
+class UserSearchCache:
+    """
+    Short-lived cache of search result ids, keyed by the normalized query.
+
+    Results do not depend on who is searching, so every user shares them; per-user
+    exclusions are applied by the caller. Only one worker runs a given search at a
+    time (see RecomputeLock): the others wait briefly for its result instead of
+    running the same query.
+
+    Up to SEARCH_MAX_RESULTS + 1 ids are kept, so callers can tell a search that was
+    cut at SEARCH_MAX_RESULTS from one that was not (see truncate()).
+    """
+
+    search_cache_key = "user_search_{query_hash}"
+    search_lock_key = "user_search_lock_{query_hash}"
+
+    @staticmethod
+    def normalize(q):
+        # case is kept: the email path matches the exact address
+        return " ".join(q.split())
+
+    @staticmethod
+    def truncate(user_ids):
+        """
+        The ids to serve and whether more users matched than SEARCH_MAX_RESULTS.
+        """
+        return user_ids[:settings.SEARCH_MAX_RESULTS], len(user_ids) > settings.SEARCH_MAX_RESULTS
+
+    @classmethod
+    def get_ids(cls, q):
+        q = cls.normalize(q)
+        # the query may be an email address, so it is not stored in the key as is
+        query_hash = consistent_encrypt(q)
+        search_cache_key = cls.search_cache_key.format(query_hash=query_hash)
+
+        user_ids = cache.get(search_cache_key)
+        if user_ids is not None:
+            return user_ids
+
+        lock = RecomputeLock(cls.search_lock_key.format(query_hash=query_hash))
+        locked = lock.acquire()
+        if not locked:
+            user_ids = wait_for(lambda: cache.get(search_cache_key))
+            if user_ids is not None:
+                return user_ids
+
+        try:
+            user_ids = list(CustomUser.objects.search(q).values_list('id', flat=True)[:settings.SEARCH_MAX_RESULTS + 1])
+            cache.set(search_cache_key, user_ids, settings.SEARCH_CACHE_TIMEOUT)
+        finally:
+            if locked:
+                lock.release()
+
+        return user_ids
+
+    @classmethod
+    async def aget_ids(cls, q):
+        q = cls.normalize(q)
+        query_hash = consistent_encrypt(q)
+        search_cache_key = cls.search_cache_key.format(query_hash=query_hash)
+
+        user_ids = await aget_value(search_cache_key)
+        if user_ids is not None:
+            return user_ids
+
+        lock = RecomputeLock(cls.search_lock_key.format(query_hash=query_hash))
+        locked = await lock.aacquire()
+        if not locked:
+            user_ids = await await_for(lambda: aget_value(search_cache_key))
+            if user_ids is not None:
+                return user_ids
+
+        try:
+            user_ids = [
+                user_id async for user_id in
+                CustomUser.objects.search(q).values_list('id', flat=True)[:settings.SEARCH_MAX_RESULTS + 1]
+            ]
+            await aset_value(search_cache_key, user_ids, settings.SEARCH_CACHE_TIMEOUT)
+        finally:
+            if locked:
+                await lock.arelease()
+
+        return user_ids
+
+
+def get_search_query(request):
+    """
+    The q parameter of a search request; a blank query would match every user, so it is rejected.
+    """
+    q = UserSearchCache.normalize(request.query_params.get('q', ''))
+    if not q:
+        raise ValidationError({'q': 'This parameter is required'})
+    return q
+
+
+class SearchPagination(LimitOffsetPagination):
+    """
+    LimitOffsetPagination that also reports whether the results were cut at
+    SEARCH_MAX_RESULTS, from the view's `truncated` attribute.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.truncated = getattr(view, 'truncated', False)
+        return super().paginate_queryset(queryset, request, view=view)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        response.data['truncated'] = self.truncated
+        return response
+
+    def get_paginated_response_schema(self, schema):
+        schema = super().get_paginated_response_schema(schema)
+        schema['properties']['truncated'] = {'type': 'boolean'}
+        return schema
+
+
+class LazyUserList(Sequence):
+    """
+    An ordered list of user ids that only loads the users of the slice being read,
+    so paginating it costs one primary key query per page and no COUNT(*).
+    """
+
+    def __init__(self, user_ids, queryset=None):
+        self.user_ids = list(user_ids)
+        self.queryset = queryset if queryset is not None else CustomUser.objects.all()
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self.queryset.get(id=self.user_ids[index])
+
+        user_ids = self.user_ids[index]
+        users = self.queryset.in_bulk(user_ids)
+        return [users[user_id] for user_id in user_ids if user_id in users]
+
+    def only(self, *fields):
+        return LazyUserList(self.user_ids, self.queryset.only(*fields))
@@ -1,23 +1,58 @@
 # serializers.py
+from django.db import models
 from rest_framework import serializers
 from .models import CustomUser, BlockedUser
+from .blocklist import BlocklistManager
+from .relationships import UserRelationships, get_request_user
 
 from friend_management.utils import FriendshipManager
+from social_network.fieldsets import SparseFieldsetMixin
 
-class UserSerializer(serializers.ModelSerializer):
+
+def create_relationship_list_serializer(user_field=None):
+    """
+    List serializer that resolves is_friend / is_blocked for every user on the page at once.
+    user_field names the nested user on each item, or None when the items are users.
+    A UserRelationships already in the context (e.g. loaded by an async view) is used as is.
+    """
+    class RelationshipListSerializer(serializers.ListSerializer):
+
+        def to_representation(self, data):
+            items = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+            if 'relationships' not in self.context:
+                user_ids = [getattr(item, f"{user_field}_id") if user_field else item.id for item in items]
+                self.context['relationships'] = UserRelationships(get_request_user(self.context), user_ids)
+            return super().to_representation(items)
+
+    return RelationshipListSerializer
+
+
+class UserSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     is_blocked = serializers.SerializerMethodField()
     is_friend = serializers.SerializerMethodField()
 
     class Meta:
         model = CustomUser
         fields = ('id', 'email', 'is_active', 'is_staff', 'first_name', 'last_name', 'is_blocked', 'is_friend')
+        list_serializer_class = create_relationship_list_serializer()
+        source_columns = {'is_staff': ('role',)}
     
     def get_is_blocked(self, obj):
-        request_user = self.context['request_user']
-        return BlockedUser.objects.filter(user=request_user, blocked_user=obj).exists()
+        relationships = self.context.get('relationships')
+        is_blocked = relationships.is_blocked(obj) if relationships else None
+        if is_blocked is not None:
+            return is_blocked
+
+        request_user = get_request_user(self.context)
+        return obj.id in BlocklistManager.filter_blocking_ids(request_user.id, [obj.id])
     
     def get_is_friend(self, obj):
-        request_user = self.context['request_user']
+        relationships = self.context.get('relationships')
+        is_friend = relationships.is_friend(obj) if relationships else None
+        if is_friend is not None:
+            return is_friend
+
+        request_user = get_request_user(self.context)
         return FriendshipManager.are_friends(request_user, obj)
 
 
@@ -57,12 +92,13 @@ class UserLoginSerializer(serializers.Serializer):
     password = serializers.CharField()
 
 
-class BlockedUserListSerializer(serializers.ModelSerializer):
+class BlockedUserListSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     blocked_user = UserSerializer()
     
     class Meta:
         model = BlockedUser
         fields = '__all__'
+        list_serializer_class = create_relationship_list_serializer('blocked_user')
     
     def get_serializer_context(self):
         return {'request_user': self.context['request_user']}
@@ -87,8 +123,8 @@ class BlockedUserCreateSerializer(serializers.Serializer):
         raise serializers.ValidationError('Invalid user id')
     
     def create(self, validated_data):
-        user = CustomUser.objects.get(id=validated_data['user_id'])
-        blocked_user = CustomUser.objects.get(id=validated_data['blocked_user_id'])
-        BlockedUser.objects.create(user=user, blocked_user=blocked_user)
-        return user
+        return BlocklistManager.block(validated_data['user_id'], validated_data['blocked_user'])
+
+    def to_representation(self, instance):
+        return {'blocked_user': instance.blocked_user_id}
         
@@ -0,0 +1,467 @@
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.tokens import AccessToken
+
+from friend_management.cache import RecomputeLock, get_redis_client
+from friend_management.utils import FriendshipManager
+from logging_management.models import Log
+from social_network.testing import BaseTestCase, RedisTestCase
+
+from . import fields
+from .authentication import ClaimsRefreshToken, ClaimsUser, RequestCachedJWTAuthentication
+from .blocklist import BlockedByCache, BlockedUsersFilter, BlockingCache, BlocklistManager, BloomFilter
+from .models import BlockedUser, CustomUser
+from .search import UserSearchCache
+from .utils import consistent_encrypt
+from .serializers import UserSerializer
+
+
+class UserRelationshipsTests(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.alice = self.create_user('alice@example.com')
+        self.others = [self.create_user(f'user{index}@example.com') for index in range(6)]
+        FriendshipManager.add_friend(self.alice, self.others[0])
+        FriendshipManager.add_friend(self.alice, self.others[3])
+        BlocklistManager.block(self.alice.id, self.others[1].id)
+
+    def serialize(self, users):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            data = UserSerializer(users, many=True, context={'request_user': self.alice}).data
+        return data, len(queries)
+
+    def test_relationships_are_resolved_for_the_whole_page(self):
+        data, _ = self.serialize(self.others)
+
+        self.assertEqual([row['is_friend'] for row in data], [True, False, False, True, False, False])
+        self.assertEqual([row['is_blocked'] for row in data], [False, True, False, False, False, False])
+
+    def test_queries_do_not_grow_with_the_page(self):
+        _, small_page_queries = self.serialize(self.others[:2])
+        _, large_page_queries = self.serialize(self.others)
+
+        self.assertEqual(small_page_queries, large_page_queries)
+
+    def test_a_single_user_is_looked_up_on_its_own(self):
+        data = UserSerializer(self.others[1], context={'request_user': self.alice}).data
+
+        self.assertEqual((data['is_friend'], data['is_blocked']), (False, True))
+
+
+class LazyEmailDecryptionTests(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.alice = self.create_user('alice@example.com')
+        fields.decrypt.cache_clear()
+        decrypt_str = mock.patch('accounts.fields.decrypt_str', wraps=fields.decrypt_str)
+        self.decrypt_str = decrypt_str.start()
+        self.addCleanup(decrypt_str.stop)
+
+    def get_ciphertext(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT email FROM accounts_customuser WHERE id = %s", [self.alice.id])
+            return cursor.fetchone()[0]
+
+    def test_emails_are_decrypted_on_first_read_through_the_cache(self):
+        users = [CustomUser.objects.get(id=self.alice.id) for _ in range(2)]
+        self.decrypt_str.assert_not_called()
+
+        self.assertEqual([user.email for user in users], ['alice@example.com'] * 2)
+        self.assertEqual(self.decrypt_str.call_count, 1)
+
+    def test_values_decrypt_when_used(self):
+        email = CustomUser.objects.filter(id=self.alice.id).values_list('email', flat=True).get()
+        self.decrypt_str.assert_not_called()
+
+        self.assertEqual(email, 'alice@example.com')
+        self.assertEqual(str(email), 'alice@example.com')
+
+    def test_saving_an_unchanged_email_keeps_its_ciphertext(self):
+        ciphertext = self.get_ciphertext()
+
+        user = CustomUser.objects.get(id=self.alice.id)
+        user.save()
+        self.assertEqual(self.get_ciphertext(), ciphertext)
+        user.email
+        user.save()
+        self.assertEqual(self.get_ciphertext(), ciphertext)
+
+        user.email = 'alice@example.org'
+        user.save()
+        self.assertNotEqual(self.get_ciphertext(), ciphertext)
+        self.assertEqual(CustomUser.objects.get(id=self.alice.id).email, 'alice@example.org')
+
+    def test_friend_requests_defer_the_sender_email(self):
+        FriendshipManager.send_friend_request(self.create_user('bob@example.com'), self.alice)
+
+        friend_request = FriendshipManager.get_friend_requests(self.alice, 'created_at').get()
+        self.assertIn('email', friend_request.from_user.get_deferred_fields())
+
+
+class SparseFieldsetTests(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.alice = self.create_user('alice@example.com')
+        self.bob = self.create_user('bob@example.com', last_name='Smith')
+        self.client = self.get_client(self.alice)
+
+    def get(self, path, **params):
+        """
+        The results and the SQL of the request, less the authentication query.
+        """
+        self.client.get(path, params)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results'], ' '.join(query['sql'] for query in queries[1:])
+
+    def test_search_renders_and_loads_only_the_fields_asked_for(self):
+        with mock.patch.object(FriendshipManager, 'filter_friend_ids') as filter_friend_ids, \
+                mock.patch.object(BlocklistManager, 'filter_blocking_ids') as filter_blocking_ids:
+            results, sql = self.get('/search/', q='bob', fields='id,first_name')
+
+        self.assertEqual(results, [{'id': self.bob.id, 'first_name': 'bob'}])
+        self.assertIn('SELECT "accounts_customuser"."id", "accounts_customuser"."first_name" FROM', sql)
+        self.assertNotIn('"accounts_customuser"."email"', sql)
+        # no friend or block status to render
+        filter_friend_ids.assert_not_called()
+        filter_blocking_ids.assert_not_called()
+
+    def test_exclude_drops_fields(self):
+        results, _ = self.get('/search/', q='bob', exclude='email,is_friend,is_blocked')
+
+        self.assertEqual(set(results[0]), {'id', 'is_active', 'is_staff', 'first_name', 'last_name'})
+
+    def test_nested_fields(self):
+        FriendshipManager.send_friend_request(self.bob, self.alice)
+
+        results, sql = self.get('/friend_requests/', fields='id,from_user,to_user.id')
+
+        self.assertEqual(results, [{'id': results[0]['id'], 'from_user': self.bob.id, 'to_user': {'id': self.alice.id}}])
+        self.assertNotIn('"email"', sql)
+
+    def test_blocked_users(self):
+        BlocklistManager.block(self.alice.id, self.bob.id)
+
+        results, _ = self.get('/blocked_users/', fields='blocked_user.last_name,blocked_user.is_blocked')
+
+        self.assertEqual(results, [{'blocked_user': {'last_name': 'Smith', 'is_blocked': True}}])
+
+    def test_without_a_fieldset_everything_is_rendered(self):
+        results, _ = self.get('/search/', q='bob')
+
+        self.assertEqual(set(results[0]), set(UserSerializer.Meta.fields))
+
+
+class RequestAuthenticationTests(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.alice = self.create_user('alice@example.com')
+
+    def user_queries(self, queries):
+        return [query for query in queries if 'FROM "accounts_customuser"' in query['sql']]
+
+    def test_the_token_is_authenticated_once_per_request(self):
+        client = self.get_client(self.alice)
+        with mock.patch.object(RequestCachedJWTAuthentication, 'get_validated_token',
+                               wraps=RequestCachedJWTAuthentication().get_validated_token) as get_validated_token, \
+                CaptureQueriesContext(connection) as queries:
+            response = client.get('/friend_requests/')
+
+        self.assertEqual(response.status_code, 200)
+        get_validated_token.assert_called_once()
+        self.assertEqual(len(self.user_queries(queries)), 1)
+        self.assertEqual(Log.objects.get().user_id, self.alice.id)
+
+    def test_an_invalid_token_fails_once_and_is_logged_without_a_user(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION="Bearer not-a-token")
+        with mock.patch.object(RequestCachedJWTAuthentication, 'get_validated_token',
+                               side_effect=InvalidToken()) as get_validated_token:
+            response = client.get('/friend_requests/')
+
+        self.assertEqual(response.status_code, 401)
+        get_validated_token.assert_called_once()
+        self.assertIsNone(Log.objects.get().user_id)
+
+
+@override_settings(JWT_CLAIMS_USER=True)
+class ClaimsUserTests(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.alice = self.create_user('alice@example.com', role='read')
+
+    def test_login_issues_the_claims(self):
+        response = self.get_client().post('/login/', {'email': 'alice@example.com', 'password': 'password'})
+
+        token = AccessToken(response.json()['access'])
+        self.assertEqual((token['role'], token['is_active']), ('read', True))
+
+    def test_read_only_endpoints_need_no_user_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get_client(self.alice).get('/friend_requests/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([query for query in queries if 'FROM "accounts_customuser"' in query['sql']])
+
+    def test_permissions_use_the_role_claim(self):
+        response = self.get_client(self.alice).post('/block_user/', {'blocked_user': self.alice.id})
+
+        self.assertEqual(response.status_code, 403)
+
+    def test_inactive_claim_is_rejected(self):
+        client = self.get_client(self.alice)
+        self.alice.is_active = False
+        self.assertEqual(self.get_client(self.alice).get('/friend_requests/').status_code, 401)
+        # the claims of tokens issued earlier apply until they expire
+        self.assertEqual(client.get('/friend_requests/').status_code, 200)
+
+    def test_other_attributes_load_the_user_once(self):
+        user = RequestCachedJWTAuthentication().get_user(self.get_token(self.alice))
+        self.assertIsInstance(user, ClaimsUser)
+
+        with self.assertNumQueries(1):
+            self.assertEqual((user.email, user.first_name), ('alice@example.com', 'alice'))
+        self.assertEqual(user, self.alice)
+
+    def test_tokens_without_claims_load_the_user(self):
+        token = self.get_token(self.alice)
+        del token['role']
+
+        with self.assertNumQueries(1):
+            user = RequestCachedJWTAuthentication().get_user(token)
+        self.assertNotIsInstance(user, ClaimsUser)
+        self.assertEqual(user, self.alice)
+
+    @staticmethod
+    def get_token(user):
+        return AccessToken(str(ClaimsRefreshToken.for_user(user).access_token))
+
+
+class BlocklistTests(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.alice, self.bob, self.carol = (
+            self.create_user(f'{name}@example.com') for name in ('alice', 'bob', 'carol')
+        )
+
+    def test_block_updates_both_sides(self):
+        self.assertEqual(BlocklistManager.get_blocked_by_ids(self.bob.id), set())
+        self.assertEqual(BlocklistManager.get_blocking_ids(self.alice.id), set())
+
+        BlocklistManager.block(self.alice.id, self.bob.id)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(BlocklistManager.get_blocked_by_ids(self.bob.id), {self.alice.id})
+            self.assertEqual(BlocklistManager.get_blocking_ids(self.alice.id), {self.bob.id})
+            self.assertEqual(BlocklistManager.filter_blocking_ids(self.alice.id, [self.bob.id, self.carol.id]), {self.bob.id})
+        self.assertTrue(BlocklistManager.is_blocked_by(self.bob.id, self.alice.id))
+        self.assertFalse(BlocklistManager.is_blocked_by(self.alice.id, self.bob.id))
+        self.assertEqual(async_to_sync(BlocklistManager.aget_blocked_by_ids)(self.bob.id), {self.alice.id})
+        self.assertEqual(async_to_sync(BlocklistManager.afilter_blocking_ids)(self.alice.id, [self.bob.id]), {self.bob.id})
+
+    def test_unblock_updates_both_sides(self):
+        BlocklistManager.block(self.alice.id, self.bob.id)
+        BlocklistManager.get_blocked_by_ids(self.bob.id)
+
+        BlocklistManager.unblock(BlockedUser.objects.get())
+
+        self.assertEqual(BlocklistManager.get_blocked_by_ids(self.bob.id), set())
+        self.assertEqual(BlocklistManager.get_blocking_ids(self.alice.id), set())
+        self.assertFalse(BlocklistManager.is_blocked_by(self.bob.id, self.alice.id))
+
+    def test_block_view_rejects_invalid_blocks(self):
+        client = self.get_client(self.alice)
+        BlocklistManager.block(self.alice.id, self.bob.id)
+
+        for blocked_user, error in ((self.alice.id, 'You cannot block yourself'),
+                                    (self.bob.id, 'User is already blocked'),
+                                    (999, 'Invalid user id')):
+            response = client.post('/block_user/', {'blocked_user': blocked_user})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()['non_field_errors'], [error])
+
+        response = client.post('/block_user/', {'blocked_user': self.carol.id})
+        self.assertEqual((response.status_code, response.json()), (201, {'blocked_user': self.carol.id}))
+        self.assertTrue(BlocklistManager.is_blocked_by(self.carol.id, self.alice.id))
+
+    def test_unblock_view_needs_the_admin_role(self):
+        BlocklistManager.block(self.alice.id, self.bob.id)
+
+        self.assertEqual(self.get_client(self.alice).delete(f'/unblock_user/{self.bob.id}/').status_code, 403)
+
+        self.alice.role = 'admin'
+        self.alice.save()
+        self.assertEqual(self.get_client(self.alice).delete(f'/unblock_user/{self.bob.id}/').status_code, 204)
+        self.assertFalse(BlockedUser.objects.exists())
+        self.assertEqual(BlocklistManager.get_blocked_by_ids(self.bob.id), set())
+
+
+@override_settings(BLOCKLIST_BLOOM=dict(settings.BLOCKLIST_BLOOM, ENABLED=True))
+class BlockedUsersFilterTests(RedisTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.alice, self.bob, self.carol = (
+            self.create_user(f'{name}@example.com') for name in ('alice', 'bob', 'carol')
+        )
+
+        # a fresh filter per test, without the listener thread
+        self.filter = BlockedUsersFilter()
+        for patcher in (
+            mock.patch('accounts.blocklist.blocked_users_filter', self.filter),
+            mock.patch.object(BlockedUsersFilter, '_start_listener'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(100, 0.01)
+        for item in range(100):
+            bloom.add(item)
+
+        self.assertTrue(all(item in bloom for item in range(100)))
+        self.assertLess(sum(item in bloom for item in range(100, 10100)), 300)
+
+    def test_users_nobody_blocked_skip_the_cache(self):
+        BlocklistManager.block(self.alice.id, self.bob.id)
+        self.filter.rebuild()
+
+        with mock.patch.object(BlockedByCache, 'get_or_load') as get_or_load:
+            self.assertEqual(BlocklistManager.get_blocked_by_ids(self.carol.id), set())
+            self.assertFalse(BlocklistManager.is_blocked_by(self.carol.id, self.alice.id))
+        get_or_load.assert_not_called()
+
+        self.assertEqual(BlocklistManager.get_blocked_by_ids(self.bob.id), {self.alice.id})
+
+    def test_the_filter_is_built_off_the_request(self):
+        BlocklistManager.block(self.alice.id, self.bob.id)
+
+        with mock.patch.object(BlockedUsersFilter, '_rebuild_in_background') as rebuild:
+            # every user might be blocked until the filter is built
+            self.assertTrue(self.filter.might_be_blocked(self.carol.id))
+            self.assertEqual(BlocklistManager.get_blocked_by_ids(self.bob.id), {self.alice.id})
+        rebuild.assert_called()
+
+    def test_blocks_are_published_to_the_other_workers(self):
+        self.filter.rebuild()
+        pubsub = get_redis_client().pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(BlockedUsersFilter.channel())
+        self.addCleanup(pubsub.close)
+
+        BlocklistManager.block(self.alice.id, self.carol.id)
+
+        self.assertTrue(BlocklistManager.is_blocked_by(self.carol.id, self.alice.id))
+        pubsub.get_message(timeout=1)  # the subscription
+        message = pubsub.get_message(timeout=1)
+        self.assertEqual(int(message['data']), self.carol.id)
+
+    def test_blocks_received_during_a_rebuild_are_kept(self):
+        def bloom_filter(*args):
+            # published by another worker after the scan started
+            self.filter._add(self.carol.id)
+            return BloomFilter(*args)
+
+        with mock.patch('accounts.blocklist.BloomFilter', bloom_filter):
+            self.assertTrue(self.filter.rebuild())
+        self.assertTrue(self.filter.might_be_blocked(self.carol.id))
+
+    def test_a_rebuild_across_a_resubscription_is_dropped(self):
+        def bloom_filter(*args):
+            self.filter._generation += 1
+            return BloomFilter(*args)
+
+        with mock.patch('accounts.blocklist.BloomFilter', bloom_filter):
+            self.assertFalse(self.filter.rebuild())
+        self.assertIsNone(self.filter._filter)
+
+
+class RedisBlocklistTests(RedisTestCase, BlocklistTests):
+
+    def test_blocklists_are_cached_as_redis_sets(self):
+        BlocklistManager.get_blocking_ids(self.alice.id)
+        BlocklistManager.get_blocked_by_ids(self.bob.id)
+        BlocklistManager.block(self.alice.id, self.bob.id)
+
+        # the loaded sets are updated in place, other users' sets are not created
+        self.assertEqual(BlockingCache.contains_many(self.alice.id, [self.bob.id, self.carol.id]), {self.bob.id})
+        self.assertTrue(BlockedByCache.contains(self.bob.id, self.alice.id))
+        self.assertIsNone(BlockedByCache.contains(self.carol.id, self.alice.id))
+
+
+class UserSearchTests(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.alice = self.create_user('alice@example.com', first_name='Alice', last_name='Smith')
+        self.alicia = self.create_user('alicia@example.com', first_name='Alicia', last_name='Jones')
+        self.bob = self.create_user('bob@example.com', first_name='Bob', last_name='Alison')
+
+    def test_search_by_name_or_exact_email(self):
+        self.assertEqual(UserSearchCache.get_ids('ali'), [self.alice.id, self.alicia.id, self.bob.id])
+        self.assertEqual(UserSearchCache.get_ids('  bob@example.com '), [self.bob.id])
+        self.assertEqual(async_to_sync(UserSearchCache.aget_ids)('alicia'), [self.alicia.id])
+
+    def test_results_are_cached(self):
+        UserSearchCache.get_ids('ali')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(UserSearchCache.get_ids('ali'), [self.alice.id, self.alicia.id, self.bob.id])
+
+    def test_search_view_hides_the_user_and_who_blocked_them(self):
+        BlocklistManager.block(self.alicia.id, self.alice.id)
+
+        response = self.get_client(self.alice).get('/search/', {'q': 'ali'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([user['id'] for user in response.json()['results']], [self.bob.id])
+
+    def test_blank_searches_are_rejected(self):
+        self.assertEqual(self.get_client(self.alice).get('/search/', {'q': '  '}).status_code, 400)
+        self.assertEqual(self.get_client(self.alice).get('/search/').status_code, 400)
+        self.assertFalse(CustomUser.objects.search(' ').exists())
+
+    @override_settings(SEARCH_MAX_RESULTS=2)
+    def test_the_response_says_when_results_were_cut(self):
+        self.assertEqual(UserSearchCache.get_ids('ali'), [self.alice.id, self.alicia.id, self.bob.id])
+
+        response = self.get_client(self.bob).get('/search/', {'q': 'ali'})
+        self.assertEqual([user['id'] for user in response.json()['results']], [self.alice.id, self.alicia.id])
+        self.assertTrue(response.json()['truncated'])
+
+        response = self.get_client(self.bob).get('/search/', {'q': 'alicia'})
+        self.assertEqual([user['id'] for user in response.json()['results']], [self.alicia.id])
+        self.assertFalse(response.json()['truncated'])
+
+    @override_settings(CACHE_RECOMPUTE=dict(settings.CACHE_RECOMPUTE, WAIT_TIMEOUT=0.1, WAIT_INTERVAL=0.01))
+    def test_a_search_waits_for_the_lock_holder_then_runs_itself(self):
+        lock_key = UserSearchCache.search_lock_key.format(query_hash=consistent_encrypt('ali'))
+        holder = RecomputeLock(lock_key)
+        self.assertTrue(holder.acquire())
+
+        self.assertEqual(UserSearchCache.get_ids('ali'), [self.alice.id, self.alicia.id, self.bob.id])
+        self.assertEqual(async_to_sync(UserSearchCache.aget_ids)('bob'), [self.bob.id])
+
+        # the holder's lock is left alone
+        self.assertFalse(RecomputeLock(lock_key).acquire())
+        holder.release()
+        self.assertTrue(RecomputeLock(lock_key).acquire())
+
+
+class RedisUserSearchTests(RedisTestCase, UserSearchTests):
+    pass
@@ -1,11 +1,14 @@
 # views.py
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
-from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate
 from .models import CustomUser, BlockedUser
 from .serializers import UserSerializer, UserLoginSerializer, UserSignupSerializer, BlockedUserListSerializer, BlockedUserCreateSerializer, MyselfSerializer
+from .authentication import ClaimsRefreshToken
+from .blocklist import BlocklistManager
 from .permissions import RoleBasedPermission
+from .search import LazyUserList, SearchPagination, UserSearchCache, get_search_query
+from social_network.fieldsets import SparseFieldsetViewMixin
 
 
 class UserRegisterView(generics.CreateAPIView):
@@ -38,7 +41,7 @@ class UserLoginView(generics.GenericAPIView):
         user = authenticate(email=email, password=password)
 
         if user is not None:
-            refresh = RefreshToken.for_user(user)
+            refresh = ClaimsRefreshToken.for_user(user)
             return Response({
                 'refresh': str(refresh),
                 'access': str(refresh.access_token),
@@ -48,33 +51,35 @@ class UserLoginView(generics.GenericAPIView):
         return Response({'error': 'Invalid credentials'}, status=status.HTTP_401_UNAUTHORIZED)
 
 
-class UserSearchView(generics.ListAPIView):
+class UserSearchView(SparseFieldsetViewMixin, generics.ListAPIView):
     queryset = CustomUser.objects.all()
     serializer_class = UserSerializer
     permission_classes = (permissions.IsAuthenticated, RoleBasedPermission)
 
+    pagination_class = SearchPagination
     throttle_scope = 'search'
 
     def get_queryset(self):
         request_user = self.request.user
-        queryset = super().get_queryset().exclude(
-            id=request_user.id
-        ).exclude(
-            id__in=request_user.blocked_by.all().values_list('user_id', flat=True)
-        ).search(self.request.query_params.get('q', ''))
-        return queryset
+        user_ids, self.truncated = UserSearchCache.truncate(UserSearchCache.get_ids(get_search_query(self.request)))
+
+        excluded_ids = BlocklistManager.get_blocked_by_ids(request_user.id) | {request_user.id}
+
+        return LazyUserList([user_id for user_id in user_ids if user_id not in excluded_ids], super().get_queryset())
     
     def get_serializer_context(self):
-        return {'request_user': self.request.user}
+        context = super().get_serializer_context()
+        context['request_user'] = self.request.user
+        return context
 
 
-class BlockedUserListView(generics.ListAPIView):
+class BlockedUserListView(SparseFieldsetViewMixin, generics.ListAPIView):
     queryset = BlockedUser.objects.all()
     serializer_class = BlockedUserListSerializer
     permission_classes = (permissions.IsAuthenticated, RoleBasedPermission)
 
     def get_queryset(self):
-        return self.queryset.filter(user=self.request.user)
+        return self.queryset.filter(user_id=self.request.user.id).select_related('blocked_user')
 
 
 class BlockedUserCreateView(generics.CreateAPIView):
@@ -91,4 +96,7 @@ class UnblockedUserView(generics.DestroyAPIView):
     permission_classes = (permissions.IsAuthenticated, RoleBasedPermission)
 
     def get_object(self):
-        return self.queryset.get(user=self.request.user, blocked_user_id=self.kwargs['blocked_user_id'])
+        return self.queryset.get(user_id=self.request.user.id, blocked_user_id=self.kwargs['blocked_user_id'])
+
+    def perform_destroy(self, instance):
+        BlocklistManager.unblock(instance)
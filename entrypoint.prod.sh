@@ -12,4 +12,11 @@ then
     echo "PostgreSQL started"
 fi
 
+if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]
+then
+    # metric files of the previous run would otherwise be added to this one's
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+
 exec "$@"
\ No newline at end of file
@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from .models import FriendRequest, Friend
+from .models import FriendRequest, Friend, FriendshipChange
 
 admin.site.register(FriendRequest)
-admin.site.register(Friend)
\ No newline at end of file
+admin.site.register(Friend)
+admin.site.register(FriendshipChange)
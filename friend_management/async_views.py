@@ -0,0 +1,46 @@
+from rest_framework import permissions
+from rest_framework.exceptions import ValidationError
+
+from accounts.permissions import RoleBasedPermission
+from accounts.serializers import UserSerializer
+from friend_management.serializers import FriendRequestSerializer
+from friend_management.utils import FriendshipManager
+from social_network.async_views import AsyncListAPIView
+from social_network.conditional import AsyncVersionedResponseMixin
+from social_network.pagination import KeysetPagination
+
+
+class AsyncFriendListView(AsyncVersionedResponseMixin, AsyncListAPIView):
+    serializer_class = UserSerializer
+    permission_classes = (permissions.IsAuthenticated, RoleBasedPermission)
+    pagination_class = KeysetPagination
+    keyset_ordering = ('id',)
+    cache_type = "friends"
+
+    async def aget_queryset(self):
+        return await FriendshipManager.aget_friends(self.request.user)
+
+
+class AsyncFriendRequestListView(AsyncVersionedResponseMixin, AsyncListAPIView):
+    serializer_class = FriendRequestSerializer
+    permission_classes = (permissions.IsAuthenticated, RoleBasedPermission)
+    pagination_class = KeysetPagination
+    relationship_user_field = 'to_user'
+    cache_type = "friend_requests"
+
+    VALID_SORT_FIELDS = list(FriendshipManager.friend_request_orderings)
+
+    def get_sort(self):
+        if 'sort' in self.request.query_params:
+            sort = self.request.query_params['sort']
+            if sort not in self.VALID_SORT_FIELDS:
+                raise ValidationError({'sort': 'Invalid sort field'})
+        else:
+            sort = 'created_at'
+        return sort
+
+    def get_keyset_ordering(self):
+        return FriendshipManager.friend_request_orderings[self.get_sort()]
+
+    async def aget_queryset(self):
+        return FriendshipManager.get_friend_requests(self.request.user, self.get_sort())
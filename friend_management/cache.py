@@ -0,0 +1,1076 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from django_redis import get_redis_connection
+from redis import asyncio as redis_asyncio
+
+from logging_management.metrics import CacheLookup
+
+logger = logging.getLogger(__name__)
+
+
+def get_redis_client():
+    """
+    Raw Redis client behind the default cache, or None when the cache backend is not Redis.
+    """
+    try:
+        return get_redis_connection("default")
+    except NotImplementedError:
+        return None
+
+
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_redis_client():
+    """
+    redis.asyncio client for the default cache's server, one per event loop, or None when
+    the cache backend is not Redis. Must be called from a running event loop.
+    """
+    if get_redis_client() is None:
+        return None
+
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = redis_asyncio.Redis(
+            connection_pool=redis_asyncio.ConnectionPool(**get_redis_client().connection_pool.connection_kwargs)
+        )
+    return client
+
+
+async def aget_value(key):
+    """
+    Async cache.get(key) for values written through the Django cache.
+    """
+    client = get_async_redis_client()
+    if client is None:
+        return await cache.aget(key)
+
+    value = await client.get(cache.make_key(key))
+    return None if value is None else cache.client.decode(value)
+
+
+async def aset_value(key, value, timeout):
+    client = get_async_redis_client()
+    if client is None:
+        await cache.aset(key, value, timeout)
+        return
+
+    await client.set(cache.make_key(key), cache.client.encode(value), ex=timeout)
+
+
+class RecomputeLock:
+    """
+    Short lock (SET NX PX) letting a single request rebuild a cached value while the others
+    serve the value they have or wait for the new one. It expires after
+    CACHE_RECOMPUTE['LOCK_TIMEOUT'] seconds in case its holder dies.
+    """
+
+    RELEASE_SCRIPT = """
+        if redis.call('get', KEYS[1]) == ARGV[1] then
+            return redis.call('del', KEYS[1])
+        end
+        return 0
+    """
+
+    def __init__(self, key, token=None):
+        self.key = key
+        self.token = token or uuid.uuid4().hex
+
+    @property
+    def timeout(self):
+        return settings.CACHE_RECOMPUTE['LOCK_TIMEOUT']
+
+    def acquire(self):
+        client = get_redis_client()
+        if client is None:
+            return cache.add(self.key, self.token, self.timeout)
+        return bool(client.set(cache.make_key(self.key), self.token, px=int(self.timeout * 1000), nx=True))
+
+    def release(self):
+        client = get_redis_client()
+        if client is None:
+            if cache.get(self.key) == self.token:
+                cache.delete(self.key)
+            return
+        client.register_script(self.RELEASE_SCRIPT)(keys=[cache.make_key(self.key)], args=[self.token])
+
+    async def aacquire(self):
+        client = get_async_redis_client()
+        if client is None:
+            return await cache.aadd(self.key, self.token, self.timeout)
+        return bool(await client.set(cache.make_key(self.key), self.token, px=int(self.timeout * 1000), nx=True))
+
+    async def arelease(self):
+        client = get_async_redis_client()
+        if client is None:
+            if await cache.aget(self.key) == self.token:
+                await cache.adelete(self.key)
+            return
+        await client.register_script(self.RELEASE_SCRIPT)(keys=[cache.make_key(self.key)], args=[self.token])
+
+
+def refresh_early(ttl, delta):
+    """
+    Whether to rebuild a cached value before it expires (XFetch): the closer its expiry (ttl
+    seconds left) and the longer it takes to rebuild (delta seconds), the likelier. Spreads
+    the rebuilds of values cached at the same time instead of missing them all at once.
+    """
+    beta = settings.CACHE_RECOMPUTE['EARLY_REFRESH_BETA']
+    if not beta or ttl is None or ttl < 0 or delta is None:
+        return False
+    return delta * beta * -math.log(1 - random.random()) >= ttl
+
+
+def wait_for(read):
+    """
+    Poll read() until it returns a value or CACHE_RECOMPUTE['WAIT_TIMEOUT'] seconds pass.
+    """
+    deadline = time.monotonic() + settings.CACHE_RECOMPUTE['WAIT_TIMEOUT']
+    while time.monotonic() < deadline:
+        time.sleep(settings.CACHE_RECOMPUTE['WAIT_INTERVAL'])
+        value = read()
+        if value is not None:
+            return value
+    return None
+
+
+async def await_for(read):
+    deadline = time.monotonic() + settings.CACHE_RECOMPUTE['WAIT_TIMEOUT']
+    while time.monotonic() < deadline:
+        await asyncio.sleep(settings.CACHE_RECOMPUTE['WAIT_INTERVAL'])
+        value = await read()
+        if value is not None:
+            return value
+    return None
+
+
+class LocalCache:
+    """
+    Optional in-process LRU cache (LOCAL_CACHE) in front of Redis for hot per-user values,
+    so a worker serving the same users over and over stops fetching them from Redis.
+
+    Writers call invalidate() with the keys they changed; it drops them here and publishes
+    them on a Redis channel, and a listener thread in every other worker drops them too.
+    Entries also expire after TIMEOUT seconds, which bounds staleness when a message is
+    missed (the listener clears everything when it reconnects).
+
+    Values are only stored if none of their keys was invalidated since the reader fetched
+    them (see epoch()), so a slow reader cannot put back a value a writer just replaced.
+    Only used with the Redis cache backend; other backends are per-process already.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._invalidated = OrderedDict()  # key -> epoch of its last invalidation, most recent last
+        self._epoch = 0
+        self._forgotten_epoch = 0  # latest epoch no longer in _invalidated
+        self._lock = threading.Lock()
+        self._listener_pid = None
+
+    @property
+    def enabled(self):
+        return settings.LOCAL_CACHE['ENABLED'] and get_redis_client() is not None
+
+    @staticmethod
+    def channel():
+        return cache.make_key(settings.LOCAL_CACHE['CHANNEL'])
+
+    def epoch(self):
+        """
+        Read before fetching a value from the shared cache and pass to set().
+        """
+        return self._epoch
+
+    def get(self, family, key):
+        """
+        The value stored for key, or None.
+        """
+        if not self.enabled:
+            return None
+        self._start_listener()
+
+        with CacheLookup(family, "local") as lookup:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] <= time.monotonic():
+                    del self._entries[key]
+                    entry = None
+                elif entry is not None:
+                    self._entries.move_to_end(key)
+            lookup.hit = entry is not None
+        return None if entry is None else entry[1]
+
+    def set(self, key, value, epoch):
+        if not self.enabled:
+            return
+
+        with self._lock:
+            if self._forgotten_epoch > epoch or self._invalidated.get(key, 0) > epoch:
+                return
+
+            self._entries[key] = (time.monotonic() + settings.LOCAL_CACHE['TIMEOUT'], value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.LOCAL_CACHE['MAX_ENTRIES']:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, keys):
+        """
+        Drop the keys in this process and publish them to the other workers.
+        """
+        keys = list(keys)
+        if not keys or not self.enabled:
+            return
+
+        self.discard(keys)
+        get_redis_client().publish(self.channel(), json.dumps(keys))
+
+    def discard(self, keys):
+        with self._lock:
+            self._epoch += 1
+            for key in keys:
+                self._entries.pop(key, None)
+                self._invalidated.pop(key, None)
+                self._invalidated[key] = self._epoch
+            while len(self._invalidated) > settings.LOCAL_CACHE['MAX_ENTRIES']:
+                self._forgotten_epoch = self._invalidated.popitem(last=False)[1]
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+            self._invalidated.clear()
+            self._forgotten_epoch = self._epoch
+
+    def _start_listener(self):
+        # started lazily and again after a fork, as threads do not survive it
+        if self._listener_pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._listener_pid == os.getpid():
+                return
+            self._listener_pid = os.getpid()
+            self._entries.clear()
+
+        ready = threading.Event()
+        threading.Thread(target=self._listen, args=(ready,), name="local-cache-invalidation", daemon=True).start()
+        # the first values may only be cached once invalidations are being received
+        ready.wait(timeout=1)
+
+    def _listen(self, ready):
+        while True:
+            try:
+                pubsub = get_redis_client().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel())
+                # anything published while not subscribed was missed
+                self.clear()
+                ready.set()
+                for message in pubsub.listen():
+                    if message['type'] == 'message':
+                        self.discard(json.loads(message['data']))
+            except Exception:
+                logger.exception("Local cache invalidation listener failed, reconnecting")
+                time.sleep(1)
+
+
+local_cache = LocalCache()
+
+
+class IdSetCache:
+    """
+    A cached set of user ids per user, kept as a native Redis set and updated in place.
+
+    Redis does not keep empty sets, so every loaded set also holds the LOADED member,
+    which lets a single call tell "not cached" apart from "cached but empty".
+    Each user also has a write stamp that is bumped on every add/remove; a set built
+    from the database is only stored if no write happened while it was being built.
+
+    get_or_load() rebuilds a missing set under a RecomputeLock, and refreshes a set early
+    as it nears expiry using the time its last rebuild took (kept under the delta key).
+
+    On cache backends other than Redis the set is stored as a plain python set.
+    """
+
+    key_template = None
+    timeout = 60 * 60 * 24
+
+    LOADED = 0  # user ids start at 1
+
+    STORE_SCRIPT = """
+        local current = redis.call('get', KEYS[2]) or '0'
+        if current ~= ARGV[1] then
+            return 0
+        end
+        redis.call('del', KEYS[1])
+        for i = 4, #ARGV, 1000 do
+            redis.call('sadd', KEYS[1], unpack(ARGV, i, math.min(i + 999, #ARGV)))
+        end
+        redis.call('expire', KEYS[1], ARGV[2])
+        redis.call('set', KEYS[3], ARGV[3], 'ex', ARGV[2])
+        return 1
+    """
+
+    UPDATE_SCRIPT = """
+        redis.call('incr', KEYS[2])
+        redis.call('expire', KEYS[2], ARGV[3])
+        if redis.call('exists', KEYS[1]) == 1 then
+            redis.call(ARGV[1], KEYS[1], ARGV[2])
+        end
+    """
+
+    @classmethod
+    def cache_key(cls, user_id):
+        return cls.key_template.format(user_id=user_id)
+
+    @classmethod
+    def family(cls):
+        """
+        The key prefix, used to label cache metrics.
+        """
+        return cls.key_template.split("{")[0].rstrip("_")
+
+    @classmethod
+    def stamp_key(cls, user_id):
+        return f"{cls.cache_key(user_id)}_stamp"
+
+    @classmethod
+    def delta_key(cls, user_id):
+        return f"{cls.cache_key(user_id)}_delta"
+
+    @classmethod
+    def lock_key(cls, user_id):
+        return f"{cls.cache_key(user_id)}_lock"
+
+    @classmethod
+    def get_or_load(cls, user_id, load):
+        """
+        The user's cached set, rebuilt from load() when it is missing or about to expire.
+        One request rebuilds it at a time; the others keep the set they read, or wait for
+        the new one when there is none.
+        """
+        ids = local_cache.get(cls.family(), cls.cache_key(user_id))
+        if ids is not None:
+            return set(ids)
+
+        ids, expiring = cls._read(user_id)
+        if ids is not None and not expiring:
+            return ids
+
+        lock = RecomputeLock(cls.lock_key(user_id))
+        if not lock.acquire():
+            if ids is None:
+                ids = wait_for(lambda: cls.get(user_id))
+            return ids if ids is not None else set(load())
+
+        try:
+            stamp = cls.get_stamp(user_id)
+            started_at = time.monotonic()
+            ids = set(load())
+            cls.store(user_id, ids, stamp, delta=time.monotonic() - started_at)
+        finally:
+            lock.release()
+        return ids
+
+    @classmethod
+    async def aget_or_load(cls, user_id, aload):
+        ids = local_cache.get(cls.family(), cls.cache_key(user_id))
+        if ids is not None:
+            return set(ids)
+
+        ids, expiring = await cls._aread(user_id)
+        if ids is not None and not expiring:
+            return ids
+
+        lock = RecomputeLock(cls.lock_key(user_id))
+        if not await lock.aacquire():
+            if ids is None:
+                ids = await await_for(lambda: cls.aget(user_id))
+            return ids if ids is not None else set(await aload())
+
+        try:
+            stamp = await cls.aget_stamp(user_id)
+            started_at = time.monotonic()
+            ids = set(await aload())
+            await cls.astore(user_id, ids, stamp, delta=time.monotonic() - started_at)
+        finally:
+            await lock.arelease()
+        return ids
+
+    @classmethod
+    def _read(cls, user_id):
+        """
+        (cached set or None, whether to refresh it early).
+        """
+        epoch = local_cache.epoch()
+        client = get_redis_client()
+        with CacheLookup(cls.family()) as lookup:
+            if client is None:
+                ids = cache.get(cls.cache_key(user_id))
+                lookup.hit = ids is not None
+                return ids, False
+
+            pipeline = client.pipeline(transaction=False)
+            pipeline.smembers(cache.make_key(cls.cache_key(user_id)))
+            pipeline.pttl(cache.make_key(cls.cache_key(user_id)))
+            pipeline.get(cache.make_key(cls.delta_key(user_id)))
+            members, ttl, delta = pipeline.execute()
+            lookup.hit = bool(members)
+        return cls._read_result(user_id, members, ttl, delta, epoch)
+
+    @classmethod
+    async def _aread(cls, user_id):
+        epoch = local_cache.epoch()
+        client = get_async_redis_client()
+        with CacheLookup(cls.family()) as lookup:
+            if client is None:
+                ids = await cache.aget(cls.cache_key(user_id))
+                lookup.hit = ids is not None
+                return ids, False
+
+            pipeline = client.pipeline(transaction=False)
+            pipeline.smembers(cache.make_key(cls.cache_key(user_id)))
+            pipeline.pttl(cache.make_key(cls.cache_key(user_id)))
+            pipeline.get(cache.make_key(cls.delta_key(user_id)))
+            members, ttl, delta = await pipeline.execute()
+            lookup.hit = bool(members)
+        return cls._read_result(user_id, members, ttl, delta, epoch)
+
+    @classmethod
+    def _read_result(cls, user_id, members, ttl, delta, epoch):
+        if not members:
+            return None, False
+
+        delta = int(delta) / 1000 if delta is not None else None
+        return cls._loaded(user_id, members, epoch), refresh_early(ttl / 1000, delta)
+
+    @classmethod
+    def get_stamp(cls, user_id):
+        """
+        Read before building a set from the database and pass to store().
+        """
+        client = get_redis_client()
+        if client is None:
+            return None
+
+        stamp = client.get(cache.make_key(cls.stamp_key(user_id)))
+        return stamp.decode() if stamp is not None else "0"
+
+    @classmethod
+    def get(cls, user_id):
+        """
+        Return the cached set of ids, or None if the user's set is not cached.
+        """
+        ids = local_cache.get(cls.family(), cls.cache_key(user_id))
+        if ids is not None:
+            return set(ids)
+
+        epoch = local_cache.epoch()
+        client = get_redis_client()
+        with CacheLookup(cls.family()) as lookup:
+            if client is None:
+                ids = cache.get(cls.cache_key(user_id))
+                lookup.hit = ids is not None
+                return ids
+
+            members = client.smembers(cache.make_key(cls.cache_key(user_id)))
+            lookup.hit = bool(members)
+        if not members:
+            return None
+
+        return cls._loaded(user_id, members, epoch)
+
+    @classmethod
+    def contains(cls, user_id, member_id):
+        """
+        Return True/False if the user's set is cached, None otherwise.
+        """
+        ids = local_cache.get(cls.family(), cls.cache_key(user_id))
+        if ids is not None:
+            return member_id in ids
+
+        client = get_redis_client()
+        with CacheLookup(cls.family()) as lookup:
+            if client is None:
+                ids = cache.get(cls.cache_key(user_id))
+                lookup.hit = ids is not None
+                return None if ids is None else member_id in ids
+
+            loaded, is_member = client.smismember(cache.make_key(cls.cache_key(user_id)), [cls.LOADED, member_id])
+            lookup.hit = bool(loaded)
+        if not loaded:
+            return None
+        return bool(is_member)
+
+    @classmethod
+    def contains_many(cls, user_id, member_ids):
+        """
+        Return the subset of member_ids in the user's set, or None if the set is not cached.
+        """
+        ids = local_cache.get(cls.family(), cls.cache_key(user_id))
+        if ids is not None:
+            return {member_id for member_id in member_ids if member_id in ids}
+
+        member_ids = list(member_ids)
+        client = get_redis_client()
+        with CacheLookup(cls.family()) as lookup:
+            if client is None:
+                ids = cache.get(cls.cache_key(user_id))
+                lookup.hit = ids is not None
+                return None if ids is None else ids.intersection(member_ids)
+
+            loaded, *flags = client.smismember(cache.make_key(cls.cache_key(user_id)), [cls.LOADED, *member_ids])
+            lookup.hit = bool(loaded)
+        if not loaded:
+            return None
+        return {member_id for member_id, flag in zip(member_ids, flags) if flag}
+
+    @classmethod
+    async def aget_stamp(cls, user_id):
+        client = get_async_redis_client()
+        if client is None:
+            return None
+
+        stamp = await client.get(cache.make_key(cls.stamp_key(user_id)))
+        return stamp.decode() if stamp is not None else "0"
+
+    @classmethod
+    async def aget(cls, user_id):
+        ids = local_cache.get(cls.family(), cls.cache_key(user_id))
+        if ids is not None:
+            return set(ids)
+
+        epoch = local_cache.epoch()
+        client = get_async_redis_client()
+        with CacheLookup(cls.family()) as lookup:
+            if client is None:
+                ids = await cache.aget(cls.cache_key(user_id))
+                lookup.hit = ids is not None
+                return ids
+
+            members = await client.smembers(cache.make_key(cls.cache_key(user_id)))
+            lookup.hit = bool(members)
+        if not members:
+            return None
+
+        return cls._loaded(user_id, members, epoch)
+
+    @classmethod
+    def _loaded(cls, user_id, members, epoch):
+        ids = {int(member) for member in members}
+        ids.discard(cls.LOADED)
+        local_cache.set(cls.cache_key(user_id), frozenset(ids), epoch)
+        return ids
+
+    @classmethod
+    async def acontains_many(cls, user_id, member_ids):
+        ids = local_cache.get(cls.family(), cls.cache_key(user_id))
+        if ids is not None:
+            return {member_id for member_id in member_ids if member_id in ids}
+
+        member_ids = list(member_ids)
+        client = get_async_redis_client()
+        with CacheLookup(cls.family()) as lookup:
+            if client is None:
+                ids = await cache.aget(cls.cache_key(user_id))
+                lookup.hit = ids is not None
+                return None if ids is None else ids.intersection(member_ids)
+
+            loaded, *flags = await client.smismember(cache.make_key(cls.cache_key(user_id)), [cls.LOADED, *member_ids])
+            lookup.hit = bool(loaded)
+        if not loaded:
+            return None
+        return {member_id for member_id, flag in zip(member_ids, flags) if flag}
+
+    @classmethod
+    async def astore(cls, user_id, ids, stamp=None, delta=None):
+        client = get_async_redis_client()
+        if client is None:
+            await cache.aset(cls.cache_key(user_id), set(ids), cls.timeout)
+            return
+
+        await client.register_script(cls.STORE_SCRIPT)(keys=cls._store_keys(user_id), args=cls._store_args(ids, stamp, delta))
+
+    @classmethod
+    def store(cls, user_id, ids, stamp=None, delta=None):
+        """
+        Store the set built from the database, with delta the seconds it took to build.
+        """
+        client = get_redis_client()
+        if client is None:
+            cache.set(cls.cache_key(user_id), set(ids), cls.timeout)
+            return
+
+        client.register_script(cls.STORE_SCRIPT)(keys=cls._store_keys(user_id), args=cls._store_args(ids, stamp, delta))
+
+    @classmethod
+    def _store_keys(cls, user_id):
+        return [cache.make_key(key) for key in (cls.cache_key(user_id), cls.stamp_key(user_id), cls.delta_key(user_id))]
+
+    @classmethod
+    def _store_args(cls, ids, stamp, delta):
+        return [stamp or "0", cls.timeout, math.ceil((delta or 0) * 1000), cls.LOADED, *ids]
+
+    @classmethod
+    def add(cls, pairs):
+        """
+        Add member_id to user_id's set for every (user_id, member_id) pair whose set is cached.
+        """
+        cls._update("sadd", pairs)
+
+    @classmethod
+    def remove(cls, pairs):
+        """
+        Remove member_id from user_id's set for every (user_id, member_id) pair.
+        """
+        cls._update("srem", pairs)
+
+    @classmethod
+    def delete(cls, user_id):
+        cache.delete(cls.cache_key(user_id))
+        local_cache.invalidate([cls.cache_key(user_id)])
+
+    @classmethod
+    def _update(cls, command, pairs):
+        client = get_redis_client()
+        if client is None:
+            for user_id, member_id in pairs:
+                ids = cache.get(cls.cache_key(user_id))
+                if ids is None:
+                    continue
+                if command == "sadd":
+                    ids.add(member_id)
+                else:
+                    ids.discard(member_id)
+                cache.set(cls.cache_key(user_id), ids, cls.timeout)
+            return
+
+        script = client.register_script(cls.UPDATE_SCRIPT)
+        pipeline = client.pipeline(transaction=False)
+        for user_id, member_id in pairs:
+            keys = [cache.make_key(cls.cache_key(user_id)), cache.make_key(cls.stamp_key(user_id))]
+            script(keys=keys, args=[command, member_id, cls.timeout], client=pipeline)
+        pipeline.execute()
+
+        local_cache.invalidate({cls.cache_key(user_id) for user_id, member_id in pairs})
+
+
+class FriendAdjacencyCache(IdSetCache):
+    """
+    Ids of each user's friends.
+    """
+
+    key_template = "friends_cache_{user_id}"
+
+
+class UserCacheVersions:
+    """
+    Per-user cache versions: values are cached under keys ending in the user's current
+    version, so bumping the version invalidates all of them at once.
+
+    Versions are integer counters bumped with INCR, so concurrent bumps never undo each
+    other. A missing version starts from the server time in microseconds rather than 0,
+    so a version lost to eviction never comes back to a value older payloads were stored under.
+
+    On Redis, read() gets the version and the payload in one call: READ_SCRIPT builds the
+    payload key from the version server side. Key templates must end in "{version}" and the
+    cache must use Django's default KEY_FUNCTION for that.
+
+    A missing payload is rebuilt by one request at a time, under a RecomputeLock per version
+    that READ_SCRIPT takes in the same call; the others wait for it. Payloads nearing expiry
+    are refreshed early, like IdSetCache, and only then are the others served the payload
+    they read. store() only stores a payload if its version is still current, so a payload
+    of an older version is never served and a request made after a bump always sees the
+    write behind it.
+    """
+
+    version_key_template = "user_cache_version_{user_id}_{cache_type}"
+
+    START_VERSION = """
+        local now = redis.call('time')
+        local start = now[1] .. string.format('%06d', now[2])
+    """
+
+    READ_SCRIPT = START_VERSION + """
+        local version = redis.call('get', KEYS[1])
+        if not version then
+            redis.call('set', KEYS[1], start)
+            version = start
+        end
+        local key = ARGV[1] .. version
+        local value = redis.call('get', key)
+        if value then
+            return {version, value, redis.call('pttl', key), redis.call('get', ARGV[1] .. 'delta'), 0}
+        end
+        local locked = redis.call('set', key .. '_lock', ARGV[2], 'nx', 'px', ARGV[3]) and 1 or 0
+        return {version, false, -2, false, locked}
+    """
+
+    STORE_SCRIPT = """
+        local stored = 0
+        if redis.call('get', KEYS[1]) == ARGV[1] then
+            redis.call('set', KEYS[2], ARGV[3], 'px', ARGV[5])
+            redis.call('set', KEYS[3], ARGV[4], 'px', ARGV[5])
+            stored = 1
+        end
+        if redis.call('get', KEYS[4]) == ARGV[2] then
+            redis.call('del', KEYS[4])
+        end
+        return stored
+    """
+
+    INCR_SCRIPT = START_VERSION + """
+        for _, key in ipairs(KEYS) do
+            if redis.call('set', key, start, 'nx') == false then
+                redis.call('incr', key)
+            end
+        end
+    """
+
+    START_SCRIPT = START_VERSION + """
+        for _, key in ipairs(KEYS) do
+            redis.call('set', key, start, 'nx')
+        end
+    """
+
+    @classmethod
+    def version_key(cls, user_id, cache_type):
+        return cls.version_key_template.format(user_id=user_id, cache_type=cache_type)
+
+    @staticmethod
+    def start_version():
+        return time.time_ns() // 1000
+
+    @classmethod
+    def get_version(cls, user_id, cache_type):
+        return cls.get_versions([user_id], cache_type)[user_id]
+
+    @classmethod
+    async def aget_version(cls, user_id, cache_type):
+        version_key = cls.version_key(user_id, cache_type)
+        client = get_async_redis_client()
+        with CacheLookup("user_cache_version") as lookup:
+            if client is None:
+                version = await cache.aget(version_key)
+            else:
+                version = await client.get(cache.make_key(version_key))
+            lookup.hit = version is not None
+
+        if version is None:
+            if client is None:
+                await cache.aadd(version_key, cls.start_version(), None)
+                version = await cache.aget(version_key)
+            else:
+                await client.register_script(cls.START_SCRIPT)(keys=[cache.make_key(version_key)])
+                version = await client.get(cache.make_key(version_key))
+        return cls._decode(version)
+
+    @classmethod
+    def get_versions(cls, user_ids, cache_type):
+        """
+        {user_id: version} for many users in one MGET.
+        """
+        user_ids = list(user_ids)
+        keys = [cls.version_key(user_id, cache_type) for user_id in user_ids]
+
+        client = get_redis_client()
+        with CacheLookup("user_cache_version") as lookup:
+            if client is None:
+                found = cache.get_many(keys)
+                versions = [found.get(key) for key in keys]
+            else:
+                versions = client.mget([cache.make_key(key) for key in keys])
+            lookup.hit = None not in versions
+
+        versions = {user_id: version for user_id, version in zip(user_ids, versions)}
+        missing = [user_id for user_id, version in versions.items() if version is None]
+        if missing:
+            cls._incr([cls.version_key(user_id, cache_type) for user_id in missing], start_only=True)
+            # re-read, another request may have started them first
+            versions.update(cls.get_versions(missing, cache_type))
+
+        return {user_id: cls._decode(version) for user_id, version in versions.items()}
+
+    @classmethod
+    def incr(cls, user_id, cache_type):
+        cls.incr_many([user_id], cache_type)
+
+    @classmethod
+    def incr_many(cls, user_ids, cache_type):
+        """
+        Invalidate everything cached for the users under cache_type, in one call.
+        """
+        cls._incr([cls.version_key(user_id, cache_type) for user_id in user_ids])
+
+    @classmethod
+    def _incr(cls, keys, start_only=False):
+        if not keys:
+            return
+
+        client = get_redis_client()
+        if client is None:
+            for key in keys:
+                if not cache.add(key, cls.start_version(), None) and not start_only:
+                    cache.incr(key)
+            return
+
+        script = cls.START_SCRIPT if start_only else cls.INCR_SCRIPT
+        client.register_script(script)(keys=[cache.make_key(key) for key in keys])
+        if not start_only:
+            local_cache.invalidate(keys)
+
+    @staticmethod
+    def _decode(version):
+        return version.decode() if isinstance(version, bytes) else str(version)
+
+    @classmethod
+    def read(cls, user_id, cache_type, key_template):
+        """
+        (version, value or None, lock) for the user's current version. lock is a held
+        RecomputeLock when the caller is to rebuild the value, because it is missing or due
+        for an early refresh, and must then be passed to store(). A missing value being
+        rebuilt by another request is waited for; if it does not show up, the caller builds
+        it without storing it (lock is None). Values are also kept in local_cache until the
+        version changes, so they must not be modified.
+        """
+        version, value = cls._local_value(user_id, cache_type, key_template)
+        if value is not None:
+            return version, value, None
+
+        token = uuid.uuid4().hex
+        version, value, expiring, locked = cls._read(user_id, cache_type, key_template, token)
+        if value is None and not locked:
+            read = wait_for(lambda: cls._read_until_built(user_id, cache_type, key_template, token))
+            if read is not None:
+                version, value, expiring, locked = read
+
+        lock = RecomputeLock(cls.lock_key(key_template, user_id, version), token)
+        # one request refreshes a value nearing expiry, the others keep serving it
+        if locked or (expiring and lock.acquire()):
+            return version, value, lock
+        return version, value, None
+
+    @classmethod
+    async def aread(cls, user_id, cache_type, key_template):
+        version, value = cls._local_value(user_id, cache_type, key_template)
+        if value is not None:
+            return version, value, None
+
+        token = uuid.uuid4().hex
+        version, value, expiring, locked = await cls._aread(user_id, cache_type, key_template, token)
+        if value is None and not locked:
+            read = await await_for(lambda: cls._aread_until_built(user_id, cache_type, key_template, token))
+            if read is not None:
+                version, value, expiring, locked = read
+
+        lock = RecomputeLock(cls.lock_key(key_template, user_id, version), token)
+        if locked or (expiring and await lock.aacquire()):
+            return version, value, lock
+        return version, value, None
+
+    @classmethod
+    def store(cls, user_id, cache_type, key_template, version, value, timeout, delta, lock):
+        """
+        Store the value rebuilt for version in delta seconds, unless the version was bumped
+        meanwhile, and release the lock read() handed out. Returns whether it was stored.
+        """
+        client = get_redis_client()
+        if client is None:
+            stored = cls.get_version(user_id, cache_type) == version
+            if stored:
+                cache.set_many(cls._store_values(user_id, key_template, version, value, delta), timeout)
+            lock.release()
+            return stored
+
+        keys, args = cls._store_args(user_id, cache_type, key_template, version, value, timeout, delta, lock)
+        return bool(client.register_script(cls.STORE_SCRIPT)(keys=keys, args=args))
+
+    @classmethod
+    async def astore(cls, user_id, cache_type, key_template, version, value, timeout, delta, lock):
+        client = get_async_redis_client()
+        if client is None:
+            stored = await cls.aget_version(user_id, cache_type) == version
+            if stored:
+                await cache.aset_many(cls._store_values(user_id, key_template, version, value, delta), timeout)
+            await lock.arelease()
+            return stored
+
+        keys, args = cls._store_args(user_id, cache_type, key_template, version, value, timeout, delta, lock)
+        return bool(await client.register_script(cls.STORE_SCRIPT)(keys=keys, args=args))
+
+    @staticmethod
+    def family(key_template):
+        return key_template.split("{")[0].rstrip("_")
+
+    @staticmethod
+    def payload_key(key_template, user_id, version):
+        return key_template.format(user_id=user_id, version=version)
+
+    @classmethod
+    def lock_key(cls, key_template, user_id, version):
+        return f"{cls.payload_key(key_template, user_id, version)}_lock"
+
+    @classmethod
+    def _local_value(cls, user_id, cache_type, key_template):
+        """
+        (version, value) from local_cache, or (None, None).
+        """
+        # the version and the payloads are kept apart, so bumping the version drops them all
+        version = local_cache.get("user_cache_version", cls.version_key(user_id, cache_type))
+        if version is None:
+            return None, None
+        return version, local_cache.get(cls.family(key_template), cls.payload_key(key_template, user_id, version))
+
+    @classmethod
+    def _read(cls, user_id, cache_type, key_template, token):
+        """
+        (version, value or None, whether to refresh it early, whether the rebuild lock was
+        taken with token because the value is missing).
+        """
+        epoch = local_cache.epoch()
+        client = get_redis_client()
+        with CacheLookup(cls.family(key_template)) as lookup:
+            if client is None:
+                version = cls.get_version(user_id, cache_type)
+                value = cache.get(cls.payload_key(key_template, user_id, version))
+                lookup.hit = value is not None
+                locked = value is None and RecomputeLock(cls.lock_key(key_template, user_id, version), token).acquire()
+                return version, value, False, locked
+
+            result = client.register_script(cls.READ_SCRIPT)(
+                keys=[cache.make_key(cls.version_key(user_id, cache_type))],
+                args=cls._read_args(user_id, key_template, token),
+            )
+            lookup.hit = result[1] is not None
+        return cls._read_result(user_id, cache_type, key_template, result, epoch)
+
+    @classmethod
+    async def _aread(cls, user_id, cache_type, key_template, token):
+        epoch = local_cache.epoch()
+        client = get_async_redis_client()
+        with CacheLookup(cls.family(key_template)) as lookup:
+            if client is None:
+                version_key = cls.version_key(user_id, cache_type)
+                await cache.aadd(version_key, cls.start_version(), None)
+                version = cls._decode(await cache.aget(version_key))
+                value = await cache.aget(cls.payload_key(key_template, user_id, version))
+                lookup.hit = value is not None
+                locked = value is None and await RecomputeLock(cls.lock_key(key_template, user_id, version), token).aacquire()
+                return version, value, False, locked
+
+            result = await client.register_script(cls.READ_SCRIPT)(
+                keys=[cache.make_key(cls.version_key(user_id, cache_type))],
+                args=cls._read_args(user_id, key_template, token),
+            )
+            lookup.hit = result[1] is not None
+        return cls._read_result(user_id, cache_type, key_template, result, epoch)
+
+    @classmethod
+    def _read_until_built(cls, user_id, cache_type, key_template, token):
+        # polled by a request waiting for another one's rebuild, which may die or find the
+        # version bumped before it stores anything: then this one takes over the lock
+        read = cls._read(user_id, cache_type, key_template, token)
+        return read if read[1] is not None or read[3] else None
+
+    @classmethod
+    async def _aread_until_built(cls, user_id, cache_type, key_template, token):
+        read = await cls._aread(user_id, cache_type, key_template, token)
+        return read if read[1] is not None or read[3] else None
+
+    @classmethod
+    def _read_args(cls, user_id, key_template, token):
+        return [
+            cache.make_key(cls.payload_key(key_template, user_id, "")),
+            token,
+            int(settings.CACHE_RECOMPUTE['LOCK_TIMEOUT'] * 1000),
+        ]
+
+    @classmethod
+    def _read_result(cls, user_id, cache_type, key_template, result, epoch):
+        version, value, ttl, delta, locked = result
+        version = cls._decode(version)
+        if value is None:
+            return version, None, False, bool(locked)
+
+        value = cache.client.decode(value)
+        local_cache.set(cls.version_key(user_id, cache_type), version, epoch)
+        local_cache.set(cls.payload_key(key_template, user_id, version), value, epoch)
+        delta = int(delta) / 1000 if delta is not None else None
+        return version, value, refresh_early(ttl / 1000, delta), False
+
+    @classmethod
+    def _store_values(cls, user_id, key_template, version, value, delta):
+        # delta in milliseconds, as an int is stored as is rather than pickled
+        return {
+            cls.payload_key(key_template, user_id, version): value,
+            cls.payload_key(key_template, user_id, "delta"): math.ceil(delta * 1000),
+        }
+
+    @classmethod
+    def _store_args(cls, user_id, cache_type, key_template, version, value, timeout, delta, lock):
+        (payload_key, value), (delta_key, delta) = cls._store_values(user_id, key_template, version, value, delta).items()
+        keys = [cls.version_key(user_id, cache_type), payload_key, delta_key, lock.key]
+        args = [version, lock.token, cache.client.encode(value), delta, int(timeout * 1000)]
+        return [cache.make_key(key) for key in keys], args
+
+
+class RefreshQueue:
+    """
+    A shared set of user ids waiting for some precomputed data to be rebuilt.
+    """
+
+    key = None
+
+    @classmethod
+    def push(cls, user_ids):
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+
+        client = get_redis_client()
+        if client is None:
+            cache.set(cls.key, (cache.get(cls.key) or set()).union(user_ids), None)
+            return
+
+        client.sadd(cache.make_key(cls.key), *user_ids)
+
+    @classmethod
+    def pop(cls, count):
+        client = get_redis_client()
+        if client is None:
+            user_ids = cache.get(cls.key) or set()
+            popped = set(list(user_ids)[:count])
+            cache.set(cls.key, user_ids - popped, None)
+            return popped
+
+        return {int(user_id) for user_id in client.spop(cache.make_key(cls.key), count) or []}
+
+
+class SuggestionRefreshQueue(RefreshQueue):
+    """
+    Users whose friend suggestions are out of date.
+    """
+
+    key = "friend_suggestions_dirty"
+
+
+class FriendsSuggestionRefreshQueue(RefreshQueue):
+    """
+    Users whose friendships changed, so the suggestions of their friends, whose
+    friends-of-friends include them, are out of date too.
+    """
+
+    key = "friend_suggestions_friends_dirty"
@@ -0,0 +1,112 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from friend_management.models import FriendshipChange, FriendshipChangePruning
+
+
+class ChangeFeed:
+    """
+    Per-user log of changes to the friends, friend_requests and blocked_users lists, so
+    clients can sync them incrementally instead of fetching them again.
+
+    Changes are inserted once the transaction of the change itself commits, each batch in
+    its own single-statement transaction. Ids are handed out on insert but become visible on
+    commit, so a change with a lower id can still show up after one with a higher id, but
+    only within that insert; the feed only serves changes older than SETTLE_SECONDS so a
+    cursor never moves past a change that is still being committed, however long the
+    transaction of the change took.
+
+    Cursors are change ids shared by all users, and advance to the latest settled change
+    even when the user has none, so a cursor only expires (see is_expired()) when the
+    client stops syncing for longer than RETENTION_DAYS.
+    """
+
+    FRIENDS = "friends"
+    FRIEND_REQUESTS = "friend_requests"
+    BLOCKED_USERS = "blocked_users"
+
+    ADDED = "added"
+    REMOVED = "removed"
+
+    @classmethod
+    def record(cls, changes):
+        """
+        Append (user_id, collection, action, object_id) changes when the current transaction
+        commits. A change that is rolled back is never recorded.
+        """
+        changes = [
+            FriendshipChange(user_id=user_id, collection=collection, action=action, object_id=object_id)
+            for user_id, collection, action, object_id in changes
+        ]
+        # robust: the change itself is already committed, so a failure here is only logged
+        transaction.on_commit(lambda: FriendshipChange.objects.bulk_create(changes), robust=True)
+
+    @classmethod
+    def get_settled_at(cls):
+        return timezone.now() - timezone.timedelta(seconds=settings.FRIENDSHIP_CHANGES['SETTLE_SECONDS'])
+
+    @classmethod
+    def get_cursor(cls, settled_at=None):
+        """
+        Cursor to sync from after loading the lists in full.
+        """
+        latest_id = FriendshipChange.objects.filter(created_at__lte=settled_at or cls.get_settled_at())\
+            .order_by('-id').values_list('id', flat=True).first()
+        return latest_id or cls.get_last_pruned_id()
+
+    @classmethod
+    def get_changes(cls, user_id, cursor, limit):
+        """
+        Up to limit changes of the user after cursor, oldest first, the cursor to continue
+        from and whether there are more.
+        """
+        settled_at = cls.get_settled_at()
+        changes = list(
+            FriendshipChange.objects.filter(user_id=user_id, id__gt=cursor, created_at__lte=settled_at).order_by('id')[:limit + 1]
+        )
+        if len(changes) > limit:
+            return changes[:limit], changes[limit - 1].id, True
+
+        # the user has no other change up to the latest settled one
+        return changes, max(cursor, cls.get_cursor(settled_at), *(change.id for change in changes)), False
+
+    @classmethod
+    def is_expired(cls, cursor):
+        """
+        Whether changes after cursor may have been pruned, so the lists have to be loaded again.
+        """
+        return cursor < cls.get_last_pruned_id()
+
+    @classmethod
+    def get_last_pruned_id(cls):
+        return FriendshipChangePruning.objects.values_list('last_pruned_id', flat=True).first() or 0
+
+    @classmethod
+    def prune(cls, batch_size=None):
+        """
+        Delete the changes older than RETENTION_DAYS, batch_size (PRUNE_BATCH_SIZE) at a time,
+        each batch in its own transaction. Returns how many were deleted.
+        """
+        batch_size = batch_size or settings.FRIENDSHIP_CHANGES['PRUNE_BATCH_SIZE']
+        retention = timezone.timedelta(days=settings.FRIENDSHIP_CHANGES['RETENTION_DAYS'])
+        last_id = FriendshipChange.objects.filter(created_at__lt=timezone.now() - retention).aggregate(last_id=Max('id'))['last_id']
+        if last_id is None:
+            return 0
+
+        deleted = 0
+        while True:
+            with transaction.atomic():
+                batch_ids = list(
+                    FriendshipChange.objects.filter(id__lte=last_id).order_by('id').values_list('id', flat=True)[:batch_size]
+                )
+                if not batch_ids:
+                    return deleted
+
+                # every change up to the batch's last id goes, so that is exactly what is_expired() compares against
+                batch_deleted, _ = FriendshipChange.objects.filter(id__lte=batch_ids[-1]).delete()
+                deleted += batch_deleted
+                pruning, _ = FriendshipChangePruning.objects.select_for_update().get_or_create(pk=1)
+                pruning.last_pruned_id = max(pruning.last_pruned_id, batch_ids[-1])
+                pruning.save()
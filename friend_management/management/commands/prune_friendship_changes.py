@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from friend_management.changes import ChangeFeed
+
+
+class Command(BaseCommand):
+    help = "Delete change feed entries older than FRIENDSHIP_CHANGES['RETENTION_DAYS']."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help="Changes to delete per transaction (default: PRUNE_BATCH_SIZE).")
+
+    def handle(self, *args, **options):
+        deleted = ChangeFeed.prune(options['batch_size'])
+        self.stdout.write(f"Deleted {deleted} changes older than {settings.FRIENDSHIP_CHANGES['RETENTION_DAYS']} days")
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts.models import CustomUser
+from friend_management.suggestions import FriendSuggestionEngine
+
+
+class Command(BaseCommand):
+    help = "Rebuild precomputed friend suggestions for users whose friendships changed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="Users to rebuild per batch.")
+        parser.add_argument('--loop', action='store_true', help="Keep draining the refresh queue.")
+        parser.add_argument('--interval', type=float, default=5.0, help="Seconds to sleep when the queue is empty (with --loop).")
+        parser.add_argument('--all', action='store_true', help="Rebuild suggestions for every active user.")
+
+    def handle(self, *args, **options):
+        if options['all']:
+            count = 0
+            for user_id in CustomUser.objects.filter(is_active=True).values_list('id', flat=True).iterator():
+                FriendSuggestionEngine.refresh(user_id)
+                count += 1
+            self.stdout.write(f"Rebuilt suggestions for {count} users")
+            return
+
+        while True:
+            refreshed = FriendSuggestionEngine.refresh_pending(options['batch_size'])
+            if refreshed:
+                self.stdout.write(f"Rebuilt suggestions for {len(refreshed)} users")
+                continue
+
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
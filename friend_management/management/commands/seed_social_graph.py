@@ -0,0 +1,56 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from friend_management.seeding import SocialGraphSeeder
+
+
+class Command(BaseCommand):
+    help = "Generate users with a power-law friendship graph, friend requests, blocks and request logs."
+
+    def add_arguments(self, parser):
+        parser.add_argument('users', type=int, help="Number of users to create.")
+        parser.add_argument('--friends-per-user', type=int, default=5, help="Friendships each new user makes (average degree is twice this).")
+        parser.add_argument('--pending-per-user', type=float, default=1.0, help="Average pending friend requests per user.")
+        parser.add_argument('--rejected-per-user', type=float, default=0.5, help="Average rejected friend requests per user.")
+        parser.add_argument('--blocks-per-user', type=float, default=0.2, help="Average blocks per user.")
+        parser.add_argument('--accepted-ratio', type=float, default=0.8, help="Share of friendships that have an accepted friend request.")
+        parser.add_argument('--logs', type=int, default=0, help="Number of request log rows to create.")
+        parser.add_argument('--days', type=int, default=365, help="Spread sign-ups over this many days.")
+        parser.add_argument('--log-days', type=int, default=7, help="Spread request logs over this many days.")
+        parser.add_argument('--password', default="password", help="Password of every generated user.")
+        parser.add_argument('--skip-passwords', action='store_true', help="Give every user an unusable password instead.")
+        parser.add_argument('--workers', type=int, help="Processes encrypting emails. Defaults to the number of CPUs.")
+        parser.add_argument('--batch-size', type=int, default=10000, help="Rows per insert batch.")
+        parser.add_argument('--email-domain', default="seed.local", help="Domain of the generated email addresses.")
+        parser.add_argument('--seed', type=int, help="Random seed, for a repeatable graph.")
+
+    def handle(self, *args, **options):
+        if options['users'] < 1:
+            raise CommandError("users must be at least 1.")
+
+        seeder = SocialGraphSeeder(
+            connection,
+            options['users'],
+            friends_per_user=options['friends_per_user'],
+            pending_per_user=options['pending_per_user'],
+            rejected_per_user=options['rejected_per_user'],
+            blocks_per_user=options['blocks_per_user'],
+            accepted_ratio=options['accepted_ratio'],
+            logs=options['logs'],
+            days=options['days'],
+            log_days=options['log_days'],
+            password=options['password'],
+            skip_passwords=options['skip_passwords'],
+            workers=options['workers'],
+            batch_size=options['batch_size'],
+            email_domain=options['email_domain'],
+            seed=options['seed'],
+        )
+
+        started_at = time.monotonic()
+        counts = seeder.run()
+        for table, count in counts.items():
+            self.stdout.write(f"{table}: {count} rows")
+        self.stdout.write(f"Seeded in {time.monotonic() - started_at:.1f}s. Run refresh_friend_suggestions --all to build suggestions.")
@@ -0,0 +1,42 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:05
+
+from django.db import migrations
+
+
+def collapse_friendships(apps, schema_editor):
+    """
+    Rewrite every friendship as (low id, high id) and drop self, reversed and duplicate rows,
+    keeping the oldest row of each pair.
+    """
+    Friend = apps.get_model('friend_management', 'Friend')
+    db_alias = schema_editor.connection.alias
+
+    seen = set()
+    duplicate_ids = []
+    to_swap = []
+    for friend in Friend.objects.using(db_alias).order_by('created_at', 'id').iterator():
+        pair = (min(friend.user_id, friend.friend_id), max(friend.user_id, friend.friend_id))
+        if friend.user_id == friend.friend_id or pair in seen:
+            duplicate_ids.append(friend.id)
+            continue
+
+        seen.add(pair)
+        if friend.user_id > friend.friend_id:
+            friend.user_id, friend.friend_id = pair
+            to_swap.append(friend)
+
+    for start in range(0, len(duplicate_ids), 1000):
+        Friend.objects.using(db_alias).filter(id__in=duplicate_ids[start:start + 1000]).delete()
+
+    Friend.objects.using(db_alias).bulk_update(to_swap, ['user', 'friend'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('friend_management', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(collapse_friendships, migrations.RunPython.noop),
+    ]
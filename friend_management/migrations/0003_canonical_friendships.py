@@ -0,0 +1,27 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('friend_management', '0002_collapse_friendships'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='friend',
+            index=models.Index(fields=['friend', 'user'], name='friend_friend_user_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='friend',
+            constraint=models.UniqueConstraint(fields=('user', 'friend'), name='friend_unique_pair'),
+        ),
+        migrations.AddConstraint(
+            model_name='friend',
+            constraint=models.CheckConstraint(condition=models.Q(('user__lt', models.F('friend'))), name='friend_canonical_order'),
+        ),
+    ]
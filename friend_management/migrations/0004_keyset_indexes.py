@@ -0,0 +1,19 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('friend_management', '0003_canonical_friendships'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='friendrequest',
+            index=models.Index(fields=['to_user', 'status', 'created_at', 'id'], name='friendrequest_inbox_idx'),
+        ),
+    ]
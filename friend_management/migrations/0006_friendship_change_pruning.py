@@ -0,0 +1,20 @@
+# Generated by Django 5.1.1 on 2026-10-18 19:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('friend_management', '0005_friendship_changes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FriendshipChangePruning',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_pruned_id', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
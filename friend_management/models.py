@@ -12,9 +12,17 @@ class FriendRequest(models.Model):
     def __str__(self):
         return f"{self.from_user} -> {self.to_user}"
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['to_user', 'status', 'created_at', 'id'], name='friendrequest_inbox_idx'),
+        ]
+
 
 
 class Friend(models.Model):
+    """
+    An undirected friendship, stored once as the canonical pair user_id < friend_id.
+    """
     user = models.ForeignKey("accounts.CustomUser", on_delete=models.CASCADE, related_name="user")
     friend = models.ForeignKey("accounts.CustomUser", on_delete=models.CASCADE, related_name="friend")
     created_at = models.DateTimeField(auto_now_add=True)
@@ -22,4 +30,50 @@ class Friend(models.Model):
 
     def __str__(self):
         return f"{self.user} -> {self.friend}"
-    
\ No newline at end of file
+
+    @staticmethod
+    def canonical_pair(user_id, other_user_id):
+        return min(user_id, other_user_id), max(user_id, other_user_id)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'friend'], name='friend_unique_pair'),
+            models.CheckConstraint(condition=models.Q(user__lt=models.F('friend')), name='friend_canonical_order'),
+        ]
+        indexes = [
+            models.Index(fields=['friend', 'user'], name='friend_friend_user_idx'),
+        ]
+
+
+class FriendshipChange(models.Model):
+    """
+    An entry of a user's change feed: an item added to or removed from one of the user's
+    lists. The auto-incremented id is the feed cursor.
+
+    object_id is what identifies the item in its list: the other user's id for friends and
+    blocked_users, the friend request's id for friend_requests.
+    """
+    user = models.ForeignKey("accounts.CustomUser", on_delete=models.CASCADE, related_name="friendship_changes")
+    collection = models.CharField(max_length=20, choices=[("friends", "friends"), ("friend_requests", "friend_requests"), ("blocked_users", "blocked_users")])
+    action = models.CharField(max_length=10, choices=[("added", "added"), ("removed", "removed")])
+    object_id = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.user}: {self.collection} {self.action} {self.object_id}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'], name='friendshipchange_feed_idx'),
+        ]
+
+
+class FriendshipChangePruning(models.Model):
+    """
+    A single row holding the id of the latest change pruned from the feed, so a cursor
+    from before it is known to be expired even once no older change is left.
+    """
+    last_pruned_id = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"pruned through {self.last_pruned_id}"
@@ -0,0 +1,272 @@
+# friend_management/seeding.py
+#
+# Synthetic social graph generation for the seed_social_graph command. Rows are built as
+# plain tuples and written in batches (COPY on PostgreSQL, executemany elsewhere), so
+# seeding millions of rows never goes through model instances.
+
+import csv
+import datetime
+import io
+import multiprocessing
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import models
+from encrypted_model_fields.fields import encrypt_str
+
+from accounts.models import BlockedUser, CustomUser
+from accounts.utils import consistent_encrypt
+from friend_management.models import Friend, FriendRequest
+from logging_management.models import Log
+
+
+FIRST_NAMES = [
+    "aarav", "aditi", "akshit", "ananya", "arjun", "diya", "ishaan", "kavya", "moksh", "neha",
+    "priya", "rahul", "riya", "rohan", "sanya", "shubham", "tanvi", "varun", "vihaan", "zoya",
+]
+LAST_NAMES = [
+    "agarwal", "bose", "das", "gupta", "iyer", "jain", "kapoor", "khan", "mehta", "nair",
+    "patel", "rao", "reddy", "sharma", "singh", "verma", "vashisht", "yadav", "joshi", "malhotra",
+]
+LOG_ACTIONS = [
+    ('/search/', 'GET'), ('/friends/', 'GET'), ('/friend_requests/', 'GET'), ('/send_friend_request/', 'POST'),
+    ('/accept_friend_request/', 'POST'), ('/login/', 'POST'), ('/blocked_users/', 'GET'),
+]
+
+
+def encrypt_emails(emails):
+    """
+    (email_hash, encrypted email) of each email. Run in worker processes, which share the
+    parent's encryption key because they are forked.
+    """
+    return [(consistent_encrypt(email), encrypt_str(email).decode('utf-8')) for email in emails]
+
+
+class TableWriter:
+    """
+    Buffers rows of one table and writes them out batch_size at a time with explicit ids.
+    """
+
+    def __init__(self, connection, model, columns, batch_size):
+        self.connection = connection
+        self.model = model
+        self.table = model._meta.db_table
+        self.columns = ['id', *columns]
+        self.batch_size = batch_size
+        self.rows = []
+        self.count = 0
+
+        self.next_id = (model.objects.aggregate(max_id=models.Max('id'))['max_id'] or 0) + 1
+
+    def add(self, *values):
+        row_id = self.next_id
+        self.next_id += 1
+        self.rows.append((row_id, *values))
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+        return row_id
+
+    def flush(self):
+        if not self.rows:
+            return
+
+        with self.connection.cursor() as cursor:
+            if self.connection.vendor == 'postgresql':
+                self._copy(cursor)
+            else:
+                self._insert(cursor)
+
+        self.count += len(self.rows)
+        self.rows = []
+
+    def _copy(self, cursor):
+        buffer = io.StringIO()
+        # NULLs come out as empty unquoted fields and empty strings as "", which is how COPY reads them
+        csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC).writerows(self.rows)
+        buffer.seek(0)
+
+        sql = f"COPY {self.table} ({', '.join(self.columns)}) FROM STDIN WITH (FORMAT csv)"
+        raw_cursor = cursor.cursor
+        if hasattr(raw_cursor, 'copy_expert'):
+            # psycopg2
+            raw_cursor.copy_expert(sql, buffer)
+            return
+
+        with raw_cursor.copy(sql) as copy:
+            copy.write(buffer.getvalue())
+
+    def _insert(self, cursor):
+        ops = self.connection.ops
+        rows = [
+            [ops.adapt_datetimefield_value(value) if isinstance(value, datetime.datetime) else value for value in row]
+            for row in self.rows
+        ]
+        placeholders = ', '.join(['%s'] * len(self.columns))
+        cursor.executemany(f"INSERT INTO {self.table} ({', '.join(self.columns)}) VALUES ({placeholders})", rows)
+
+
+class SocialGraphSeeder:
+    """
+    Generates `users` users and a preferential-attachment (power-law) friendship graph among
+    them, along with accepted, pending and rejected friend requests, blocks and request logs.
+
+    Each new user befriends `friends_per_user` earlier users picked in proportion to how many
+    friends they already have, so a few users end up with very many friends and most with few.
+    Requests and blocks also only point at earlier users, which keeps every pair unique
+    without tracking the whole graph.
+    """
+
+    def __init__(self, connection, users, friends_per_user=5, pending_per_user=1.0, rejected_per_user=0.5,
+                 blocks_per_user=0.2, accepted_ratio=0.8, logs=0, days=365, log_days=7, password=None,
+                 skip_passwords=False, workers=None, batch_size=10000, email_domain="seed.local", seed=None):
+        self.connection = connection
+        self.user_count = users
+        self.friends_per_user = friends_per_user
+        self.pending_per_user = pending_per_user
+        self.rejected_per_user = rejected_per_user
+        self.blocks_per_user = blocks_per_user
+        self.accepted_ratio = accepted_ratio
+        self.log_count = logs
+        self.days = days
+        self.log_days = log_days
+        self.password = password
+        self.skip_passwords = skip_passwords
+        self.workers = workers or multiprocessing.cpu_count()
+        self.batch_size = batch_size
+        self.email_domain = email_domain
+        self.random = random.Random(seed)
+        self.now = datetime.datetime.now(datetime.timezone.utc)
+
+        self.users = TableWriter(connection, CustomUser, [
+            'password', 'last_login', 'is_superuser', 'email_hash', 'email', 'first_name', 'last_name',
+            'is_active', 'role', 'date_joined',
+        ], batch_size)
+        self.friends = TableWriter(connection, Friend, ['user_id', 'friend_id', 'created_at', 'updated_at'], batch_size)
+        self.friend_requests = TableWriter(connection, FriendRequest, [
+            'from_user_id', 'to_user_id', 'created_at', 'updated_at', 'rejected_at', 'status',
+        ], batch_size)
+        self.blocked_users = TableWriter(connection, BlockedUser, [
+            'user_id', 'blocked_user_id', 'created_at', 'updated_at',
+        ], batch_size)
+        self.logs = TableWriter(connection, Log, [
+            'user_id', 'action', 'method', 'payload', 'result', 'status_code',
+            'action_started_at', 'action_completed_at', 'ip_address',
+        ], batch_size)
+
+    @property
+    def writers(self):
+        return [self.users, self.friends, self.friend_requests, self.blocked_users, self.logs]
+
+    def run(self):
+        user_ids = self.seed_users()
+        self.seed_graph(user_ids)
+        self.seed_logs(user_ids)
+
+        for writer in self.writers:
+            writer.flush()
+        self.reset_sequences()
+
+        return {writer.table: writer.count for writer in self.writers}
+
+    def joined_at(self, index):
+        # users join evenly over the last `days` days, in id order
+        return self.now - datetime.timedelta(days=self.days) * (1 - index / max(self.user_count, 1))
+
+    def seed_users(self):
+        if self.skip_passwords:
+            # unusable, like set_unusable_password() but without a random suffix per row
+            password = "!"
+        else:
+            # hashed once and shared, hashing every row would take hours
+            password = make_password(self.password)
+
+        first_id = self.users.next_id
+        user_ids = range(first_id, first_id + self.user_count)
+        chunk_size = max(1, min(self.batch_size, self.user_count // self.workers + 1))
+        chunks = [user_ids[start:start + chunk_size] for start in range(0, len(user_ids), chunk_size)]
+
+        with ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('fork')) as executor:
+            # a few chunks in flight at a time, so the results never pile up in memory
+            window = self.workers * 2
+            for start in range(0, len(chunks), window):
+                batch = chunks[start:start + window]
+                emails = [[f"user{user_id}@{self.email_domain}" for user_id in chunk] for chunk in batch]
+                for chunk, encrypted in zip(batch, executor.map(encrypt_emails, emails)):
+                    for user_id, (email_hash, email) in zip(chunk, encrypted):
+                        index = user_id - first_id
+                        self.users.add(
+                            password, None, False, email_hash, email,
+                            self.random.choice(FIRST_NAMES), self.random.choice(LAST_NAMES),
+                            True, "write", self.joined_at(index),
+                        )
+
+        # the graph references these ids, so they have to exist before it is written
+        self.users.flush()
+        return user_ids
+
+    def sample_count(self, mean):
+        count = int(mean)
+        return count + (self.random.random() < mean - count)
+
+    def seed_graph(self, user_ids):
+        rng = self.random
+        # every friendship endpoint once per friendship, so a uniform pick is degree-proportional
+        endpoints = []
+
+        for index, user_id in enumerate(user_ids):
+            created_at = self.joined_at(index)
+
+            friend_ids = set()
+            while len(friend_ids) < min(self.friends_per_user, index):
+                friend_ids.add(rng.choice(endpoints) if endpoints else user_ids[rng.randrange(index)])
+
+            for friend_id in friend_ids:
+                self.friends.add(friend_id, user_id, created_at, created_at)
+                endpoints.extend((friend_id, user_id))
+                if rng.random() < self.accepted_ratio:
+                    from_user_id, to_user_id = (user_id, friend_id) if rng.random() < 0.5 else (friend_id, user_id)
+                    self.friend_requests.add(from_user_id, to_user_id, created_at, created_at, None, "accepted")
+
+            if index == 0:
+                continue
+
+            # requests and blocks go to popular users more often too, never to a friend or twice to the same user
+            taken = set(friend_ids)
+            for kind, mean in (("pending", self.pending_per_user), ("rejected", self.rejected_per_user), ("blocked", self.blocks_per_user)):
+                for _ in range(self.sample_count(mean)):
+                    other_id = rng.choice(endpoints) if endpoints else user_ids[rng.randrange(index)]
+                    if other_id == user_id or other_id in taken:
+                        continue
+                    taken.add(other_id)
+
+                    from_user_id, to_user_id = (user_id, other_id) if rng.random() < 0.5 else (other_id, user_id)
+                    if kind == "blocked":
+                        self.blocked_users.add(from_user_id, to_user_id, created_at, created_at)
+                    elif kind == "rejected":
+                        self.friend_requests.add(from_user_id, to_user_id, created_at, created_at, created_at, "rejected")
+                    else:
+                        requested_at = self.now - (self.now - created_at) * rng.random()
+                        self.friend_requests.add(from_user_id, to_user_id, requested_at, requested_at, None, "pending")
+
+    def seed_logs(self, user_ids):
+        rng = self.random
+        span = datetime.timedelta(days=self.log_days)
+        for _ in range(self.log_count):
+            action, method = rng.choice(LOG_ACTIONS)
+            started_at = self.now - span * rng.random()
+            completed_at = started_at + datetime.timedelta(milliseconds=rng.lognormvariate(3, 0.8))
+            self.logs.add(
+                rng.choice(user_ids), action, method, '""', "{}", rng.choice((200, 200, 200, 200, 201, 400, 404)),
+                started_at, completed_at, f"10.0.{rng.randrange(256)}.{rng.randrange(1, 255)}",
+            )
+
+    def reset_sequences(self):
+        """
+        Move the id sequences past the explicit ids written above (a no-op on SQLite).
+        """
+        statements = self.connection.ops.sequence_reset_sql(no_style(), [writer.model for writer in self.writers])
+        with self.connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
@@ -1,11 +1,50 @@
 # serializers
+from django.conf import settings
 from rest_framework import serializers
-from accounts.serializers import UserSerializer
-from .models import FriendRequest
+from accounts.models import CustomUser
+from accounts.serializers import UserSerializer, create_relationship_list_serializer
+from social_network.fieldsets import SparseFieldsetMixin
+from .models import FriendRequest, FriendshipChange
 
-class FriendRequestSerializer(serializers.ModelSerializer):
+class FriendRequestSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     to_user = UserSerializer()
 
     class Meta:
         model = FriendRequest
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+        list_serializer_class = create_relationship_list_serializer('to_user')
+
+
+class FriendshipChangeSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = FriendshipChange
+        fields = ('id', 'collection', 'action', 'object_id', 'created_at')
+
+
+class ChangeFeedQuerySerializer(serializers.Serializer):
+    since = serializers.IntegerField(min_value=0, required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=settings.FRIENDSHIP_CHANGES['MAX_PAGE_SIZE'],
+                                     default=settings.FRIENDSHIP_CHANGES['PAGE_SIZE'])
+
+
+class FriendSuggestionSerializer(serializers.ModelSerializer):
+    mutual_friends = serializers.IntegerField(source='suggestion.mutual_friends')
+    jaccard = serializers.FloatField(source='suggestion.jaccard')
+    adamic_adar = serializers.FloatField(source='suggestion.adamic_adar')
+
+    class Meta:
+        model = CustomUser
+        fields = ('id', 'first_name', 'last_name', 'mutual_friends', 'jaccard', 'adamic_adar')
+
+
+class BulkFriendRequestSendSerializer(serializers.Serializer):
+    to_user_ids = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False, max_length=settings.FRIEND_REQUEST_BATCH_LIMIT
+    )
+
+
+class BulkFriendRequestUpdateSerializer(serializers.Serializer):
+    friend_request_ids = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False, max_length=settings.FRIEND_REQUEST_BATCH_LIMIT
+    )
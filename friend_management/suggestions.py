@@ -0,0 +1,171 @@
+import math
+from collections import Counter
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models
+
+from accounts.blocklist import BlocklistManager
+from friend_management.cache import FriendsSuggestionRefreshQueue, SuggestionRefreshQueue
+from friend_management.models import Friend, FriendRequest
+from friend_management.utils import FriendshipManager
+
+
+class FriendSuggestionEngine:
+    """
+    "People you may know": non-friends ranked by how many friends they share with the user.
+
+    Suggestions are precomputed per user and cached. Friendship changes, friend requests
+    and blocks only push the affected users onto SuggestionRefreshQueue (and users whose
+    friendships changed onto FriendsSuggestionRefreshQueue, for their friends), and the
+    refresh_friend_suggestions command rebuilds them in the background, leaving out blocked
+    users and pending requests. Reads only filter out anyone who became a friend or got
+    blocked since the last rebuild, from the cached friend and blocklist sets.
+    """
+
+    suggestions_cache_key = "friend_suggestions_{user_id}"
+    suggestions_cache_timeout = 60 * 60 * 24
+
+    SCORES = ('mutual_friends', 'jaccard', 'adamic_adar')
+
+    # only the best candidates by mutual friends get the more expensive scores
+    candidate_pool_factor = 5
+
+    chunk_size = 1000
+
+    @classmethod
+    def get_suggestions(cls, user_id, score='mutual_friends'):
+        """
+        Return up to FRIEND_SUGGESTIONS_LIMIT suggestions as dicts with the user id and each score,
+        best first by the given score. Users without precomputed suggestions get none until
+        the refresh job has built them.
+        """
+        suggestions = cache.get(cls.suggestions_cache_key.format(user_id=user_id))
+        if suggestions is None:
+            SuggestionRefreshQueue.push([user_id])
+            return []
+
+        candidate_ids = [suggestion['user_id'] for suggestion in suggestions]
+        excluded_ids = FriendshipManager.filter_friend_ids(user_id, candidate_ids) | \
+            BlocklistManager.filter_blocking_ids(user_id, candidate_ids) | \
+            BlocklistManager.get_blocked_by_ids(user_id)
+
+        suggestions = [suggestion for suggestion in suggestions if suggestion['user_id'] not in excluded_ids]
+        return sorted(suggestions, key=lambda suggestion: (-suggestion[score], suggestion['user_id']))
+
+    @classmethod
+    def refresh(cls, user_id):
+        suggestions = cls.compute(user_id)
+        cache.set(cls.suggestions_cache_key.format(user_id=user_id), suggestions, cls.suggestions_cache_timeout)
+        return suggestions
+
+    @classmethod
+    def refresh_pending(cls, count):
+        """
+        Rebuild suggestions for up to `count` users from the refresh queue. Returns the ids refreshed.
+        """
+        # the friends of users whose friendships changed, looked up for the whole batch at once
+        changed_ids = FriendsSuggestionRefreshQueue.pop(count)
+        if changed_ids:
+            SuggestionRefreshQueue.push(cls.get_friend_ids_of(changed_ids))
+
+        user_ids = SuggestionRefreshQueue.pop(count)
+        for user_id in user_ids:
+            cls.refresh(user_id)
+        return user_ids
+
+    @classmethod
+    def compute(cls, user_id):
+        friend_ids = FriendshipManager.get_friend_ids(user_id)
+        if not friend_ids:
+            return []
+
+        # friends of each of the user's friends, from one pass over their edges
+        neighbours = {friend_id: set() for friend_id in friend_ids}
+        for chunk in cls._chunks(friend_ids):
+            edges = Friend.objects.filter(models.Q(user_id__in=chunk) | models.Q(friend_id__in=chunk))\
+                .values_list('user_id', 'friend_id')
+            for left, right in edges:
+                if left in neighbours:
+                    neighbours[left].add(right)
+                if right in neighbours:
+                    neighbours[right].add(left)
+
+        excluded_ids = friend_ids | cls.get_excluded_ids(user_id) | {user_id}
+
+        mutual_friends = Counter()
+        adamic_adar = Counter()
+        for friend_neighbours in neighbours.values():
+            candidates = friend_neighbours - excluded_ids
+            if not candidates:
+                continue
+            mutual_friends.update(candidates)
+            # the friend has at least two neighbours here: the user and a candidate
+            weight = 1 / math.log(len(friend_neighbours))
+            adamic_adar.update(dict.fromkeys(candidates, weight))
+
+        limit = settings.FRIEND_SUGGESTIONS_LIMIT
+        pool = [candidate_id for candidate_id, _ in mutual_friends.most_common(limit * cls.candidate_pool_factor)]
+        degrees = cls.get_degrees(pool)
+
+        suggestions = [
+            {
+                'user_id': candidate_id,
+                'mutual_friends': mutual_friends[candidate_id],
+                'jaccard': mutual_friends[candidate_id] / (len(friend_ids) + degrees.get(candidate_id, 0) - mutual_friends[candidate_id]),
+                'adamic_adar': adamic_adar[candidate_id],
+            }
+            for candidate_id in pool
+        ]
+        suggestions.sort(key=lambda suggestion: (-suggestion['mutual_friends'], -suggestion['adamic_adar'], suggestion['user_id']))
+        return suggestions[:limit]
+
+    @classmethod
+    def get_excluded_ids(cls, user_id):
+        """
+        Users blocked in either direction or with a pending request in either direction.
+        """
+        blocked_user_model = apps.get_model('accounts', 'BlockedUser')
+        excluded_ids = set()
+        for left, right in blocked_user_model.objects.filter(models.Q(user_id=user_id) | models.Q(blocked_user_id=user_id))\
+                .values_list('user_id', 'blocked_user_id'):
+            excluded_ids.update((left, right))
+        for left, right in FriendRequest.objects.filter(status="pending")\
+                .filter(models.Q(from_user_id=user_id) | models.Q(to_user_id=user_id))\
+                .values_list('from_user_id', 'to_user_id'):
+            excluded_ids.update((left, right))
+        excluded_ids.discard(user_id)
+        return excluded_ids
+
+    @classmethod
+    def get_friend_ids_of(cls, user_ids):
+        """
+        Ids of the friends of any of the given users.
+        """
+        friend_ids = set()
+        for chunk in cls._chunks(user_ids):
+            for left, right in Friend.objects.filter(models.Q(user_id__in=chunk) | models.Q(friend_id__in=chunk))\
+                    .values_list('user_id', 'friend_id'):
+                friend_ids.update((left, right))
+        return friend_ids - set(user_ids)
+
+    @classmethod
+    def get_degrees(cls, user_ids):
+        """
+        Number of friends of each of the given users.
+        """
+        degrees = Counter()
+        for chunk in cls._chunks(user_ids):
+            for column in ('user_id', 'friend_id'):
+                degrees.update(dict(
+                    Friend.objects.filter(**{f'{column}__in': chunk}).values(column)
+                    .annotate(count=models.Count('id')).values_list(column, 'count')
+                ))
+        return degrees
+
+    @classmethod
+    def _chunks(cls, ids):
+        ids = list(ids)
+        for start in range(0, len(ids), cls.chunk_size):
+            yield ids[start:start + cls.chunk_size]
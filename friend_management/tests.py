@@ -0,0 +1,1029 @@
+import base64
+import json
+import time
+from collections import Counter
+from io import StringIO
+from unittest import mock
+from urllib.parse import urlencode
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.http import QueryDict
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import path
+from django.utils import timezone
+from prometheus_client import REGISTRY
+
+from accounts.async_views import AsyncUserSearchView
+from accounts.blocklist import BlocklistManager
+from accounts.models import BlockedUser, CustomUser
+from logging_management.models import Log
+from social_network.testing import LOCMEM_CACHES, BaseTestCase, RedisTestCase
+from social_network.throttling import MeteredScopedRateThrottle
+
+from .async_views import AsyncFriendListView, AsyncFriendRequestListView
+from .cache import FriendAdjacencyCache, LocalCache, RecomputeLock, UserCacheVersions, get_redis_client
+from .cache import FriendsSuggestionRefreshQueue, SuggestionRefreshQueue
+from .changes import ChangeFeed
+from .models import Friend, FriendRequest, FriendshipChange, FriendshipChangePruning
+from .suggestions import FriendSuggestionEngine
+from .utils import FriendshipManager
+from .views import FriendListView
+
+
+class FriendshipTests(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.alice = self.create_user('alice@example.com')
+        self.bob = self.create_user('bob@example.com')
+
+    def test_friendship_is_stored_once_as_a_canonical_pair(self):
+        self.assertTrue(FriendshipManager.add_friend(self.bob, self.alice))
+
+        friend = Friend.objects.get()
+        self.assertEqual((friend.user_id, friend.friend_id), (self.alice.id, self.bob.id))
+        self.assertTrue(FriendshipManager.are_friends(self.alice, self.bob))
+        self.assertTrue(FriendshipManager.are_friends(self.bob, self.alice))
+        self.assertEqual(FriendshipManager.get_friend_ids(self.alice.id), {self.bob.id})
+        self.assertEqual(FriendshipManager.get_friend_ids(self.bob.id), {self.alice.id})
+
+    def test_adding_a_friendship_twice_or_with_oneself_fails(self):
+        self.assertTrue(FriendshipManager.add_friend(self.alice, self.bob))
+
+        self.assertFalse(FriendshipManager.add_friend(self.bob, self.alice))
+        self.assertFalse(FriendshipManager.add_friend(self.alice, self.alice))
+        self.assertEqual(Friend.objects.count(), 1)
+
+    def test_reversed_pairs_are_rejected_by_the_database(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Friend.objects.create(user_id=self.bob.id, friend_id=self.alice.id)
+
+    def test_remove_friend(self):
+        FriendshipManager.add_friend(self.alice, self.bob)
+
+        self.assertTrue(FriendshipManager.remove_friend(self.bob, self.alice))
+        self.assertFalse(FriendshipManager.remove_friend(self.bob, self.alice))
+        self.assertFalse(FriendshipManager.are_friends(self.alice, self.bob))
+        self.assertEqual(FriendshipManager.get_friend_ids(self.alice.id), set())
+
+
+class FriendAdjacencyCacheTests(RedisTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.alice, self.bob, self.carol = (
+            self.create_user(f'{name}@example.com') for name in ('alice', 'bob', 'carol')
+        )
+
+    def get_members(self, user_id):
+        return set(get_redis_client().smembers(cache.make_key(FriendAdjacencyCache.cache_key(user_id))))
+
+    def test_friend_ids_are_cached_as_a_redis_set(self):
+        FriendshipManager.add_friend(self.alice, self.bob)
+        FriendshipManager.add_friend(self.alice, self.carol)
+
+        self.assertEqual(FriendshipManager.get_friend_ids(self.alice.id), {self.bob.id, self.carol.id})
+        self.assertEqual(self.get_members(self.alice.id), {b'0', str(self.bob.id).encode(), str(self.carol.id).encode()})
+
+        with self.assertNumQueries(0):
+            self.assertEqual(FriendshipManager.get_friend_ids(self.alice.id), {self.bob.id, self.carol.id})
+            self.assertEqual(FriendshipManager.filter_friend_ids(self.alice.id, [self.bob.id, 999]), {self.bob.id})
+            self.assertTrue(FriendshipManager.are_friends(self.alice, self.carol))
+
+    def test_an_empty_set_is_cached_too(self):
+        self.assertEqual(FriendshipManager.get_friend_ids(self.alice.id), set())
+
+        with self.assertNumQueries(0):
+            self.assertEqual(FriendshipManager.get_friend_ids(self.alice.id), set())
+            self.assertFalse(FriendshipManager.are_friends(self.alice, self.bob))
+
+    def test_cached_sets_are_updated_in_place(self):
+        FriendshipManager.get_friend_ids(self.alice.id)
+        FriendshipManager.add_friend(self.alice, self.bob)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(FriendshipManager.get_friend_ids(self.alice.id), {self.bob.id})
+
+        FriendshipManager.remove_friend(self.bob, self.alice)
+        with self.assertNumQueries(0):
+            self.assertEqual(FriendshipManager.get_friend_ids(self.alice.id), set())
+
+    def test_updates_do_not_create_partial_sets(self):
+        FriendAdjacencyCache.add([(self.alice.id, self.bob.id)])
+
+        self.assertEqual(self.get_members(self.alice.id), set())
+        self.assertIsNone(FriendAdjacencyCache.contains(self.alice.id, self.bob.id))
+        self.assertIsNone(FriendAdjacencyCache.contains_many(self.alice.id, [self.bob.id]))
+
+    def test_a_set_built_before_a_write_is_not_stored(self):
+        stamp = FriendAdjacencyCache.get_stamp(self.alice.id)
+        FriendAdjacencyCache.add([(self.alice.id, self.bob.id)])
+        FriendAdjacencyCache.store(self.alice.id, set(), stamp)
+
+        self.assertIsNone(FriendAdjacencyCache.get(self.alice.id))
+
+        FriendAdjacencyCache.store(self.alice.id, {self.bob.id}, FriendAdjacencyCache.get_stamp(self.alice.id))
+        self.assertEqual(FriendAdjacencyCache.get(self.alice.id), {self.bob.id})
+
+
+def get_or_load(user_id, key_template, load):
+    """
+    The "friends" payload under key_template, rebuilt from load() the way callers of
+    UserCacheVersions.read() and store() do.
+    """
+    version, value, lock = UserCacheVersions.read(user_id, "friends", key_template)
+    if lock is not None:
+        value = load()
+        UserCacheVersions.store(user_id, "friends", key_template, version, value, 60, 0, lock)
+    elif value is None:
+        value = load()
+    return value
+
+
+class UserCacheVersionsTests(BaseTestCase):
+    PAYLOAD_KEY = "test_payload_{user_id}_{version}"
+
+    def setUp(self):
+        super().setUp()
+        self.alice = self.create_user('alice@example.com')
+        self.bob = self.create_user('bob@example.com')
+
+    def test_missing_versions_start_from_the_time(self):
+        started_at = time.time_ns() // 1000
+
+        versions = UserCacheVersions.get_versions([self.alice.id, self.bob.id], "friends")
+
+        self.assertEqual(set(versions), {self.alice.id, self.bob.id})
+        for version in versions.values():
+            self.assertGreaterEqual(int(version), started_at)
+        self.assertEqual(UserCacheVersions.get_versions([self.alice.id, self.bob.id], "friends"), versions)
+        self.assertEqual(UserCacheVersions.get_version(self.alice.id, "friends"), versions[self.alice.id])
+        self.assertEqual(async_to_sync(UserCacheVersions.aget_version)(self.alice.id, "friends"), versions[self.alice.id])
+
+    def test_incr_bumps_the_version(self):
+        before = UserCacheVersions.get_versions([self.alice.id, self.bob.id], "friends")
+
+        UserCacheVersions.incr_many([self.alice.id, self.bob.id], "friends")
+        UserCacheVersions.incr(self.alice.id, "friends")
+
+        after = UserCacheVersions.get_versions([self.alice.id, self.bob.id], "friends")
+        self.assertEqual(int(after[self.alice.id]), int(before[self.alice.id]) + 2)
+        self.assertEqual(int(after[self.bob.id]), int(before[self.bob.id]) + 1)
+        # versions are per cache type
+        UserCacheVersions.incr(self.alice.id, "friend_requests")
+        self.assertEqual(UserCacheVersions.get_version(self.alice.id, "friends"), after[self.alice.id])
+
+    def test_incr_starts_a_missing_version(self):
+        started_at = time.time_ns() // 1000
+
+        UserCacheVersions.incr(self.alice.id, "friends")
+
+        self.assertGreaterEqual(int(UserCacheVersions.get_version(self.alice.id, "friends")), started_at)
+
+    def test_a_lost_version_does_not_go_back(self):
+        version = UserCacheVersions.get_version(self.alice.id, "friends")
+        UserCacheVersions.incr(self.alice.id, "friends")
+        cache.delete(UserCacheVersions.version_key(self.alice.id, "friends"))
+        time.sleep(0.01)
+
+        self.assertGreater(int(UserCacheVersions.get_version(self.alice.id, "friends")), int(version) + 1)
+
+    def test_writes_bump_the_versions_of_both_users(self):
+        friends = FriendshipManager.get_user_cache_versions([self.alice.id, self.bob.id])
+        requests = FriendshipManager.get_user_cache_version(self.bob.id, "friend_requests")
+
+        FriendshipManager.send_friend_request(self.alice, self.bob)
+        self.assertNotEqual(FriendshipManager.get_user_cache_version(self.bob.id, "friend_requests"), requests)
+
+        FriendshipManager.accept_friend_request(FriendRequest.objects.get())
+        for user_id, version in FriendshipManager.get_user_cache_versions([self.alice.id, self.bob.id]).items():
+            self.assertNotEqual(version, friends[user_id])
+
+    def get_or_load(self, load):
+        return get_or_load(self.alice.id, self.PAYLOAD_KEY, load)
+
+    def test_payloads_are_cached_per_version(self):
+        load = mock.Mock(return_value=['bob'])
+        self.assertEqual(self.get_or_load(load), ['bob'])
+        self.assertEqual(self.get_or_load(load), ['bob'])
+        self.assertEqual(load.call_count, 1)
+
+        UserCacheVersions.incr(self.alice.id, "friends")
+        load.return_value = ['bob', 'carol']
+        self.assertEqual(self.get_or_load(load), ['bob', 'carol'])
+        self.assertEqual(load.call_count, 2)
+
+        version, value, lock = async_to_sync(UserCacheVersions.aread)(self.alice.id, "friends", self.PAYLOAD_KEY)
+        self.assertEqual((version, value, lock), (UserCacheVersions.get_version(self.alice.id, "friends"), ['bob', 'carol'], None))
+
+    def hold_lock(self):
+        """
+        Take the rebuild lock of the current version, as another request would.
+        """
+        version = UserCacheVersions.get_version(self.alice.id, "friends")
+        lock = RecomputeLock(UserCacheVersions.lock_key(self.PAYLOAD_KEY, self.alice.id, version))
+        self.assertTrue(lock.acquire())
+        self.addCleanup(lock.release)
+        return lock
+
+    def test_a_missing_payload_is_built_by_the_lock_holder(self):
+        self.hold_lock()
+        version = UserCacheVersions.get_version(self.alice.id, "friends")
+
+        def wait_for(read):
+            cache.set(UserCacheVersions.payload_key(self.PAYLOAD_KEY, self.alice.id, version), ['bob'], 60)
+            return read()
+
+        load = mock.Mock()
+        with mock.patch('friend_management.cache.wait_for', side_effect=wait_for):
+            self.assertEqual(self.get_or_load(load), ['bob'])
+        load.assert_not_called()
+
+    @override_settings(CACHE_RECOMPUTE=dict(settings.CACHE_RECOMPUTE, WAIT_TIMEOUT=0.05, WAIT_INTERVAL=0.01))
+    def test_the_payload_of_an_older_version_is_never_served(self):
+        self.get_or_load(lambda: ['bob'])
+        UserCacheVersions.incr(self.alice.id, "friends")
+        self.hold_lock()
+
+        # the lock holder never stores it, so the waiter ends up building it itself
+        self.assertEqual(self.get_or_load(lambda: ['bob', 'carol']), ['bob', 'carol'])
+
+    def test_a_payload_built_across_a_bump_is_not_stored(self):
+        version, value, lock = UserCacheVersions.read(self.alice.id, "friends", self.PAYLOAD_KEY)
+        self.assertIsNone(value)
+        UserCacheVersions.incr(self.alice.id, "friends")
+
+        self.assertFalse(UserCacheVersions.store(self.alice.id, "friends", self.PAYLOAD_KEY, version, ['bob'], 60, 0, lock))
+        self.assertIsNone(cache.get(UserCacheVersions.payload_key(self.PAYLOAD_KEY, self.alice.id, version)))
+        # and the lock is released
+        self.assertTrue(RecomputeLock(lock.key).acquire())
+
+    def test_a_waiter_takes_over_a_rebuild_given_up_by_its_holder(self):
+        holder = self.hold_lock()
+
+        def wait_for(read):
+            holder.release()
+            return read()
+
+        with mock.patch('friend_management.cache.wait_for', side_effect=wait_for):
+            version, value, lock = UserCacheVersions.read(self.alice.id, "friends", self.PAYLOAD_KEY)
+        self.assertIsNone(value)
+        self.assertEqual(lock.key, UserCacheVersions.lock_key(self.PAYLOAD_KEY, self.alice.id, version))
+        self.assertTrue(UserCacheVersions.store(self.alice.id, "friends", self.PAYLOAD_KEY, version, ['bob'], 60, 0, lock))
+        self.assertEqual(self.get_or_load(mock.Mock()), ['bob'])
+
+
+class RedisUserCacheVersionsTests(RedisTestCase, UserCacheVersionsTests):
+
+    def test_payloads_are_refreshed_early(self):
+        self.get_or_load(lambda: ['bob'])
+
+        with mock.patch('friend_management.cache.refresh_early', return_value=True):
+            lock = self.hold_lock()
+            # being refreshed by another request, so still served
+            self.assertEqual(self.get_or_load(lambda: ['bob', 'carol']), ['bob'])
+            lock.release()
+
+            self.assertEqual(self.get_or_load(lambda: ['bob', 'carol']), ['bob', 'carol'])
+        self.assertEqual(self.get_or_load(mock.Mock()), ['bob', 'carol'])
+
+
+@override_settings(LOCAL_CACHE=dict(settings.LOCAL_CACHE, ENABLED=True))
+class LocalCacheTests(RedisTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.alice = self.create_user('alice@example.com')
+        self.bob = self.create_user('bob@example.com')
+
+        # a fresh cache per test, without the listener thread
+        self.local_cache = LocalCache()
+        for patcher in (
+            mock.patch('friend_management.cache.local_cache', self.local_cache),
+            mock.patch.object(LocalCache, '_start_listener'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_values_are_served_from_the_process(self):
+        # built, then read back from Redis into the process
+        FriendshipManager.get_friend_ids(self.alice.id)
+        FriendshipManager.get_friend_ids(self.alice.id)
+        # changed behind the cache's back, so only a read from Redis would see it
+        get_redis_client().sadd(cache.make_key(FriendAdjacencyCache.cache_key(self.alice.id)), self.bob.id)
+
+        labels = {'family': 'friends_cache', 'tier': 'local', 'result': 'hit'}
+        hits = REGISTRY.get_sample_value('cache_lookups_total', labels) or 0
+        self.assertEqual(FriendshipManager.get_friend_ids(self.alice.id), set())
+        self.assertEqual(REGISTRY.get_sample_value('cache_lookups_total', labels), hits + 1)
+
+    def test_writes_invalidate_the_values(self):
+        FriendshipManager.get_friend_ids(self.alice.id)
+        FriendshipManager.get_friend_ids(self.alice.id)
+        self.assertEqual(self.local_cache.get('friends_cache', FriendAdjacencyCache.cache_key(self.alice.id)), frozenset())
+        version = UserCacheVersions.get_version(self.alice.id, "friends")
+        self.local_cache.set(UserCacheVersions.version_key(self.alice.id, "friends"), (version, []), self.local_cache.epoch())
+
+        FriendshipManager.add_friend(self.alice, self.bob)
+
+        self.assertIsNone(self.local_cache.get('friends', UserCacheVersions.version_key(self.alice.id, "friends")))
+        self.assertEqual(FriendshipManager.get_friend_ids(self.alice.id), {self.bob.id})
+
+    def test_versioned_payloads_are_kept_apart(self):
+        for key_template, value in (("first_{user_id}_{version}", 1), ("second_{user_id}_{version}", 2)):
+            # built, then read back from Redis into the process
+            for _ in range(2):
+                get_or_load(self.alice.id, key_template, lambda: value)
+
+        values = [
+            get_or_load(self.alice.id, key_template, mock.Mock())
+            for key_template in ("first_{user_id}_{version}", "second_{user_id}_{version}")
+        ]
+        self.assertEqual(values, [1, 2])
+
+        UserCacheVersions.incr(self.alice.id, "friends")
+        self.assertEqual(get_or_load(self.alice.id, "first_{user_id}_{version}", lambda: 3), 3)
+
+    def test_pages_are_served_from_the_process(self):
+        client = self.get_client(self.alice)
+        # built, then read back from Redis into the process
+        for path in ('/friends/', '/friends/', '/friend_requests/', '/friend_requests/'):
+            self.assertEqual(client.get(path).status_code, 200)
+
+        with mock.patch.object(get_redis_client(), 'execute_command', side_effect=AssertionError("Redis was called")):
+            for path in ('/friends/', '/friend_requests/'):
+                response = client.get(path)
+                self.assertEqual((response.status_code, response.json()['results']), (200, []))
+                self.assertEqual(client.get(path, headers={'If-None-Match': response['ETag']}).status_code, 304)
+
+        # the bumps drop them
+        FriendshipManager.send_friend_request(self.bob, self.alice)
+        self.assertEqual(len(client.get('/friend_requests/').json()['results']), 1)
+        FriendshipManager.accept_friend_request(FriendRequest.objects.get())
+        self.assertEqual([user['id'] for user in client.get('/friends/').json()['results']], [self.bob.id])
+
+    def test_invalidations_are_published(self):
+        pubsub = get_redis_client().pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(LocalCache.channel())
+        self.addCleanup(pubsub.close)
+
+        self.local_cache.invalidate(['key'])
+
+        pubsub.get_message(timeout=1)  # the subscription
+        message = pubsub.get_message(timeout=1)
+        self.assertEqual(json.loads(message['data']), ['key'])
+
+    def test_a_value_read_before_an_invalidation_is_not_stored(self):
+        epoch = self.local_cache.epoch()
+        self.local_cache.discard(['key'])
+
+        self.local_cache.set('key', 'old', epoch)
+        self.assertIsNone(self.local_cache.get('family', 'key'))
+
+        self.local_cache.set('key', 'new', self.local_cache.epoch())
+        self.assertEqual(self.local_cache.get('family', 'key'), 'new')
+
+    def test_least_recently_used_values_are_evicted(self):
+        with override_settings(LOCAL_CACHE=dict(settings.LOCAL_CACHE, MAX_ENTRIES=2)):
+            for key in ('a', 'b'):
+                self.local_cache.set(key, key, self.local_cache.epoch())
+            self.local_cache.get('family', 'a')
+            self.local_cache.set('c', 'c', self.local_cache.epoch())
+
+            self.assertEqual([self.local_cache.get('family', key) for key in 'abc'], ['a', None, 'c'])
+
+    def test_values_expire(self):
+        with override_settings(LOCAL_CACHE=dict(settings.LOCAL_CACHE, TIMEOUT=0)):
+            self.local_cache.set('key', 'value', self.local_cache.epoch())
+
+            self.assertIsNone(self.local_cache.get('family', 'key'))
+
+    def test_disabled_without_redis(self):
+        with override_settings(CACHES=LOCMEM_CACHES):
+            self.local_cache.set('key', 'value', self.local_cache.epoch())
+
+            self.assertIsNone(self.local_cache.get('family', 'key'))
+
+
+class BulkFriendRequestTests(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.alice, self.bob, self.carol, self.dave = (
+            self.create_user(f'{name}@example.com') for name in ('alice', 'bob', 'carol', 'dave')
+        )
+
+    def get_statuses(self, response, id_field):
+        self.assertEqual(response.status_code, 200)
+        return {item[id_field]: item['status'] for item in response.json()['results']}
+
+    def test_send_reports_a_status_per_user(self):
+        FriendshipManager.add_friend(self.alice, self.bob)
+        BlocklistManager.block(self.dave.id, self.alice.id)
+
+        rates = dict(MeteredScopedRateThrottle.THROTTLE_RATES, friend_requests='10/minute')
+        with mock.patch.object(MeteredScopedRateThrottle, 'THROTTLE_RATES', rates):
+            response = self.get_client(self.alice).post('/send_friend_requests/', {
+                'to_user_ids': [self.alice.id, self.bob.id, self.carol.id, self.dave.id, 999, self.carol.id],
+            }, format='json')
+
+        self.assertEqual(self.get_statuses(response, 'to_user_id'), {
+            self.alice.id: 'self', self.bob.id: 'already_friends', self.carol.id: 'sent',
+            self.dave.id: 'blocked', 999: 'not_found',
+        })
+        self.assertEqual(list(FriendRequest.objects.values_list('from_user_id', 'to_user_id')), [(self.alice.id, self.carol.id)])
+
+    def test_accept_and_reject_report_a_status_per_request(self):
+        to_alice = [FriendRequest.objects.create(from_user=user, to_user=self.alice) for user in (self.bob, self.carol)]
+        to_bob = FriendRequest.objects.create(from_user=self.dave, to_user=self.bob)
+        client = self.get_client(self.alice)
+
+        response = client.post('/accept_friend_requests/', {'friend_request_ids': [to_alice[0].id, to_bob.id, 999]}, format='json')
+        self.assertEqual(self.get_statuses(response, 'friend_request_id'), {
+            to_alice[0].id: 'accepted', to_bob.id: 'unauthorized', 999: 'not_found',
+        })
+        self.assertTrue(FriendshipManager.are_friends(self.alice, self.bob))
+
+        response = client.post('/reject_friend_requests/', {'friend_request_ids': [to_alice[0].id, to_alice[1].id]}, format='json')
+        self.assertEqual(self.get_statuses(response, 'friend_request_id'), {
+            to_alice[0].id: 'already_accepted', to_alice[1].id: 'rejected',
+        })
+        self.assertEqual(FriendRequest.objects.get(id=to_bob.id).status, 'pending')
+
+    def test_batches_are_validated(self):
+        client = self.get_client(self.alice)
+
+        self.assertEqual(client.post('/send_friend_requests/', {'to_user_ids': []}, format='json').status_code, 400)
+        too_many = list(range(settings.FRIEND_REQUEST_BATCH_LIMIT + 1))
+        self.assertEqual(client.post('/accept_friend_requests/', {'friend_request_ids': too_many}, format='json').status_code, 400)
+
+    def test_bulk_calls_have_their_own_throttle(self):
+        rates = dict(MeteredScopedRateThrottle.THROTTLE_RATES, friend_requests='1/minute', bulk_friend_requests='2/minute')
+        client = self.get_client(self.alice)
+
+        with mock.patch.object(MeteredScopedRateThrottle, 'THROTTLE_RATES', rates):
+            for bulk_path in ('/accept_friend_requests/', '/reject_friend_requests/'):
+                self.assertEqual(client.post(bulk_path, {'friend_request_ids': [1]}, format='json').status_code, 200)
+            self.assertEqual(client.post('/accept_friend_requests/', {'friend_request_ids': [1]}, format='json').status_code, 429)
+
+    def test_bulk_sends_count_every_id_against_the_friend_request_throttle(self):
+        rates = dict(MeteredScopedRateThrottle.THROTTLE_RATES, friend_requests='3/minute', bulk_friend_requests='5/minute')
+        client = self.get_client(self.alice)
+
+        with mock.patch.object(MeteredScopedRateThrottle, 'THROTTLE_RATES', rates):
+            self.assertEqual(client.post('/send_friend_request/', {'to_user_id': self.bob.id}).status_code, 201)
+            response = client.post('/send_friend_requests/', {'to_user_ids': [self.carol.id, self.dave.id, self.bob.id]}, format='json')
+            self.assertEqual(response.status_code, 429)
+            response = client.post('/send_friend_requests/', {'to_user_ids': [self.carol.id, self.dave.id]}, format='json')
+            self.assertEqual(self.get_statuses(response, 'to_user_id'), {self.carol.id: 'sent', self.dave.id: 'sent'})
+            self.assertEqual(client.post('/send_friend_request/', {'to_user_id': self.bob.id}).status_code, 429)
+
+
+class KeysetPaginationTests(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.alice = self.create_user('alice@example.com')
+        self.client = self.get_client(self.alice)
+
+    def read_pages(self, path):
+        """
+        Ids of every page from path, following the next links, and the queries of the last page.
+        """
+        pages = []
+        while path:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(path)
+            self.assertEqual(response.status_code, 200)
+            pages.append([item['id'] for item in response.json()['results']])
+            path = response.json()['next']
+        return pages, queries
+
+    def create_friend_requests(self, count, created_at=None):
+        senders = [self.create_user(f'sender{index}@example.com') for index in range(count)]
+        friend_requests = [FriendRequest.objects.create(from_user=sender, to_user=self.alice) for sender in senders]
+        if created_at is not None:
+            FriendRequest.objects.update(created_at=created_at)
+        return [friend_request.id for friend_request in friend_requests]
+
+    def test_friend_requests_page_through_ties_on_created_at(self):
+        ids = self.create_friend_requests(5, created_at=timezone.now())
+
+        pages, queries = self.read_pages('/friend_requests/?limit=2')
+        self.assertEqual(pages, [ids[0:2], ids[2:4], ids[4:5]])
+
+        pages, _ = self.read_pages('/friend_requests/?limit=2&sort=-created_at')
+        self.assertEqual(pages, [ids[:2:-1], ids[2:0:-1], ids[0:1]])
+
+        # the cursor compares (created_at, id) of the inbox, not a list of cached ids
+        sql = ' '.join(query['sql'] for query in queries)
+        self.assertIn('("friend_management_friendrequest"."created_at", "friend_management_friendrequest"."id") >', sql)
+        self.assertIn('"friend_management_friendrequest"."to_user_id" = %s' % self.alice.id, sql)
+        self.assertNotIn('"friend_management_friendrequest"."id" IN', sql)
+
+    def test_previous_links_go_back_a_page(self):
+        ids = self.create_friend_requests(5, created_at=timezone.now())
+
+        response = self.client.get('/friend_requests/?limit=2')
+        response = self.client.get(response.json()['next'])
+        response = self.client.get(response.json()['next'])
+        self.assertEqual([item['id'] for item in response.json()['results']], ids[4:5])
+
+        response = self.client.get(response.json()['previous'])
+        self.assertEqual([item['id'] for item in response.json()['results']], ids[2:4])
+        response = self.client.get(response.json()['previous'])
+        self.assertEqual([item['id'] for item in response.json()['results']], ids[0:2])
+        self.assertIsNone(response.json()['previous'])
+
+    def test_friend_requests_by_sender_name(self):
+        ids = self.create_friend_requests(3)
+
+        pages, _ = self.read_pages('/friend_requests/?limit=1&sort=-from_user__name')
+        self.assertEqual(pages, [[ids[2]], [ids[1]], [ids[0]]])
+
+    def test_friends_are_paged_from_the_cached_friend_ids(self):
+        lower = [self.create_user(f'lower{index}@example.com') for index in range(2)]
+        self.alice = self.create_user('alice2@example.com')
+        higher = [self.create_user(f'higher{index}@example.com') for index in range(3)]
+        for friend in lower + higher:
+            FriendshipManager.add_friend(self.alice, friend)
+        self.client = self.get_client(self.alice)
+
+        pages, queries = self.read_pages('/friends/?limit=2')
+        self.assertEqual(pages, [[lower[0].id, lower[1].id], [higher[0].id, higher[1].id], [higher[2].id]])
+        # only the page's users are loaded, by id, without reading the friendships
+        sql = ' '.join(query['sql'] for query in queries)
+        self.assertIn('"accounts_customuser"."id" IN (%s)' % higher[2].id, sql)
+        self.assertNotIn('friend_management_friend', sql)
+
+        response = self.client.get('/friends/?limit=2')
+        response = self.client.get(response.json()['next'])
+        response = self.client.get(response.json()['previous'])
+        self.assertEqual([item['id'] for item in response.json()['results']], [lower[0].id, lower[1].id])
+        response = self.client.get(response.json()['next'])
+        self.assertEqual([item['id'] for item in response.json()['results']], [higher[0].id, higher[1].id])
+
+    def test_invalid_cursors_are_not_found(self):
+        self.create_friend_requests(1)
+
+        for position in ('x', '["1"]', '["not a date", "1"]'):
+            cursor = base64.b64encode(urlencode({'p': position}).encode()).decode()
+            self.assertEqual(self.client.get('/friend_requests/', {'cursor': cursor}).status_code, 404)
+
+
+# the async read views, which social_network.urls only routes with ASYNC_READ_VIEWS
+urlpatterns = [
+    path('search/', AsyncUserSearchView.as_view()),
+    path('friend_requests/', AsyncFriendRequestListView.as_view()),
+    path('friends/', AsyncFriendListView.as_view()),
+]
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncKeysetPaginationTests(KeysetPaginationTests):
+    pass
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncReadViewTests(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.alice, self.bob, self.carol = (
+            self.create_user(f'{name}@example.com') for name in ('alice', 'bob', 'carol')
+        )
+        self.client = self.get_client(self.alice)
+
+    def test_friends_with_their_relationships(self):
+        FriendshipManager.add_friend(self.alice, self.bob)
+        BlocklistManager.block(self.alice.id, self.bob.id)
+
+        response = self.client.get('/friends/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(user['id'], user['is_friend'], user['is_blocked']) for user in response.json()['results']],
+            [(self.bob.id, True, True)],
+        )
+
+    def test_sparse_fieldsets_skip_the_relationships(self):
+        FriendshipManager.add_friend(self.alice, self.bob)
+
+        response = self.client.get('/friends/', {'fields': 'id,first_name'})
+
+        self.assertEqual(response.json()['results'], [{'id': self.bob.id, 'first_name': 'bob'}])
+
+    def test_search_hides_who_blocked_the_user(self):
+        BlocklistManager.block(self.carol.id, self.alice.id)
+
+        response = self.client.get('/search/', {'q': 'bob@example.com'})
+        self.assertEqual([user['id'] for user in response.json()['results']], [self.bob.id])
+        self.assertEqual(self.client.get('/search/', {'q': 'carol'}).json()['results'], [])
+
+    def test_errors_are_rendered_like_drf(self):
+        response = self.get_client().get('/friends/')
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('WWW-Authenticate', response)
+
+        response = self.client.get('/friend_requests/', {'sort': 'email'})
+        self.assertEqual((response.status_code, response.json()), (400, {'sort': 'Invalid sort field'}))
+
+        self.alice.role = 'none'
+        self.alice.save()
+        self.assertEqual(self.get_client(self.alice).get('/friends/').status_code, 403)
+
+    def test_throttles_apply(self):
+        rates = dict(MeteredScopedRateThrottle.THROTTLE_RATES, search='1/minute')
+        with mock.patch.object(MeteredScopedRateThrottle, 'THROTTLE_RATES', rates):
+            self.assertEqual(self.client.get('/search/', {'q': 'bob'}).status_code, 200)
+            response = self.client.get('/search/', {'q': 'bob'})
+
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+
+class ConditionalResponseTests(BaseTestCase):
+    friend_list_view = FriendListView
+
+    def setUp(self):
+        super().setUp()
+        self.alice, self.bob, self.carol = (
+            self.create_user(f'{name}@example.com') for name in ('alice', 'bob', 'carol')
+        )
+        FriendshipManager.add_friend(self.alice, self.bob)
+        self.client = self.get_client(self.alice)
+
+    def get(self, path, **headers):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path, headers=headers)
+        self.list_queries = [query['sql'] for query in queries if '"accounts_customuser"."id" IN' in query['sql']]
+        return response
+
+    def friend_ids(self, response):
+        return [user['id'] for user in json.loads(response.content)['results']]
+
+    def test_an_unchanged_page_is_not_modified(self):
+        response = self.get('/friends/')
+        self.assertEqual(self.friend_ids(response), [self.bob.id])
+        etag = response['ETag']
+
+        response = self.get('/friends/', if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.list_queries, [])
+
+    def test_repeated_reads_are_served_from_the_cache(self):
+        content = self.get('/friends/').content
+
+        response = self.get('/friends/')
+        self.assertEqual(response.content, content)
+        self.assertEqual(self.list_queries, [])
+
+    def test_writes_and_parameters_change_the_etag(self):
+        etag = self.get('/friends/')['ETag']
+        self.assertNotEqual(self.get('/friends/?limit=1')['ETag'], etag)
+
+        FriendshipManager.add_friend(self.alice, self.carol)
+        response = self.get('/friends/', if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(sorted(self.friend_ids(response)), sorted([self.bob.id, self.carol.id]))
+
+    def test_a_page_built_during_a_bump_is_not_cached(self):
+        get_friend_ids, aget_friend_ids = FriendshipManager.get_friend_ids, FriendshipManager.aget_friend_ids
+
+        def bumped(user_id):
+            # the write lands while the page is being built
+            FriendshipManager.increment_user_cache_version(user_id)
+            return get_friend_ids(user_id)
+
+        async def abumped(user_id):
+            FriendshipManager.increment_user_cache_version(user_id)
+            return await aget_friend_ids(user_id)
+
+        with mock.patch.object(FriendshipManager, 'get_friend_ids', side_effect=bumped), \
+                mock.patch.object(FriendshipManager, 'aget_friend_ids', side_effect=abumped):
+            response = self.get('/friends/')
+        self.assertEqual(self.friend_ids(response), [self.bob.id])
+        self.assertNotIn('ETag', response)
+
+        self.get('/friends/')
+        self.assertNotEqual(self.list_queries, [])
+
+    def test_a_page_is_rebuilt_by_one_request_at_a_time(self):
+        content = self.get('/friends/').content
+        FriendshipManager.add_friend(self.alice, self.carol)
+        version = FriendshipManager.get_user_cache_version(self.alice.id)
+        digest = self.friend_list_view().get_response_digest(mock.Mock(GET=QueryDict(), user=self.alice), 'application/json')
+        key_template = self.friend_list_view.response_cache_key.format(digest=digest)
+        lock = RecomputeLock(UserCacheVersions.lock_key(key_template, self.alice.id, version))
+        self.assertTrue(lock.acquire())
+
+        def store():
+            # the lock holder stores its page meanwhile
+            UserCacheVersions.store(self.alice.id, "friends", key_template, version, ('application/json', b'{"rebuilt": true}'), 60, 0, lock)
+
+        def wait_for(read):
+            store()
+            return read()
+
+        async def await_for(read):
+            store()
+            return await read()
+
+        with mock.patch('friend_management.cache.wait_for', side_effect=wait_for), \
+                mock.patch('friend_management.cache.await_for', side_effect=await_for):
+            response = self.get('/friends/')
+        self.assertEqual(response.content, b'{"rebuilt": true}')
+        self.assertNotEqual(response.content, content)
+        self.assertEqual(self.list_queries, [])
+
+    def test_a_failed_rebuild_releases_the_lock(self):
+        with mock.patch.object(FriendshipManager, 'get_friend_ids', side_effect=RuntimeError), \
+                mock.patch.object(FriendshipManager, 'aget_friend_ids', side_effect=RuntimeError), \
+                self.assertRaises(RuntimeError):
+            self.get('/friends/')
+
+        # not waited for
+        with mock.patch('friend_management.cache.wait_for', side_effect=AssertionError), \
+                mock.patch('friend_management.cache.await_for', side_effect=AssertionError):
+            self.assertEqual(self.friend_ids(self.get('/friends/')), [self.bob.id])
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncConditionalResponseTests(ConditionalResponseTests):
+    friend_list_view = AsyncFriendListView
+
+
+class RedisConditionalResponseTests(RedisTestCase, ConditionalResponseTests):
+
+    def count_commands(self, path, **headers):
+        """
+        The response for path and the Redis commands run to serve it.
+        """
+        commands = []
+        execute_command = get_redis_client().execute_command
+
+        def record(*args, **kwargs):
+            commands.append(args[0])
+            return execute_command(*args, **kwargs)
+
+        with mock.patch.object(get_redis_client(), 'execute_command', record):
+            response = self.get(path, **headers)
+        return response, commands
+
+    def test_a_cached_page_is_read_with_its_version_in_one_call(self):
+        etag = self.get('/friends/')['ETag']
+
+        response, commands = self.count_commands('/friends/')
+        self.assertEqual((response.status_code, commands), (200, ['EVALSHA']))
+        response, commands = self.count_commands('/friends/', if_none_match=etag)
+        self.assertEqual((response.status_code, commands), (304, ['EVALSHA']))
+
+    def test_a_rebuilt_page_costs_two_calls(self):
+        FriendshipManager.get_friend_ids(self.alice.id)
+        response, commands = self.count_commands('/friends/?fields=id')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('ETag', response)
+        # read with the lock taken, then stored with the version checked and the lock released
+        # (the friend ids are read in a pipeline, not through execute_command())
+        self.assertEqual(commands, ['EVALSHA', 'EVALSHA'])
+
+
+class ChangeFeedTests(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.alice = self.create_user('alice@example.com')
+        self.bob = self.create_user('bob@example.com')
+        self.client = self.get_client(self.alice)
+
+    def add_friend(self, user):
+        with self.captureOnCommitCallbacks(execute=True):
+            FriendshipManager.add_friend(self.alice, user)
+
+    def get_changes(self, since=None, **params):
+        if since is not None:
+            params['since'] = since
+        return self.client.get(f'/changes/?{urlencode(params)}')
+
+    @override_settings(FRIENDSHIP_CHANGES=dict(settings.FRIENDSHIP_CHANGES, SETTLE_SECONDS=0))
+    def test_changes_after_the_cursor(self):
+        cursor = self.get_changes().json()['cursor']
+        self.add_friend(self.bob)
+        self.add_friend(self.create_user('carol@example.com'))
+
+        response = self.get_changes(cursor, limit=1)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['has_more'])
+        self.assertEqual([(change['collection'], change['action'], change['object_id']) for change in response.json()['changes']], [
+            ('friends', 'added', self.bob.id),
+        ])
+
+        response = self.get_changes(response.json()['cursor'])
+        self.assertFalse(response.json()['has_more'])
+        self.assertEqual(len(response.json()['changes']), 1)
+        self.assertEqual(self.get_changes(response.json()['cursor']).json()['changes'], [])
+
+    def test_changes_are_recorded_once_committed(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            FriendshipManager.add_friend(self.alice, self.bob)
+        self.assertFalse(FriendshipChange.objects.exists())
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(FriendshipChange.objects.count(), 2)
+
+    def test_rolled_back_changes_are_not_recorded(self):
+        with self.captureOnCommitCallbacks(execute=True), self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                ChangeFeed.record([(self.alice.id, ChangeFeed.FRIENDS, ChangeFeed.ADDED, self.bob.id)])
+                raise IntegrityError
+
+        self.assertFalse(FriendshipChange.objects.exists())
+
+    def test_unsettled_changes_are_not_served_yet(self):
+        cursor = self.get_changes().json()['cursor']
+        self.add_friend(self.bob)
+
+        response = self.get_changes(cursor)
+        self.assertEqual(response.json(), {'cursor': cursor, 'has_more': False, 'changes': []})
+
+    def test_a_pruned_cursor_expires_even_with_no_change_left(self):
+        cursor = self.get_changes().json()['cursor']
+        self.add_friend(self.bob)
+        FriendshipChange.objects.update(created_at=timezone.now() - timezone.timedelta(days=settings.FRIENDSHIP_CHANGES['RETENTION_DAYS'] + 1))
+
+        out = StringIO()
+        call_command('prune_friendship_changes', stdout=out)
+        self.assertIn("Deleted 2 changes", out.getvalue())
+        self.assertFalse(FriendshipChange.objects.exists())
+
+        self.assertEqual(self.get_changes(cursor).status_code, 410)
+        # a fresh cursor starts after the pruned changes
+        cursor = self.get_changes().json()['cursor']
+        self.assertEqual(self.get_changes(cursor).status_code, 200)
+
+    def test_changes_are_pruned_in_batches(self):
+        for friend in (self.bob, self.create_user('carol@example.com')):
+            self.add_friend(friend)
+        expired_ids = list(FriendshipChange.objects.order_by('id').values_list('id', flat=True))
+        FriendshipChange.objects.update(created_at=timezone.now() - timezone.timedelta(days=settings.FRIENDSHIP_CHANGES['RETENTION_DAYS'] + 1))
+        self.add_friend(self.create_user('dave@example.com'))
+
+        FriendshipChangePruning.objects.create(pk=1)
+        marks = []
+        save = FriendshipChangePruning.save
+
+        def record_mark(pruning, *args, **kwargs):
+            marks.append(pruning.last_pruned_id)
+            return save(pruning, *args, **kwargs)
+
+        with mock.patch.object(FriendshipChangePruning, 'save', record_mark):
+            self.assertEqual(ChangeFeed.prune(batch_size=3), 4)
+
+        self.assertEqual(marks, [expired_ids[2], expired_ids[3]])
+        self.assertEqual(FriendshipChange.objects.count(), 2)
+
+
+class FriendSuggestionTests(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.alice, self.bob, self.carol, self.dave, self.eve = (
+            self.create_user(f'{name}@example.com') for name in ('alice', 'bob', 'carol', 'dave', 'eve')
+        )
+        for left, right in ((self.alice, self.bob), (self.alice, self.carol), (self.bob, self.dave),
+                            (self.carol, self.dave), (self.bob, self.eve)):
+            FriendshipManager.add_friend(left, right)
+
+    def get_suggested_ids(self, score='mutual_friends'):
+        return [suggestion['user_id'] for suggestion in FriendSuggestionEngine.get_suggestions(self.alice.id, score)]
+
+    def test_friends_of_friends_are_ranked_by_mutual_friends(self):
+        FriendSuggestionEngine.refresh_pending(100)
+        suggestions = FriendSuggestionEngine.get_suggestions(self.alice.id)
+
+        self.assertEqual([suggestion['user_id'] for suggestion in suggestions], [self.dave.id, self.eve.id])
+        self.assertEqual([suggestion['mutual_friends'] for suggestion in suggestions], [2, 1])
+        # dave: 2 mutual friends out of alice's 2 and dave's 2
+        self.assertEqual(suggestions[0]['jaccard'], 1.0)
+
+    def test_blocks_are_filtered_out_before_the_suggestions_are_rebuilt(self):
+        FriendSuggestionEngine.refresh(self.alice.id)
+        BlocklistManager.block(self.alice.id, self.dave.id)
+        BlocklistManager.block(self.eve.id, self.alice.id)
+
+        self.assertEqual(self.get_suggested_ids(), [])
+        # from the cached friend and blocklist sets
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_suggested_ids(), [])
+
+    def test_pending_requests_are_left_out_by_the_rebuild(self):
+        FriendSuggestionEngine.refresh(self.alice.id)
+        SuggestionRefreshQueue.pop(100)
+        FriendshipManager.send_friend_request(self.eve, self.alice)
+
+        self.assertEqual(SuggestionRefreshQueue.pop(100), {self.alice.id, self.eve.id})
+        FriendSuggestionEngine.refresh(self.alice.id)
+        self.assertEqual(self.get_suggested_ids(), [self.dave.id])
+
+        FriendshipManager.reject_friend_request(FriendRequest.objects.get())
+        self.assertEqual(SuggestionRefreshQueue.pop(100), {self.alice.id, self.eve.id})
+
+    def test_missing_suggestions_are_queued_rather_than_computed(self):
+        SuggestionRefreshQueue.pop(100)
+        FriendsSuggestionRefreshQueue.pop(100)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_suggested_ids(), [])
+        self.assertEqual(FriendSuggestionEngine.refresh_pending(100), {self.alice.id})
+        self.assertEqual(self.get_suggested_ids(), [self.dave.id, self.eve.id])
+
+    def test_the_refresh_job_also_rebuilds_the_friends_of_changed_users(self):
+        FriendSuggestionEngine.refresh_pending(100)
+
+        with mock.patch.object(FriendshipManager, 'get_friend_ids') as get_friend_ids:
+            FriendshipManager.add_friend(self.dave, self.eve)
+        get_friend_ids.assert_not_called()
+
+        self.assertEqual(FriendSuggestionEngine.refresh_pending(100), {self.bob.id, self.carol.id, self.dave.id, self.eve.id})
+
+    def test_new_friends_are_dropped_before_the_suggestions_are_rebuilt(self):
+        FriendSuggestionEngine.refresh(self.alice.id)
+        SuggestionRefreshQueue.pop(100)
+        FriendshipManager.add_friend(self.alice, self.dave)
+
+        self.assertEqual(self.get_suggested_ids(), [self.eve.id])
+        self.assertIn(self.alice.id, FriendSuggestionEngine.refresh_pending(100))
+
+    def test_users_without_friends_get_no_suggestions(self):
+        frank = self.create_user('frank@example.com')
+        FriendSuggestionEngine.refresh(frank.id)
+
+        self.assertEqual(FriendSuggestionEngine.get_suggestions(frank.id), [])
+
+    def test_suggestions_view(self):
+        FriendSuggestionEngine.refresh(self.alice.id)
+        client = self.get_client(self.alice)
+
+        response = client.get('/friend_suggestions/', {'score': 'adamic_adar'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['id'] for item in response.json()], [self.dave.id, self.eve.id])
+
+        self.assertEqual(client.get('/friend_suggestions/', {'score': 'popularity'}).status_code, 400)
+
+
+class SeedSocialGraphTests(BaseTestCase):
+
+    def seed(self, users=40, **options):
+        call_command('seed_social_graph', users, workers=1, batch_size=7, seed=1, stdout=StringIO(), **options)
+
+    def test_seeds_users_and_a_power_law_graph(self):
+        self.seed(logs=20)
+        self.assertEqual(Log.objects.count(), 20)
+
+        users = list(CustomUser.objects.order_by('id'))
+        self.assertEqual(len(users), 40)
+        self.assertEqual(users[3].email, f'user{users[3].id}@seed.local')
+        self.assertEqual(CustomUser.objects.search_by_email(users[3].email).get(), users[3])
+        self.assertTrue(self.get_client().post('/login/', {'email': users[3].email, 'password': 'password'}).json()['access'])
+
+        degrees = Counter()
+        for user_id, friend_id in Friend.objects.values_list('user_id', 'friend_id'):
+            self.assertLess(user_id, friend_id)
+            degrees.update((user_id, friend_id))
+        self.assertGreater(max(degrees.values()), 2 * 5)
+
+        statuses = set(FriendRequest.objects.values_list('status', flat=True))
+        self.assertEqual(statuses, {'pending', 'accepted', 'rejected'})
+        self.assertTrue(BlockedUser.objects.exists())
+
+        # the sequences continue after the explicit ids
+        self.assertGreater(self.create_user('new@example.com').id, users[-1].id)
+
+    def test_pairs_are_never_requested_or_blocked_twice(self):
+        self.seed(pending_per_user=3, rejected_per_user=2, blocks_per_user=1)
+
+        pairs = [
+            frozenset(pair) for pair in
+            FriendRequest.objects.exclude(status='accepted').values_list('from_user_id', 'to_user_id')
+        ]
+        pairs += [frozenset(pair) for pair in BlockedUser.objects.values_list('user_id', 'blocked_user_id')]
+        self.assertEqual(len(pairs), len(set(pairs)))
+        friends = {frozenset(pair) for pair in Friend.objects.values_list('user_id', 'friend_id')}
+        self.assertFalse(friends & set(pairs))
+
+    def test_skip_passwords_leaves_them_unusable(self):
+        self.seed(users=3, skip_passwords=True)
+
+        self.assertFalse(any(user.has_usable_password() for user in CustomUser.objects.all()))
+
+    def test_needs_at_least_one_user(self):
+        with self.assertRaisesMessage(CommandError, "at least 1"):
+            self.seed(users=0)
@@ -1,160 +1,183 @@
 from django.utils import timezone
 from django.apps import apps
-from django.db import models
+from django.db import models, transaction, IntegrityError
 
 from django.conf import settings
 
+from accounts.blocklist import BlocklistManager
+from friend_management.changes import ChangeFeed
+from friend_management.cache import FriendAdjacencyCache, FriendsSuggestionRefreshQueue, SuggestionRefreshQueue, UserCacheVersions
 from friend_management.models import Friend, FriendRequest
-
-from django.core.cache import cache
-
-import pickle
-
-from django.utils.crypto import get_random_string
+from social_network.pagination import KeysetIds
 
 
 class FriendshipManager:
 
-    friends_cache_key = "friends_cache_{user_id}_{version}"
-    friend_requests_cache_key = "friend_requests_cache_{user_id}_{sort}_{version}"
-    friends_cache_timeout = 60 * 60 * 24
-    friend_requests_cache_timeout = 60 * 60 * 24
+    # sort option -> ordering, ending in a unique field so it can be used for keyset pagination
+    friend_request_orderings = {
+        'created_at': ('created_at', 'id'),
+        '-created_at': ('-created_at', '-id'),
+        'from_user__name': ('from_user_name', 'id'),
+        '-from_user__name': ('-from_user_name', '-id'),
+    }
 
     @classmethod
     def get_user_cache_version(cls, user_id, cache_type="friends"):
         """
-        Retrieve or set a cache version (namespace) for the user. 
-        This will help in grouping all cache keys for that user.
+        Cache version (namespace) of the user's cached data of the cache_type.
         """
-        version_key = f"user_cache_version_{user_id}_{cache_type}"
-        version = cache.get(version_key)
-        if version is None:
-            # If no version exists, generate a new one
-            version = get_random_string(8)  # Can use a timestamp or random string
-            cache.set(version_key, version, timeout=None)  # Version doesn't expire
-        return version
+        return UserCacheVersions.get_version(user_id, cache_type)
 
     @classmethod
-    def increment_user_cache_version(self, user_id, cache_type="friends"):
+    def get_user_cache_versions(cls, user_ids, cache_type="friends"):
         """
-        Invalidate all cached data for a user by changing their cache version.
+        {user_id: version} for many users in one cache round-trip.
         """
-        version_key = f"user_cache_version_{user_id}_{cache_type}"
-        new_version = get_random_string(8)
-        cache.set(version_key, new_version, timeout=None)
+        return UserCacheVersions.get_versions(user_ids, cache_type)
 
     @classmethod
-    def get_user_cache_version(cls, user_id, cache_type="friends"):
+    def increment_user_cache_version(cls, user_id, cache_type="friends"):
         """
-        Retrieve or set a cache version (namespace) for the user. 
-        This will help in grouping all cache keys for that user.
+        Invalidate all cached data for a user by incrementing their cache version.
         """
-        version_key = f"user_cache_version_{user_id}_{cache_type}"
-        version = cache.get(version_key)
-        if version is None:
-            # If no version exists, generate a new one
-            version = get_random_string(8)  # Can use a timestamp or random string
-            cache.set(version_key, version, timeout=None)  # Version doesn't expire
-        return version
+        UserCacheVersions.incr(user_id, cache_type)
 
     @classmethod
-    def increment_user_cache_version(self, user_id, cache_type="friends"):
+    def increment_user_cache_versions(cls, user_ids, cache_type="friends"):
         """
-        Invalidate all cached data for a user by changing their cache version.
+        increment_user_cache_version for many users in one cache round-trip.
         """
-        version_key = f"user_cache_version_{user_id}_{cache_type}"
-        new_version = get_random_string(8)
-        cache.set(version_key, new_version, timeout=None)
+        UserCacheVersions.incr_many(user_ids, cache_type)
 
     @classmethod
-    def get_friends(cls, user):
-        version = cls.get_user_cache_version(user.id, "friends")
-        friends_cache_key = cls.friends_cache_key.format(user_id=user.id, version=version)
-        friends = cache.get(friends_cache_key)
-        if friends:
-            return pickle.loads(friends)
-        
-        user_friends = Friend.objects.filter(user=user).values_list('friend', flat=True)
-        user_friend_of = Friend.objects.filter(friend=user).values_list('user', flat=True)
-        combined = list(user_friends) + list(user_friend_of)
+    def get_friend_ids(cls, user_id):
+        return FriendAdjacencyCache.get_or_load(
+            user_id, lambda: {row['friend_id'] for row in cls.get_friend_ids_queryset(user_id)}
+        )
 
-        user_model = apps.get_model('accounts', 'CustomUser')
-        friends = user_model.objects.filter(id__in=combined)
+    @classmethod
+    async def aget_friend_ids(cls, user_id):
+        async def aload():
+            return {row['friend_id'] async for row in cls.get_friend_ids_queryset(user_id)}
 
-        cache.set(friends_cache_key, pickle.dumps(friends), cls.friends_cache_timeout)
+        return await FriendAdjacencyCache.aget_or_load(user_id, aload)
 
-        return friends
-        
     @classmethod
-    def are_friends(cls, user1, user2):
-        user1_friends_cache_key = cls.friends_cache_key.format(user_id=user1.id, version=cls.get_user_cache_version(user1.id, "friends"))
+    async def afilter_friend_ids(cls, user_id, user_ids):
+        friend_ids = await FriendAdjacencyCache.acontains_many(user_id, user_ids)
+        if friend_ids is not None:
+            return friend_ids
 
-        user1_friends = cache.get(user1_friends_cache_key)
-        if user1_friends and user2.id in pickle.loads(user1_friends).values_list('id', flat=True):
-            return True
-        
-        user2_friends_cache_key = cls.friends_cache_key.format(user_id=user2.id, version=cls.get_user_cache_version(user2.id, "friends"))
-        
-        user2_friends = cache.get(user2_friends_cache_key)
-        if user2_friends and user1.id in pickle.loads(user2_friends).values_list('id', flat=True):
-            return True
+        return (await cls.aget_friend_ids(user_id)).intersection(user_ids)
+
+    @classmethod
+    def filter_friend_ids(cls, user_id, user_ids):
+        """
+        Return which of user_ids are friends of user_id, in one cache round-trip when the set is cached.
+        """
+        friend_ids = FriendAdjacencyCache.contains_many(user_id, user_ids)
+        if friend_ids is not None:
+            return friend_ids
+
+        return cls.get_friend_ids(user_id).intersection(user_ids)
+
+    @classmethod
+    def get_friends(cls, user):
+        """
+        The user's friends by id, paginated with id as keyset. A page is picked from the cached
+        friend ids and only its users are loaded, by primary key.
+        """
+        return KeysetIds(apps.get_model('accounts', 'CustomUser').objects.all(), cls.get_friend_ids(user.id))
+
+    @classmethod
+    async def aget_friends(cls, user):
+        return KeysetIds(apps.get_model('accounts', 'CustomUser').objects.all(), await cls.aget_friend_ids(user.id))
+
+    @classmethod
+    def are_friends(cls, user1, user2):
+        is_friend = FriendAdjacencyCache.contains(user1.id, user2.id)
+        if is_friend is not None:
+            return is_friend
         
-        return Friend.objects.filter(models.Q(user=user1, friend=user2) | models.Q(user=user2, friend=user1)).exists()
+        user_id, friend_id = Friend.canonical_pair(user1.id, user2.id)
+        return Friend.objects.filter(user_id=user_id, friend_id=friend_id).exists()
+
+    @classmethod
+    def get_friend_ids_queryset(cls, user_id):
+        """
+        Ids of the user's friends as a single UNION over both sides of the canonical pair.
+        """
+        return Friend.objects.filter(user_id=user_id).values('friend_id').union(
+            Friend.objects.filter(friend_id=user_id).values('user_id'),
+            all=True
+        )
     
     @classmethod
     def add_friend(cls, from_user, to_user):
-        if cls.are_friends(from_user, to_user):
+        if from_user.id == to_user.id:
             return False
 
-        Friend.objects.create(user=from_user, friend=to_user)
+        user_id, friend_id = Friend.canonical_pair(from_user.id, to_user.id)
+        try:
+            with transaction.atomic():
+                Friend.objects.create(user_id=user_id, friend_id=friend_id)
+                ChangeFeed.record([
+                    (from_user.id, ChangeFeed.FRIENDS, ChangeFeed.ADDED, to_user.id),
+                    (to_user.id, ChangeFeed.FRIENDS, ChangeFeed.ADDED, from_user.id),
+                ])
+        except IntegrityError:
+            # already friends
+            return False
 
-        # invalidate cache
-        cls.increment_user_cache_version(from_user.id, "friends")
-        cls.increment_user_cache_version(to_user.id, "friends")
+        FriendAdjacencyCache.add([(from_user.id, to_user.id), (to_user.id, from_user.id)])
+        cls.increment_user_cache_versions([from_user.id, to_user.id], "friends")
+        cls.queue_suggestion_refresh(from_user.id, to_user.id)
 
         return True
 
     @classmethod
     def remove_friend(cls, from_user, to_user):
-        if not cls.are_friends(from_user, to_user):
-            return False
+        user_id, friend_id = Friend.canonical_pair(from_user.id, to_user.id)
+        with transaction.atomic():
+            deleted, _ = Friend.objects.filter(user_id=user_id, friend_id=friend_id).delete()
+            if not deleted:
+                return False
 
-        Friend.objects.filter(user=from_user, friend=to_user).delete()
-        Friend.objects.filter(user=to_user, friend=from_user).delete()
+            ChangeFeed.record([
+                (from_user.id, ChangeFeed.FRIENDS, ChangeFeed.REMOVED, to_user.id),
+                (to_user.id, ChangeFeed.FRIENDS, ChangeFeed.REMOVED, from_user.id),
+            ])
 
-        # invalidate cache
-        cls.increment_user_cache_version(from_user.id, "friends")
-        cls.increment_user_cache_version(to_user.id, "friends")
+        FriendAdjacencyCache.remove([(from_user.id, to_user.id), (to_user.id, from_user.id)])
+        cls.increment_user_cache_versions([from_user.id, to_user.id], "friends")
+        cls.queue_suggestion_refresh(from_user.id, to_user.id)
 
         return True
     
     @classmethod
-    def get_friend_requests(cls, user, sort="created_at"):
-        friend_requests_cache_key = cls.friend_requests_cache_key.format(user_id=user.id,
-                                                                         sort=sort,
-                                                                         version=cls.get_user_cache_version(user.id, "friend_requests")
-                                                                        )
-        friend_requests = cache.get(friend_requests_cache_key)
-        if friend_requests:
-            return pickle.loads(friend_requests)
-
-        if sort.startswith("-"):
-            sort_field = sort[1:]
-        else:
-            sort_field = sort
+    def queue_suggestion_refresh(cls, *user_ids):
+        """
+        Queue a suggestion rebuild for the given users and everyone whose friends-of-friends include them.
+        The refresh job looks up the latter, so the writer does not load every user's friends.
+        """
+        SuggestionRefreshQueue.push(user_ids)
+        FriendsSuggestionRefreshQueue.push(user_ids)
 
-        if sort_field.startswith("from_user"):
-            friend_requests = FriendRequest.objects.filter(to_user=user, status="pending").select_related('from_user').order_by(sort)
-        else:
-            friend_requests = FriendRequest.objects.filter(to_user=user, status="pending").select_related('to_user').order_by(sort)
-        
-        cache.set(friend_requests_cache_key, pickle.dumps(friend_requests), cls.friend_requests_cache_timeout)
-        
-        return friend_requests
+    @classmethod
+    def get_friend_requests(cls, user, sort="created_at"):
+        """
+        The user's pending friend requests in the sort's order. With the default sort, pages
+        of it are range scans of the friendrequest_inbox_idx index.
+        """
+        return FriendRequest.objects.filter(to_user_id=user.id, status="pending")\
+            .select_related('from_user', 'to_user')\
+            .defer('from_user__email')\
+            .annotate(from_user_name=models.F('from_user__first_name'))\
+            .order_by(*cls.friend_request_orderings[sort])
     
     @classmethod
     def send_friend_request(cls, from_user, to_user):
-        if from_user == to_user:
+        if from_user.id == to_user.id:
             return False
         
         if cls.are_friends(from_user, to_user):
@@ -162,44 +185,199 @@ class FriendshipManager:
 
         if FriendRequest.objects.filter(status="pending")\
             .filter(
-                models.Q(from_user=from_user, to_user=to_user) |
-                models.Q(from_user=to_user, to_user=from_user)
+                models.Q(from_user_id=from_user.id, to_user_id=to_user.id) |
+                models.Q(from_user_id=to_user.id, to_user_id=from_user.id)
             ).exists():
             return False
         
         if FriendRequest.objects.filter(status="rejected")\
-            .filter(from_user=from_user, to_user=to_user).filter(rejected_at__gte=timezone.now()
+            .filter(from_user_id=from_user.id, to_user_id=to_user.id).filter(rejected_at__gte=timezone.now()
                                                                   - timezone.timedelta(hours=settings.FRIEND_REQUEST_TIMEOUT)).exists():
             return False
 
-        FriendRequest.objects.create(from_user=from_user, to_user=to_user)
+        with transaction.atomic():
+            friend_request = FriendRequest.objects.create(from_user_id=from_user.id, to_user_id=to_user.id)
+            ChangeFeed.record([(to_user.id, ChangeFeed.FRIEND_REQUESTS, ChangeFeed.ADDED, friend_request.id)])
 
         # invalidate cache
         cls.increment_user_cache_version(to_user.id, "friend_requests")
+        # users with a pending request are not suggested to each other
+        SuggestionRefreshQueue.push([from_user.id, to_user.id])
 
         return True
     
     @classmethod
     def accept_friend_request(cls, friend_request):
-        friend_request.status = "accepted"
-        friend_request.save()
+        with transaction.atomic():
+            friend_request.status = "accepted"
+            friend_request.save()
+            ChangeFeed.record([(friend_request.to_user_id, ChangeFeed.FRIEND_REQUESTS, ChangeFeed.REMOVED, friend_request.id)])
 
+        # after the commit, so a request reading the new cache version also reads the new friendship
         cls.add_friend(friend_request.from_user, friend_request.to_user)
 
         # invalidate cache
         cls.increment_user_cache_version(friend_request.to_user.id, "friend_requests")
-        cls.increment_user_cache_version(friend_request.from_user.id, "friends")
-        cls.increment_user_cache_version(friend_request.to_user.id, "friends")
 
         return True
     
     @classmethod
     def reject_friend_request(cls, friend_request):
-        friend_request.status = "rejected"
-        friend_request.rejected_at = timezone.timezone.now()
-        friend_request.save()
+        with transaction.atomic():
+            friend_request.status = "rejected"
+            friend_request.rejected_at = timezone.now()
+            friend_request.save()
+            ChangeFeed.record([(friend_request.to_user_id, ChangeFeed.FRIEND_REQUESTS, ChangeFeed.REMOVED, friend_request.id)])
 
         # invalidate cache
         cls.increment_user_cache_version(friend_request.to_user.id, "friend_requests")
+        SuggestionRefreshQueue.push([friend_request.from_user_id, friend_request.to_user_id])
+
+        return True
+
+    @classmethod
+    def send_friend_requests(cls, from_user, to_user_ids):
+        """
+        Send a friend request to each of to_user_ids, applying the same rules as send_friend_request
+        with one query per rule for the whole batch. Returns {to_user_id: status}.
+        """
+        to_user_ids = list(dict.fromkeys(to_user_ids))
+        statuses = {}
+
+        existing_ids = set(apps.get_model('accounts', 'CustomUser').objects.filter(id__in=to_user_ids, is_active=True)
+                           .values_list('id', flat=True))
+        blocked_by_ids = BlocklistManager.get_blocked_by_ids(from_user.id)
+        friend_ids = cls.filter_friend_ids(from_user.id, existing_ids)
+
+        pending_ids = set()
+        for from_user_id, to_user_id in FriendRequest.objects.filter(status="pending").filter(
+            models.Q(from_user_id=from_user.id, to_user_id__in=existing_ids) |
+            models.Q(from_user_id__in=existing_ids, to_user_id=from_user.id)
+        ).values_list('from_user_id', 'to_user_id'):
+            pending_ids.add(to_user_id if from_user_id == from_user.id else from_user_id)
+
+        cooldown_ids = set(FriendRequest.objects.filter(
+            status="rejected", from_user_id=from_user.id, to_user_id__in=existing_ids,
+            rejected_at__gte=timezone.now() - timezone.timedelta(hours=settings.FRIEND_REQUEST_TIMEOUT)
+        ).values_list('to_user_id', flat=True))
+
+        for to_user_id in to_user_ids:
+            if to_user_id == from_user.id:
+                statuses[to_user_id] = "self"
+            elif to_user_id not in existing_ids:
+                statuses[to_user_id] = "not_found"
+            elif to_user_id in blocked_by_ids:
+                statuses[to_user_id] = "blocked"
+            elif to_user_id in friend_ids:
+                statuses[to_user_id] = "already_friends"
+            elif to_user_id in pending_ids:
+                statuses[to_user_id] = "already_pending"
+            elif to_user_id in cooldown_ids:
+                statuses[to_user_id] = "cooldown"
+            else:
+                statuses[to_user_id] = "sent"
+
+        sent_ids = [to_user_id for to_user_id, status in statuses.items() if status == "sent"]
+        with transaction.atomic():
+            friend_requests = FriendRequest.objects.bulk_create(
+                [FriendRequest(from_user_id=from_user.id, to_user_id=to_user_id) for to_user_id in sent_ids]
+            )
+            ChangeFeed.record([
+                (friend_request.to_user_id, ChangeFeed.FRIEND_REQUESTS, ChangeFeed.ADDED, friend_request.id)
+                for friend_request in friend_requests
+            ])
 
-        return True
\ No newline at end of file
+        # invalidate cache
+        cls.increment_user_cache_versions(sent_ids, "friend_requests")
+        if sent_ids:
+            SuggestionRefreshQueue.push([from_user.id, *sent_ids])
+
+        return statuses
+
+    @classmethod
+    def accept_friend_requests(cls, user, friend_request_ids):
+        """
+        Accept the user's pending friend requests among friend_request_ids. Returns {friend_request_id: status}.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            statuses, friend_requests = cls._lock_received_friend_requests(user, friend_request_ids, "accepted")
+            for friend_request in friend_requests:
+                friend_request.status = "accepted"
+                friend_request.updated_at = now
+            FriendRequest.objects.bulk_update(friend_requests, ['status', 'updated_at'])
+
+            Friend.objects.bulk_create(
+                [Friend(user_id=user_id, friend_id=friend_id) for user_id, friend_id in
+                 {Friend.canonical_pair(user.id, friend_request.from_user_id) for friend_request in friend_requests}],
+                ignore_conflicts=True,
+            )
+
+            from_user_ids = {friend_request.from_user_id for friend_request in friend_requests}
+
+            # an "added" for users that were friends already is harmless, changes are applied idempotently
+            ChangeFeed.record(
+                [(user.id, ChangeFeed.FRIEND_REQUESTS, ChangeFeed.REMOVED, friend_request.id) for friend_request in friend_requests] +
+                [(user.id, ChangeFeed.FRIENDS, ChangeFeed.ADDED, from_user_id) for from_user_id in from_user_ids] +
+                [(from_user_id, ChangeFeed.FRIENDS, ChangeFeed.ADDED, user.id) for from_user_id in from_user_ids]
+            )
+
+        if from_user_ids:
+            FriendAdjacencyCache.add([(user.id, from_user_id) for from_user_id in from_user_ids] +
+                                     [(from_user_id, user.id) for from_user_id in from_user_ids])
+            cls.increment_user_cache_versions([user.id, *from_user_ids], "friends")
+            cls.queue_suggestion_refresh(user.id, *from_user_ids)
+
+            # invalidate cache
+            cls.increment_user_cache_version(user.id, "friend_requests")
+
+        return statuses
+
+    @classmethod
+    def reject_friend_requests(cls, user, friend_request_ids):
+        """
+        Reject the user's pending friend requests among friend_request_ids. Returns {friend_request_id: status}.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            statuses, friend_requests = cls._lock_received_friend_requests(user, friend_request_ids, "rejected")
+            for friend_request in friend_requests:
+                friend_request.status = "rejected"
+                friend_request.rejected_at = now
+                friend_request.updated_at = now
+            FriendRequest.objects.bulk_update(friend_requests, ['status', 'rejected_at', 'updated_at'])
+            ChangeFeed.record([
+                (user.id, ChangeFeed.FRIEND_REQUESTS, ChangeFeed.REMOVED, friend_request.id) for friend_request in friend_requests
+            ])
+
+        if friend_requests:
+            # invalidate cache
+            cls.increment_user_cache_version(user.id, "friend_requests")
+            SuggestionRefreshQueue.push([user.id, *(friend_request.from_user_id for friend_request in friend_requests)])
+
+        return statuses
+
+    @classmethod
+    def _lock_received_friend_requests(cls, user, friend_request_ids, new_status):
+        """
+        Lock the given friend requests and return a status for every id along with the user's
+        pending ones, which the caller moves to new_status.
+        """
+        friend_request_ids = list(dict.fromkeys(friend_request_ids))
+        friend_requests = FriendRequest.objects.select_for_update().filter(id__in=friend_request_ids).in_bulk()
+
+        statuses = {}
+        pending = []
+        for friend_request_id in friend_request_ids:
+            friend_request = friend_requests.get(friend_request_id)
+            if friend_request is None:
+                statuses[friend_request_id] = "not_found"
+            elif friend_request.to_user_id != user.id:
+                statuses[friend_request_id] = "unauthorized"
+            elif friend_request.status != "pending":
+                statuses[friend_request_id] = f"already_{friend_request.status}"
+            else:
+                statuses[friend_request_id] = new_status
+                pending.append(friend_request)
+
+        return statuses, pending
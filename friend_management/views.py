@@ -1,7 +1,12 @@
 # views.py
 from accounts.serializers import UserSerializer
+from friend_management.changes import ChangeFeed
 from friend_management.models import FriendRequest
-from friend_management.serializers import FriendRequestSerializer
+from friend_management.serializers import (
+    BulkFriendRequestSendSerializer, BulkFriendRequestUpdateSerializer, ChangeFeedQuerySerializer, FriendRequestSerializer,
+    FriendshipChangeSerializer, FriendSuggestionSerializer,
+)
+from friend_management.suggestions import FriendSuggestionEngine
 from rest_framework import generics, permissions, status
 from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
@@ -9,6 +14,10 @@ from rest_framework.response import Response
 from friend_management.utils import FriendshipManager
 from accounts.models import CustomUser
 from accounts.permissions import create_blocklist_permissions, RoleBasedPermission
+from social_network.conditional import VersionedResponseMixin
+from social_network.fieldsets import SparseFieldsetViewMixin
+from social_network.pagination import KeysetPagination
+from social_network.throttling import ItemScopedRateThrottle, MeteredScopedRateThrottle
 
 
 class FriendRequestSendView(generics.CreateAPIView):
@@ -40,7 +49,7 @@ class FriendRequestAcceptView(generics.CreateAPIView):
         except FriendRequest.DoesNotExist:
             return Response({'message': 'Friend request not found'}, status=status.HTTP_404_NOT_FOUND)
         
-        if friend_request.to_user != request.user:
+        if friend_request.to_user_id != request.user.id:
             return Response({'message': 'Unauthorized'}, status=status.HTTP_401_UNAUTHORIZED)
         
         FriendshipManager.accept_friend_request(friend_request)
@@ -58,7 +67,7 @@ class FriendRequestRejectView(generics.CreateAPIView):
         except FriendRequest.DoesNotExist:
             return Response({'message': 'Friend request not found'}, status=status.HTTP_404_NOT_FOUND)
         
-        if friend_request.to_user != request.user:
+        if friend_request.to_user_id != request.user.id:
             return Response({'message': 'Unauthorized'}, status=status.HTTP_401_UNAUTHORIZED)
         
         FriendshipManager.reject_friend_request(friend_request)
@@ -66,13 +75,75 @@ class FriendRequestRejectView(generics.CreateAPIView):
         return Response({'message': 'Friend request rejected'}, status=status.HTTP_200_OK)
 
 
-class FriendRequestListView(generics.ListAPIView):
+class BulkFriendRequestSendView(generics.GenericAPIView):
+    serializer_class = BulkFriendRequestSendSerializer
+    permission_classes = (permissions.IsAuthenticated, RoleBasedPermission)
+
+    throttle_classes = (MeteredScopedRateThrottle, ItemScopedRateThrottle)
+    throttle_scope = 'bulk_friend_requests'
+    # every id counts against the budget of send_friend_request/
+    throttle_item_scope = 'friend_requests'
+
+    def get_throttle_item_count(self, request):
+        to_user_ids = request.data.get('to_user_ids')
+        return len(to_user_ids) if isinstance(to_user_ids, list) else 1
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        statuses = FriendshipManager.send_friend_requests(request.user, serializer.validated_data['to_user_ids'])
+
+        return Response({
+            'results': [{'to_user_id': to_user_id, 'status': item_status} for to_user_id, item_status in statuses.items()]
+        }, status=status.HTTP_200_OK)
+
+
+class BulkFriendRequestUpdateView(generics.GenericAPIView):
+    """
+    Applies update_friend_requests, a FriendshipManager method taking the user and the
+    friend request ids and returning {friend_request_id: status}, to the posted ids.
+    """
+    serializer_class = BulkFriendRequestUpdateSerializer
+    permission_classes = (permissions.IsAuthenticated, RoleBasedPermission)
+    update_friend_requests = None
+
+    throttle_scope = 'bulk_friend_requests'
+
+    def post(self, request, *args, **kwargs):
+        assert self.update_friend_requests is not None, (
+            f"'{self.__class__.__name__}' should set the `update_friend_requests` attribute."
+        )
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        statuses = self.update_friend_requests(request.user, serializer.validated_data['friend_request_ids'])
+
+        return Response({
+            'results': [
+                {'friend_request_id': friend_request_id, 'status': item_status}
+                for friend_request_id, item_status in statuses.items()
+            ]
+        }, status=status.HTTP_200_OK)
+
+
+class BulkFriendRequestAcceptView(BulkFriendRequestUpdateView):
+    update_friend_requests = FriendshipManager.accept_friend_requests
+
+
+class BulkFriendRequestRejectView(BulkFriendRequestUpdateView):
+    update_friend_requests = FriendshipManager.reject_friend_requests
+
+
+class FriendRequestListView(VersionedResponseMixin, SparseFieldsetViewMixin, generics.ListAPIView):
     serializer_class = FriendRequestSerializer
     permission_classes = (permissions.IsAuthenticated, RoleBasedPermission)
+    pagination_class = KeysetPagination
+    cache_type = "friend_requests"
 
-    VALID_SORT_FIELDS = ['from_user__name', 'created_at', '-from_user__name', '-created_at']
+    VALID_SORT_FIELDS = list(FriendshipManager.friend_request_orderings)
 
-    def get_queryset(self):
+    def get_sort(self):
         if 'sort' in self.request.query_params:
             sort = self.request.query_params['sort']
             if sort not in self.VALID_SORT_FIELDS:
@@ -80,14 +151,71 @@ class FriendRequestListView(generics.ListAPIView):
                 raise ValidationError({'sort': 'Invalid sort field'})
         else:
             sort = 'created_at'
-            
-        return FriendshipManager.get_friend_requests(self.request.user, sort)
+        return sort
 
+    def get_keyset_ordering(self):
+        return FriendshipManager.friend_request_orderings[self.get_sort()]
+
+    def get_queryset(self):
+        return FriendshipManager.get_friend_requests(self.request.user, self.get_sort())
 
-class FriendListView(generics.ListAPIView):
+
+class FriendListView(VersionedResponseMixin, SparseFieldsetViewMixin, generics.ListAPIView):
     serializer_class = UserSerializer
     permission_classes = (permissions.IsAuthenticated, RoleBasedPermission)
+    pagination_class = KeysetPagination
+    keyset_ordering = ('id',)
+    cache_type = "friends"
 
     def get_queryset(self):
         return FriendshipManager.get_friends(self.request.user)
 
+
+class FriendshipChangeListView(generics.GenericAPIView):
+    """
+    Changes to the user's friends, friend_requests and blocked_users lists after ?since=<cursor>.
+
+    Without since, returns the cursor to start from: get it, load the lists in full, then
+    poll with the cursor of each response. A 410 means the cursor is older than the
+    retained changes and the lists have to be loaded again.
+    """
+    serializer_class = FriendshipChangeSerializer
+    permission_classes = (permissions.IsAuthenticated, RoleBasedPermission)
+
+    def get(self, request, *args, **kwargs):
+        query = ChangeFeedQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+
+        since = query.validated_data.get('since')
+        if since is None:
+            return Response({'cursor': ChangeFeed.get_cursor(), 'has_more': False, 'changes': []})
+
+        if ChangeFeed.is_expired(since):
+            return Response({'message': 'Cursor expired, reload the lists'}, status=status.HTTP_410_GONE)
+
+        changes, cursor, has_more = ChangeFeed.get_changes(request.user.id, since, query.validated_data['limit'])
+        return Response({'cursor': cursor, 'has_more': has_more, 'changes': self.get_serializer(changes, many=True).data})
+
+
+class FriendSuggestionListView(generics.ListAPIView):
+    serializer_class = FriendSuggestionSerializer
+    permission_classes = (permissions.IsAuthenticated, RoleBasedPermission)
+    # suggestions are already bounded by FRIEND_SUGGESTIONS_LIMIT
+    pagination_class = None
+
+    def get_queryset(self):
+        score = self.request.query_params.get('score', 'mutual_friends')
+        if score not in FriendSuggestionEngine.SCORES:
+            raise ValidationError({'score': 'Invalid score'})
+
+        suggestions = FriendSuggestionEngine.get_suggestions(self.request.user.id, score)
+        # suggestions do not show emails
+        users = CustomUser.objects.defer('email').in_bulk([suggestion['user_id'] for suggestion in suggestions])
+
+        queryset = []
+        for suggestion in suggestions:
+            user = users.get(suggestion['user_id'])
+            if user is not None and user.is_active:
+                user.suggestion = suggestion
+                queryset.append(user)
+        return queryset
@@ -0,0 +1,8 @@
+# gunicorn.conf.py
+
+from prometheus_client import multiprocess
+
+
+def child_exit(server, worker):
+    # drop the live-gauge files of the worker that went away, its counters stay in the totals
+    multiprocess.mark_process_dead(worker.pid)
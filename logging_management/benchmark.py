@@ -0,0 +1,304 @@
+# logging_management/benchmark.py
+#
+# Load-replay benchmark used by the benchmark_api command: seeds a throwaway database,
+# serves the project from an in-process threaded WSGI server and replays a weighted mix
+# of API calls against it from concurrent client threads.
+
+import http.client
+import itertools
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter, deque
+
+from django.contrib.auth.hashers import make_password
+from django.core.servers.basehttp import ThreadedWSGIServer
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.test.testcases import QuietWSGIRequestHandler
+
+from accounts.authentication import ClaimsRefreshToken
+from accounts.models import CustomUser
+from accounts.utils import consistent_encrypt
+from friend_management.models import Friend, FriendRequest
+
+from .metrics import QueryCounter
+
+
+BENCHMARK_PASSWORD = "benchmark-password"
+QUERY_COUNT_HEADER = "X-Benchmark-Queries"
+
+DEFAULT_SCENARIOS = [
+    {'name': 'register', 'method': 'POST', 'path': '/register/', 'auth': False, 'weight': 2,
+     'body': {'email': 'bench{unique}@example.com', 'password': BENCHMARK_PASSWORD, 'first_name': 'bench', 'last_name': '{unique}'}},
+    {'name': 'login', 'method': 'POST', 'path': '/login/', 'auth': False, 'weight': 5,
+     'body': {'email': '{email}', 'password': BENCHMARK_PASSWORD}},
+    {'name': 'search', 'method': 'GET', 'path': '/search/?q={name}', 'auth': True, 'weight': 25},
+    {'name': 'send_friend_request', 'method': 'POST', 'path': '/send_friend_request/', 'auth': True, 'weight': 8,
+     'body': {'to_user_id': '{other_user_id}'}},
+    {'name': 'accept_friend_request', 'method': 'POST', 'path': '/accept_friend_request/', 'auth': True, 'weight': 5,
+     'body': {'friend_request_id': '{pending_friend_request_id}'}},
+    {'name': 'friend_requests', 'method': 'GET', 'path': '/friend_requests/', 'auth': True, 'weight': 15},
+    {'name': 'friends', 'method': 'GET', 'path': '/friends/', 'auth': True, 'weight': 30},
+    {'name': 'logs', 'method': 'GET', 'path': '/logs/', 'auth': True, 'weight': 10},
+]
+
+FIRST_NAMES = ["aarav", "moksh", "shubham", "akshit", "priya", "neha", "rohan", "kavya", "arjun", "isha"]
+LAST_NAMES = ["verma", "vashisht", "sharma", "gupta", "iyer", "khan", "patel", "reddy", "singh", "das"]
+
+
+def load_scenarios(path):
+    """
+    Read a JSONL file of scenarios, one object per line with the keys of DEFAULT_SCENARIOS.
+    """
+    scenarios = []
+    with open(path) as scenario_file:
+        for line in scenario_file:
+            if not line.strip():
+                continue
+            scenario = json.loads(line)
+            scenario.setdefault('method', 'GET')
+            scenario.setdefault('auth', True)
+            scenario.setdefault('weight', 1)
+            scenarios.append(scenario)
+    return scenarios
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    # nearest rank
+    return sorted_values[max(0, math.ceil(q / 100 * len(sorted_values)) - 1)]
+
+
+class BenchmarkData:
+    """
+    The seeded users, their access tokens and the pending friend requests left to accept.
+    """
+
+    def __init__(self, users, friendships, pending_requests, seed=None):
+        self.random = random.Random(seed)
+        self.user_count = users
+        self.friendship_count = friendships
+        self.pending_request_count = pending_requests
+
+        self.users = []
+        self.tokens = {}
+        self.pending_requests = deque()
+        self._unique = itertools.count()
+        self._lock = threading.Lock()
+
+    def seed(self):
+        password = make_password(BENCHMARK_PASSWORD)
+        users = []
+        for i in range(self.user_count):
+            email = f"user{i}@benchmark.local"
+            users.append(CustomUser(
+                email=email,
+                email_hash=consistent_encrypt(email),
+                password=password,
+                first_name=self.random.choice(FIRST_NAMES),
+                last_name=self.random.choice(LAST_NAMES),
+            ))
+        CustomUser.objects.bulk_create(users, batch_size=500)
+        self.users = list(CustomUser.objects.order_by('id'))
+        self.tokens = {user.id: str(ClaimsRefreshToken.for_user(user).access_token) for user in self.users}
+
+        user_ids = [user.id for user in self.users]
+        pairs = set()
+        while len(pairs) < min(self.friendship_count, len(user_ids) * (len(user_ids) - 1) // 2):
+            pairs.add(Friend.canonical_pair(*self.random.sample(user_ids, 2)))
+        Friend.objects.bulk_create([Friend(user_id=a, friend_id=b) for a, b in pairs], batch_size=1000)
+
+        friend_requests = []
+        requested = set()
+        # every unordered pair that is not a friendship can hold one pending request
+        available = len(user_ids) * (len(user_ids) - 1) // 2 - len(pairs)
+        while len(friend_requests) < min(self.pending_request_count, available):
+            from_user_id, to_user_id = self.random.sample(user_ids, 2)
+            pair = Friend.canonical_pair(from_user_id, to_user_id)
+            if pair in pairs or pair in requested:
+                continue
+            requested.add(pair)
+            friend_requests.append(FriendRequest(from_user_id=from_user_id, to_user_id=to_user_id))
+        FriendRequest.objects.bulk_create(friend_requests, batch_size=1000)
+
+        self.pending_requests.extend(
+            FriendRequest.objects.filter(status="pending").values_list('id', 'to_user_id').order_by('?')
+        )
+
+    def next_unique(self):
+        with self._lock:
+            return next(self._unique)
+
+    def build_request(self, scenario):
+        """
+        (method, path, body, headers) of one call of the scenario, with its placeholders filled in.
+        """
+        with self._lock:
+            user = self.random.choice(self.users)
+            other_user = self.random.choice(self.users)
+            values = {
+                'user_id': user.id,
+                'other_user_id': other_user.id,
+                'email': user.email,
+                'name': other_user.first_name[:3],
+            }
+            if '{pending_friend_request_id}' in json.dumps(scenario):
+                # only the receiver can accept, so the request decides who is calling
+                friend_request_id, to_user_id = self.pending_requests.popleft() if self.pending_requests else (0, user.id)
+                values['pending_friend_request_id'] = friend_request_id
+                user_id = to_user_id
+            else:
+                user_id = user.id
+        values['unique'] = self.next_unique()
+
+        path = scenario['path'].format(**values)
+        body = self._fill(scenario.get('body'), values)
+        headers = {'Content-Type': 'application/json'}
+        if scenario['auth']:
+            headers['Authorization'] = f"Bearer {self.tokens[user_id]}"
+
+        return scenario['method'], path, json.dumps(body) if body is not None else None, headers
+
+    def _fill(self, template, values):
+        if isinstance(template, dict):
+            return {key: self._fill(value, values) for key, value in template.items()}
+        if isinstance(template, str):
+            if template.startswith('{') and template.endswith('}') and template[1:-1] in values:
+                # keep ids as numbers
+                return values[template[1:-1]]
+            return template.format(**values)
+        return template
+
+
+class QueryCountingApplication:
+    """
+    WSGI wrapper that reports the number of database queries of each request in a response header.
+    """
+
+    def __init__(self, application):
+        self.application = application
+
+    def __call__(self, environ, start_response):
+        queries = QueryCounter()
+
+        def counting_start_response(status, headers, exc_info=None):
+            headers.append((QUERY_COUNT_HEADER, str(queries.count)))
+            return start_response(status, headers, exc_info)
+
+        with connection.execute_wrapper(queries):
+            return self.application(environ, counting_start_response)
+
+
+class BenchmarkServer:
+
+    def __init__(self, host='127.0.0.1'):
+        self.httpd = ThreadedWSGIServer((host, 0), QuietWSGIRequestHandler, allow_reuse_address=False)
+        self.httpd.set_app(QueryCountingApplication(get_wsgi_application()))
+        self.host, self.port = self.httpd.server_address[:2]
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="benchmark-server", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class BenchmarkRunner:
+    """
+    Replays `total_requests` calls picked from the weighted scenarios from `concurrency` client threads.
+    """
+
+    def __init__(self, server, data, scenarios, total_requests, concurrency, timeout=30):
+        self.server = server
+        self.data = data
+        self.scenarios = scenarios
+        self.weights = [scenario['weight'] for scenario in scenarios]
+        self.total_requests = total_requests
+        self.concurrency = concurrency
+        self.timeout = timeout
+
+        self.samples = {scenario['name']: [] for scenario in scenarios}
+        self._remaining = itertools.count()
+        self._lock = threading.Lock()
+        self.duration = None
+
+    def run(self):
+        workers = [
+            threading.Thread(target=self._work, args=(random.Random(seed),), name=f"benchmark-client-{seed}")
+            for seed in range(self.concurrency)
+        ]
+        started_at = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.duration = time.perf_counter() - started_at
+
+    def _work(self, rng):
+        while next(self._remaining) < self.total_requests:
+            scenario = rng.choices(self.scenarios, weights=self.weights)[0]
+            sample = self._call(*self.data.build_request(scenario))
+            with self._lock:
+                self.samples[scenario['name']].append(sample)
+
+    def _call(self, method, path, body, headers):
+        """
+        (status code or None on a connection error, latency in seconds, db queries or None)
+        """
+        conn = http.client.HTTPConnection(self.server.host, self.server.port, timeout=self.timeout)
+        started_at = time.perf_counter()
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            latency = time.perf_counter() - started_at
+            queries = response.getheader(QUERY_COUNT_HEADER)
+            return response.status, latency, int(queries) if queries is not None else None
+        except (OSError, http.client.HTTPException):
+            return None, time.perf_counter() - started_at, None
+        finally:
+            conn.close()
+
+    def report(self):
+        endpoints = {}
+        for name, samples in self.samples.items():
+            if not samples:
+                continue
+
+            latencies = sorted(latency * 1000 for _, latency, _ in samples)
+            queries = sorted(count for _, _, count in samples if count is not None)
+            statuses = Counter(str(status) for status, _, _ in samples)
+            endpoints[name] = {
+                'requests': len(samples),
+                'errors': sum(1 for status, _, _ in samples if status is None or status >= 500),
+                'status_codes': dict(statuses),
+                'rps': len(samples) / self.duration,
+                'latency_ms': {
+                    'mean': sum(latencies) / len(latencies),
+                    'p50': percentile(latencies, 50),
+                    'p90': percentile(latencies, 90),
+                    'p95': percentile(latencies, 95),
+                    'p99': percentile(latencies, 99),
+                    'max': latencies[-1],
+                },
+                'db_queries': {
+                    'mean': sum(queries) / len(queries) if queries else None,
+                    'p95': percentile(queries, 95),
+                    'max': queries[-1] if queries else None,
+                },
+            }
+
+        total = sum(endpoint['requests'] for endpoint in endpoints.values())
+        return {
+            'duration_s': self.duration,
+            'requests': total,
+            'errors': sum(endpoint['errors'] for endpoint in endpoints.values()),
+            'rps': total / self.duration if self.duration else None,
+            'endpoints': endpoints,
+        }
@@ -0,0 +1,208 @@
+# logging_management/buffer.py
+
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .models import Log
+from .rollups import LatencyRollupManager
+
+
+logger = logging.getLogger(__name__)
+
+
+class LogBuffer:
+    """
+    Bounded in-memory queue of unsaved Log records, drained by a background
+    thread that writes them with bulk_create.
+
+    A batch is flushed as soon as it reaches `batch_size` records or
+    `flush_interval` seconds after its first record, whichever comes first.
+    When the queue is full the `overflow` policy decides what happens:
+
+    - "block": wait up to `block_timeout` seconds for room, then drop the record
+    - "drop_newest": drop the incoming record
+    - "drop_oldest": evict the oldest queued record to make room
+    - "sync": write the incoming record inline
+    """
+
+    OVERFLOW_POLICIES = ("block", "drop_newest", "drop_oldest", "sync")
+
+    def __init__(self, max_size=10000, batch_size=500, flush_interval=1.0, overflow="block", block_timeout=0.05):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown log buffer overflow policy: {overflow}")
+
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+
+        self.dropped = 0
+        self.written = 0
+
+        self._queue = queue.Queue(maxsize=max_size)
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def put(self, log_obj):
+        self._ensure_started()
+
+        try:
+            self._queue.put_nowait(log_obj)
+            return
+        except queue.Full:
+            pass
+
+        if self.overflow == "block":
+            try:
+                self._queue.put(log_obj, timeout=self.block_timeout)
+                return
+            except queue.Full:
+                pass
+        elif self.overflow == "drop_oldest":
+            try:
+                self._queue.get_nowait()
+                self._count_dropped(1)
+            except queue.Empty:
+                pass
+            try:
+                self._queue.put_nowait(log_obj)
+                return
+            except queue.Full:
+                pass
+        elif self.overflow == "sync":
+            self._write([log_obj])
+            return
+
+        self._count_dropped(1)
+
+    def flush(self):
+        """
+        Write everything currently queued. Called by the flusher thread on
+        shutdown and safe to call from any thread.
+        """
+        while True:
+            batch = self._drain(self.batch_size)
+            if not batch:
+                return
+            self._write(batch)
+
+    def stop(self, timeout=5.0):
+        self._stopping.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout)
+        self.flush()
+
+    def _ensure_started(self):
+        # The flusher thread does not survive a fork, so a preforked worker
+        # starts its own on first use.
+        if self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+
+            if self._pid is not None:
+                self._queue = queue.Queue(maxsize=self.max_size)
+                self._stopping = threading.Event()
+
+            self._thread = threading.Thread(target=self._run, name="log-buffer-flusher", daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            # only the flusher thread's own connection, the "sync" policy writes on the request's
+            close_old_connections()
+            self._write(batch)
+
+        self.flush()
+
+    def _drain(self, limit):
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        try:
+            with transaction.atomic():
+                Log.objects.bulk_create(batch, batch_size=self.batch_size)
+        except Exception:
+            logger.exception("Failed to write %s buffered log records, retrying them one by one", len(batch))
+            batch = self._write_each(batch)
+
+        with self._lock:
+            self.written += len(batch)
+
+        if settings.LATENCY_ROLLUPS['ENABLED']:
+            try:
+                LatencyRollupManager.record(batch)
+            except Exception:
+                logger.exception("Failed to roll up the latencies of %s log records", len(batch))
+
+    def _write_each(self, batch):
+        """
+        Save the records one at a time so a bad one only drops itself. Returns the saved ones.
+        """
+        written = []
+        for log_obj in batch:
+            try:
+                with transaction.atomic():
+                    log_obj.save()
+            except Exception:
+                logger.exception("Failed to write the buffered log record of %s", log_obj.action)
+                self._count_dropped(1)
+            else:
+                written.append(log_obj)
+        return written
+
+    def _count_dropped(self, count):
+        with self._lock:
+            self.dropped += count
+
+
+def build_log_buffer():
+    config = getattr(settings, "LOG_BUFFER", {})
+    return LogBuffer(
+        max_size=config.get("MAX_SIZE", 10000),
+        batch_size=config.get("BATCH_SIZE", 500),
+        flush_interval=config.get("FLUSH_INTERVAL", 1.0),
+        overflow=config.get("OVERFLOW", "block"),
+        block_timeout=config.get("BLOCK_TIMEOUT", 0.05),
+    )
+
+
+log_buffer = build_log_buffer()
+
+atexit.register(log_buffer.stop)
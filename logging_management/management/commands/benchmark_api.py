@@ -0,0 +1,120 @@
+import datetime
+import json
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import override_settings, setup_databases, teardown_databases
+
+
+class Command(BaseCommand):
+    help = "Replay a weighted mix of API calls against a local server on a throwaway database and report per-endpoint throughput."
+
+    # the checks would import the views before throttling is turned off below
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help="Total number of calls to replay.")
+        parser.add_argument('--concurrency', type=int, default=8, help="Number of concurrent clients.")
+        parser.add_argument('--users', type=int, default=200, help="Users to seed.")
+        parser.add_argument('--friendships', type=int, default=1000, help="Friendships to seed.")
+        parser.add_argument('--pending-requests', type=int, default=500, help="Pending friend requests to seed.")
+        parser.add_argument('--scenarios', help="JSONL file of scenarios replacing the default mix.")
+        parser.add_argument('--cache', choices=['locmem', 'default'], default='locmem',
+                            help="locmem, or the configured cache (Redis) under a separate key prefix.")
+        parser.add_argument('--seed', type=int, help="Random seed, for repeatable runs.")
+        parser.add_argument('--output', help="Where to write the JSON report. Defaults to benchmark-<timestamp>.json.")
+
+    def handle(self, *args, **options):
+        overrides = {
+            'DEBUG': False,
+            'ALLOWED_HOSTS': ['127.0.0.1', 'localhost'],
+            'REST_FRAMEWORK': dict(settings.REST_FRAMEWORK, DEFAULT_THROTTLE_CLASSES=[]),
+        }
+        if options['cache'] == 'locmem':
+            overrides['CACHES'] = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        else:
+            overrides['CACHES'] = {'default': dict(settings.CACHES['default'], KEY_PREFIX='benchmark')}
+
+        with override_settings(**overrides):
+            report = self.run_benchmark(options)
+
+        output = options['output'] or f"benchmark-{datetime.datetime.now():%Y%m%d-%H%M%S}.json"
+        with open(output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+
+        self.print_report(report)
+        self.stdout.write(f"Report written to {output}")
+
+    def run_benchmark(self, options):
+        # imported here so the views pick up the overridden settings
+        from django.core.cache import cache
+
+        from logging_management.benchmark import (
+            DEFAULT_SCENARIOS, BenchmarkData, BenchmarkRunner, BenchmarkServer, load_scenarios,
+        )
+        from logging_management.buffer import log_buffer
+
+        scenarios = load_scenarios(options['scenarios']) if options['scenarios'] else DEFAULT_SCENARIOS
+        if not scenarios:
+            raise CommandError("No scenarios to run.")
+
+        connection = connections['default']
+        database_file = None
+        if connection.vendor == 'sqlite':
+            # an in-memory database locks whole tables between the server threads, a file only locks on write
+            database_file = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False).name
+            connection.settings_dict['TEST']['NAME'] = database_file
+            connection.settings_dict['OPTIONS'].setdefault('timeout', 30)
+
+        old_config = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+        if hasattr(cache, 'delete_pattern'):
+            cache.delete_pattern('*')
+
+        started_at = datetime.datetime.now(datetime.timezone.utc)
+        server = BenchmarkServer()
+        try:
+            data = BenchmarkData(options['users'], options['friendships'], options['pending_requests'], options['seed'])
+            self.stdout.write(f"Seeding {options['users']} users, {options['friendships']} friendships and {options['pending_requests']} friend requests")
+            data.seed()
+
+            server.start()
+            self.stdout.write(f"Replaying {options['requests']} calls with {options['concurrency']} clients on {server.host}:{server.port}")
+            runner = BenchmarkRunner(server, data, scenarios, options['requests'], options['concurrency'])
+            runner.run()
+        finally:
+            server.stop()
+            # waits for the batch the flusher thread may be holding too
+            log_buffer.stop()
+            if hasattr(cache, 'delete_pattern'):
+                cache.delete_pattern('*')
+            teardown_databases(old_config, verbosity=0)
+            if database_file and os.path.exists(database_file):
+                os.remove(database_file)
+
+        report = runner.report()
+        report['config'] = {
+            key: options[key]
+            for key in ('requests', 'concurrency', 'users', 'friendships', 'pending_requests', 'scenarios', 'cache', 'seed')
+        }
+        report['database'] = connection.vendor
+        report['scenarios'] = scenarios
+        report['started_at'] = started_at.isoformat()
+        return report
+
+    def print_report(self, report):
+        self.stdout.write(f"{'endpoint':<24}{'reqs':>7}{'errors':>8}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}")
+        for name, endpoint in report['endpoints'].items():
+            latency = endpoint['latency_ms']
+            queries = endpoint['db_queries']['mean']
+            self.stdout.write(
+                f"{name:<24}{endpoint['requests']:>7}{endpoint['errors']:>8}{endpoint['rps']:>9.1f}"
+                f"{latency['p50']:>9.1f}{latency['p95']:>9.1f}{latency['p99']:>9.1f}"
+                f"{queries if queries is None else round(queries, 1)!s:>9}"
+            )
+        self.stdout.write(
+            f"total: {report['requests']} requests, {report['errors']} errors, "
+            f"{report['rps']:.1f} requests/s over {report['duration_s']:.1f}s"
+        )
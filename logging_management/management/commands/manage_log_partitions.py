@@ -0,0 +1,66 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from logging_management.partitions import (
+    INTERVALS,
+    archive_table,
+    detach_partition,
+    ensure_default_partition,
+    ensure_partitions,
+    list_detached_partitions,
+    list_partitions,
+)
+
+
+class Command(BaseCommand):
+    help = "Create upcoming Log partitions and archive the ones past the retention period."
+
+    def add_arguments(self, parser):
+        defaults = settings.LOG_PARTITIONS
+        parser.add_argument('--interval', choices=list(INTERVALS), default=defaults['INTERVAL'], help="Partition size.")
+        parser.add_argument('--ahead', type=int, default=defaults['AHEAD'], help="Partitions to create ahead of today.")
+        parser.add_argument('--retention-days', type=int, default=defaults['RETENTION_DAYS'], help="Days of logs to keep, 0 keeps everything.")
+        parser.add_argument('--archive-dir', default=defaults['ARCHIVE_DIR'], help="Directory the expired partitions are dumped to.")
+        parser.add_argument('--dry-run', action='store_true', help="Only print the partitions that would be archived.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("Log partitioning requires PostgreSQL.")
+
+        today = datetime.datetime.now(datetime.timezone.utc).date()
+
+        if not options['dry_run']:
+            with transaction.atomic(), connection.cursor() as cursor:
+                last_day = today + INTERVALS[options['interval']] * options['ahead']
+                created = ensure_partitions(cursor, today, last_day, options['interval'])
+                ensure_default_partition(cursor)
+            for name in created:
+                self.stdout.write(f"Created {name}")
+
+        if options['retention_days'] <= 0:
+            return
+
+        cutoff = datetime.datetime.combine(
+            today - datetime.timedelta(days=options['retention_days']), datetime.time(), datetime.timezone.utc
+        )
+        with connection.cursor() as cursor:
+            expired = [name for name, _, upper in list_partitions(cursor) if upper <= cutoff]
+            # left behind by a run that failed between detaching and dropping
+            leftover = list_detached_partitions(cursor)
+
+        for name in expired + leftover:
+            if options['dry_run']:
+                self.stdout.write(f"Would archive {name}")
+                continue
+
+            if name in expired:
+                # detached in its own transaction so the archive below never holds a lock on the parent
+                with transaction.atomic(), connection.cursor() as cursor:
+                    detach_partition(cursor, name)
+
+            with transaction.atomic(), connection.cursor() as cursor:
+                path = archive_table(cursor, name, options['archive_dir'])
+            self.stdout.write(f"Archived {name} to {path}")
@@ -0,0 +1,167 @@
+# logging_management/metrics.py
+#
+# Prometheus metrics. With PROMETHEUS_MULTIPROC_DIR set (one directory shared by all
+# workers, emptied on deploy) every process writes its samples there and /metrics
+# adds them up, so it reports the whole server whichever worker answers (except for the
+# connection pool statistics, see PoolCollector).
+
+import os
+import time
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+
+REQUESTS = Counter(
+    'http_requests_total', "HTTP requests by view, method and status code.",
+    ['view', 'method', 'status'],
+)
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', "HTTP request latency by view.",
+    ['view', 'method'],
+)
+DB_QUERIES = Histogram(
+    'db_queries_per_request', "Database queries run by a request.",
+    ['view'],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, float('inf')),
+)
+DB_QUERY_TIME = Histogram(
+    'db_query_duration_seconds_per_request', "Time a request spent waiting on database queries.",
+    ['view'],
+)
+CACHE_LOOKUPS = Counter(
+    'cache_lookups_total', "Cache lookups by key family, tier (local/shared) and result (hit/miss).",
+    ['family', 'tier', 'result'],
+)
+CACHE_LATENCY = Histogram(
+    'cache_lookup_duration_seconds', "Cache lookup latency by key family and tier (local/shared).",
+    ['family', 'tier'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, float('inf')),
+)
+THROTTLED = Counter(
+    'throttled_requests_total', "Requests rejected by rate throttling, by throttle scope.",
+    ['scope'],
+)
+
+
+class CacheLookup:
+    """
+    Times a cache lookup and counts it as a hit or a miss of its key family:
+
+        with CacheLookup("friends_cache") as lookup:
+            value = cache.get(key)
+            lookup.hit = value is not None
+
+    tier is "shared" for the Django cache and "local" for the in-process cache in front of it.
+    """
+
+    def __init__(self, family, tier="shared"):
+        self.family = family
+        self.tier = tier
+        self.hit = False
+
+    def __enter__(self):
+        self._started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        CACHE_LATENCY.labels(self.family, self.tier).observe(time.perf_counter() - self._started_at)
+        if exc_type is None:
+            CACHE_LOOKUPS.labels(self.family, self.tier, 'hit' if self.hit else 'miss').inc()
+
+
+class QueryCounter:
+    """
+    connection.execute_wrapper() hook that counts the queries run through it and their total time.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started_at = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started_at
+
+
+def get_view_name(request):
+    """
+    A low-cardinality label for the view that handled the request.
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.url_name or match.route
+
+
+class PoolCollector:
+    """
+    Reports the process's connection pool statistics (DB_POOL) when the metrics are
+    collected, so requests don't pay for them. Nothing is reported when the database is
+    not pooled.
+
+    The statistics are not shared between processes: under PROMETHEUS_MULTIPROC_DIR they
+    are those of the worker that answers the scrape.
+    """
+
+    def collect(self):
+        connection = connections[DEFAULT_DB_ALIAS]
+        if not connection.settings_dict["OPTIONS"].get("pool"):
+            return
+
+        # counted since the pool was opened
+        stats = connection.pool.get_stats()
+
+        connections_family = GaugeMetricFamily(
+            'db_pool_connections', "Connections held by the database pool, by state (idle/in_use).", labels=['state'],
+        )
+        connections_family.add_metric(['idle'], stats.get('pool_available', 0))
+        connections_family.add_metric(['in_use'], stats.get('pool_size', 0) - stats.get('pool_available', 0))
+        yield connections_family
+
+        yield GaugeMetricFamily(
+            'db_pool_max_connections', "Most connections the database pool may open.", value=stats.get('pool_max', 0),
+        )
+        yield GaugeMetricFamily(
+            'db_pool_waiting_requests', "Requests currently waiting for a pooled connection.",
+            value=stats.get('requests_waiting', 0),
+        )
+
+        queued = stats.get('requests_queued', 0)
+        requests_family = CounterMetricFamily(
+            'db_pool_requests', "Connections handed out by the database pool, by whether the request had to queue.",
+            labels=['queued'],
+        )
+        requests_family.add_metric(['false'], max(stats.get('requests_num', 0) - queued, 0))
+        requests_family.add_metric(['true'], queued)
+        yield requests_family
+
+        yield CounterMetricFamily(
+            'db_pool_wait_seconds', "Time spent waiting for a pooled connection.",
+            value=stats.get('requests_wait_ms', 0) / 1000,
+        )
+        yield CounterMetricFamily(
+            'db_pool_timeouts', "Requests for a pooled connection that timed out or failed.",
+            value=stats.get('requests_errors', 0),
+        )
+
+
+POOL_COLLECTOR = PoolCollector()
+REGISTRY.register(POOL_COLLECTOR)
+
+
+def render_metrics():
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(POOL_COLLECTOR)
+    else:
+        registry = REGISTRY
+
+    return generate_latest(registry), CONTENT_TYPE_LATEST
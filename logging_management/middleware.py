@@ -1,51 +1,122 @@
 # middleware.py
 
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
 from django.utils.deprecation import MiddlewareMixin
 from django.utils import timezone
+from .buffer import log_buffer
+from .metrics import DB_QUERIES, DB_QUERY_TIME, REQUEST_LATENCY, REQUESTS, QueryCounter, get_view_name
 from .models import Log
+from .rollups import LatencyRollupManager
 import json
 
-from rest_framework_simplejwt.authentication import JWTAuthentication
-from rest_framework.exceptions import AuthenticationFailed
+from accounts.authentication import get_authenticated_user
+
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsMiddleware:
+    """
+    Records request count, latency and database usage per view. Goes first in MIDDLEWARE
+    so the latency covers the other middleware too.
+
+    Under ASGI the async views' queries run on executor threads, whose connections this
+    middleware cannot wrap, so async requests record no database metrics.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        if request.path == '/metrics':
+            return self.get_response(request)
+
+        queries = QueryCounter()
+        started_at = time.perf_counter()
+        with connection.execute_wrapper(queries):
+            response = self.get_response(request)
+        duration = time.perf_counter() - started_at
+
+        view = self.observe(request, response, duration)
+        DB_QUERIES.labels(view).observe(queries.count)
+        DB_QUERY_TIME.labels(view).observe(queries.duration)
+
+        return response
+
+    async def __acall__(self, request):
+        if request.path == '/metrics':
+            return await self.get_response(request)
+
+        started_at = time.perf_counter()
+        response = await self.get_response(request)
+        self.observe(request, response, time.perf_counter() - started_at)
+
+        return response
+
+    def observe(self, request, response, duration):
+        view = get_view_name(request)
+        REQUESTS.labels(view, request.method, response.status_code).inc()
+        REQUEST_LATENCY.labels(view, request.method).observe(duration)
+        return view
+
+
+def truncate(value, field_name):
+    """
+    Cut value to the max_length of the Log field, so one long path can't fail a whole batch.
+    """
+    max_length = Log._meta.get_field(field_name).max_length
+    return value[:max_length] if value else value
 
 
 class LoggingMiddleware(MiddlewareMixin):
     def process_request(self, request):
         # return if the request is for logging itself
-        if request.path == '/logs/create/' or request.path == '/logs/':
+        if request.path in ('/logs/create/', '/logs/', '/metrics'):
             request.log_obj = None
             return
-        
-        self.start_time = timezone.now()
-
-        jwt_authentication = JWTAuthentication()
-        try:
-            auth_result = jwt_authentication.authenticate(request)
 
-            if auth_result is not None:
-                user = auth_result[0]
-            else:
-                user = None
-        except AuthenticationFailed as e:
-            user = None
-
-        log_obj = Log.objects.create(
-            user=user,
-            action=request.path,
-            method=request.method,
+        # the record is only built here, it is written once the response is known
+        request.log_obj = Log(
+            action=truncate(request.path, 'action'),
+            method=truncate(request.method, 'method'),
             ip_address=request.META.get('REMOTE_ADDR'),
-            action_started_at=self.start_time,
+            action_started_at=timezone.now(),
             payload=json.dumps(request.body.decode('utf-8')),
         )
 
-        request.log_obj = log_obj
-    
     def process_response(self, request, response):
-        log_obj = request.log_obj
+        log_obj = getattr(request, 'log_obj', None)
         if log_obj:
+            # by now DRF has usually authenticated the token, so this reuses its result
+            user = get_authenticated_user(request)
+            log_obj.user_id = user.id if user is not None else None
             log_obj.action_completed_at = timezone.now()
             log_obj.result = response.content
             log_obj.status_code = response.status_code
-            log_obj.save()
+            # not a Log field, the latency rollups are keyed on it
+            log_obj.view_name = get_view_name(request)
+
+            if settings.LOG_BUFFER['ENABLED']:
+                log_buffer.put(log_obj)
+            else:
+                log_obj.save()
+                if settings.LATENCY_ROLLUPS['ENABLED']:
+                    try:
+                        LatencyRollupManager.record([log_obj])
+                    except Exception:
+                        logger.exception("Failed to roll up the latency of %s", log_obj.action)
 
-        return response
\ No newline at end of file
+        return response
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logging_management', '0004_log_status_code'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='log',
+            name='action_completed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='log',
+            name='action_started_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logging_management', '0005_log_timestamps_default_now'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='log',
+            index=models.Index(fields=['action_started_at', 'id'], name='log_started_at_id_idx'),
+        ),
+    ]
@@ -0,0 +1,85 @@
+import datetime
+
+from django.conf import settings
+from django.db import migrations
+
+
+TABLE = 'logging_management_log'
+OLD_TABLE = f'{TABLE}_unpartitioned'
+
+
+def create_indexes(schema_editor, primary_key):
+    schema_editor.execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY ({primary_key})")
+    schema_editor.execute(f"CREATE INDEX log_started_at_id_idx ON {TABLE} (action_started_at, id)")
+    schema_editor.execute(f"CREATE INDEX {TABLE}_user_id_idx ON {TABLE} (user_id)")
+    schema_editor.execute(
+        f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_user_id_fk FOREIGN KEY (user_id) "
+        f"REFERENCES accounts_customuser (id) DEFERRABLE INITIALLY DEFERRED"
+    )
+
+
+def copy_rows_and_swap(schema_editor):
+    """
+    Move the rows of OLD_TABLE into the freshly created TABLE, drop OLD_TABLE and give
+    TABLE back its id sequence.
+    """
+    # LIKE ... INCLUDING DEFAULTS copies a nextval() default on a sequence owned by OLD_TABLE,
+    # which would keep OLD_TABLE from being dropped
+    schema_editor.execute(f"ALTER TABLE {TABLE} ALTER COLUMN id DROP DEFAULT")
+    schema_editor.execute(f"INSERT INTO {TABLE} SELECT * FROM {OLD_TABLE}")
+    schema_editor.execute(f"DROP TABLE {OLD_TABLE}")
+    # a plain owned sequence rather than an identity column, which partitioned tables only support from PostgreSQL 17
+    schema_editor.execute(f"CREATE SEQUENCE {TABLE}_id_seq OWNED BY {TABLE}.id")
+    schema_editor.execute(f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{TABLE}_id_seq')")
+    schema_editor.execute(f"SELECT setval('{TABLE}_id_seq', COALESCE(MAX(id), 0) + 1, false) FROM {TABLE}")
+
+
+def partition_log(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    from logging_management.partitions import INTERVALS, ensure_default_partition, ensure_partitions
+
+    interval = settings.LOG_PARTITIONS['INTERVAL']
+
+    schema_editor.execute(f"ALTER TABLE {TABLE} RENAME TO {OLD_TABLE}")
+    schema_editor.execute(
+        f"CREATE TABLE {TABLE} (LIKE {OLD_TABLE} INCLUDING DEFAULTS) PARTITION BY RANGE (action_started_at)"
+    )
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"SELECT MIN(action_started_at) FROM {OLD_TABLE}")
+        oldest, = cursor.fetchone()
+        today = datetime.datetime.now(datetime.timezone.utc).date()
+        first_day = oldest.astimezone(datetime.timezone.utc).date() if oldest else today
+        last_day = today + INTERVALS[interval] * settings.LOG_PARTITIONS['AHEAD']
+
+        ensure_partitions(cursor, first_day, last_day, interval)
+        ensure_default_partition(cursor)
+
+    copy_rows_and_swap(schema_editor)
+    # the partition key has to be part of every unique constraint
+    create_indexes(schema_editor, 'id, action_started_at')
+
+
+def unpartition_log(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    schema_editor.execute(f"ALTER TABLE {TABLE} RENAME TO {OLD_TABLE}")
+    schema_editor.execute(f"CREATE TABLE {TABLE} (LIKE {OLD_TABLE} INCLUDING DEFAULTS)")
+
+    copy_rows_and_swap(schema_editor)
+    create_indexes(schema_editor, 'id')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logging_management', '0006_keyset_indexes'),
+        ('accounts', '0004_search_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_log, unpartition_log),
+    ]
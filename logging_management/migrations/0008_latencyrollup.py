@@ -0,0 +1,30 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logging_management', '0007_partition_log'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatencyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('action', models.CharField(max_length=100)),
+                ('method', models.CharField(default='', max_length=10)),
+                ('status_code', models.IntegerField(default=0)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total_ms', models.FloatField(default=0)),
+                ('max_ms', models.FloatField(default=0)),
+                ('sketch', models.JSONField(default=dict)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('bucket', 'action', 'method', 'status_code'), name='latency_rollup_unique_key')],
+            },
+        ),
+    ]
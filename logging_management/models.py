@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 
 class Log(models.Model):
@@ -8,9 +9,38 @@ class Log(models.Model):
     payload = models.TextField(null=True, blank=True)
     result = models.TextField(null=True, blank=True)
     status_code = models.IntegerField(null=True, blank=True)
-    action_started_at = models.DateTimeField(auto_now_add=True)
-    action_completed_at = models.DateTimeField(auto_now=True)
+    action_started_at = models.DateTimeField(default=timezone.now)
+    action_completed_at = models.DateTimeField(default=timezone.now)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
 
     def __str__(self):
         return f"{self.user} -> {self.action}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['action_started_at', 'id'], name='log_started_at_id_idx'),
+        ]
+
+
+class LatencyRollup(models.Model):
+    """
+    Request count and latency sketch of one action/method/status code for one minute.
+    The action is the view's URL name (or route), not the request path.
+    """
+
+    bucket = models.DateTimeField()
+    action = models.CharField(max_length=100)
+    method = models.CharField(max_length=10, default='')
+    status_code = models.IntegerField(default=0)
+    count = models.PositiveIntegerField(default=0)
+    total_ms = models.FloatField(default=0)
+    max_ms = models.FloatField(default=0)
+    sketch = models.JSONField(default=dict)
+
+    def __str__(self):
+        return f"{self.bucket} {self.method} {self.action} {self.status_code}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['bucket', 'action', 'method', 'status_code'], name='latency_rollup_unique_key'),
+        ]
@@ -0,0 +1,169 @@
+# logging_management/partitions.py
+#
+# The Log table is range-partitioned on action_started_at (PostgreSQL only). Partitions
+# are named <table>_pYYYYMMDD after their first day and are created ahead of time by the
+# manage_log_partitions command, which also archives and drops expired ones. Rows outside
+# every partition land in the default partition and are moved out once their partition exists.
+
+import datetime
+import gzip
+import os
+import re
+
+from .models import Log
+
+
+PARENT_TABLE = Log._meta.db_table
+DEFAULT_PARTITION = f"{PARENT_TABLE}_default"
+PARTITION_PREFIX = f"{PARENT_TABLE}_p"
+
+INTERVALS = {
+    'daily': datetime.timedelta(days=1),
+    'weekly': datetime.timedelta(weeks=1),
+}
+
+BOUND_RE = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+def period_start(day, interval):
+    if interval == 'weekly':
+        return day - datetime.timedelta(days=day.weekday())
+    return day
+
+
+def partition_name(start):
+    return f"{PARTITION_PREFIX}{start:%Y%m%d}"
+
+
+def ensure_partitions(cursor, first_day, last_day, interval):
+    """
+    Create the partitions covering first_day..last_day (dates, inclusive). Returns the names created.
+    """
+    step = INTERVALS[interval]
+    existing = {name for name, _, _ in list_partitions(cursor)}
+
+    created = []
+    start = period_start(first_day, interval)
+    while start <= last_day:
+        name = partition_name(start)
+        if name not in existing:
+            create_partition(cursor, name, start, start + step)
+            created.append(name)
+        start += step
+
+    return created
+
+
+def create_partition(cursor, name, start, end):
+    """
+    Create the partition for start..end (dates, end excluded).
+
+    PostgreSQL refuses to create a partition for a range the default partition holds rows
+    of, so those rows are moved into the new table before it is attached. Attaching scans
+    the default partition and locks the parent, so this should run in a quiet period.
+    """
+    lower, upper = f"{start.isoformat()} 00:00:00+00", f"{end.isoformat()} 00:00:00+00"
+    bounds = f"FOR VALUES FROM ('{lower}') TO ('{upper}')"
+
+    if not default_partition_has_rows(cursor, lower, upper):
+        cursor.execute(f"CREATE TABLE {name} PARTITION OF {PARENT_TABLE} {bounds}")
+        return
+
+    cursor.execute(f"CREATE TABLE {name} (LIKE {PARENT_TABLE} INCLUDING DEFAULTS)")
+    cursor.execute(
+        f"WITH moved AS ("
+        f"DELETE FROM {DEFAULT_PARTITION} WHERE action_started_at >= %s AND action_started_at < %s RETURNING *"
+        f") INSERT INTO {name} SELECT * FROM moved",
+        [lower, upper],
+    )
+    cursor.execute(f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} {bounds}")
+
+
+def default_partition_has_rows(cursor, lower, upper):
+    cursor.execute("SELECT to_regclass(%s)", [DEFAULT_PARTITION])
+    if cursor.fetchone()[0] is None:
+        return False
+
+    cursor.execute(
+        f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE action_started_at >= %s AND action_started_at < %s)",
+        [lower, upper],
+    )
+    return cursor.fetchone()[0]
+
+
+def ensure_default_partition(cursor):
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {PARENT_TABLE} DEFAULT")
+
+
+def list_partitions(cursor):
+    """
+    (name, lower bound, upper bound) of every attached range partition, oldest first.
+    """
+    cursor.execute(
+        """
+        SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = %s
+        """,
+        [PARENT_TABLE],
+    )
+
+    partitions = []
+    for name, bound in cursor.fetchall():
+        match = BOUND_RE.search(bound)
+        if match is None:
+            # the default partition
+            continue
+        lower, upper = (datetime.datetime.fromisoformat(value) for value in match.groups())
+        partitions.append((name, lower, upper))
+
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def list_detached_partitions(cursor):
+    """
+    Tables named like partitions that are no longer attached, e.g. left over by an interrupted archive.
+    """
+    cursor.execute(
+        """
+        SELECT relname FROM pg_class
+        WHERE relkind = 'r' AND relname LIKE %s AND NOT relispartition
+        ORDER BY relname
+        """,
+        [PARTITION_PREFIX.replace('_', r'\_') + '%'],
+    )
+    return [name for name, in cursor.fetchall()]
+
+
+def detach_partition(cursor, name):
+    cursor.execute(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}")
+
+
+def archive_table(cursor, name, archive_dir):
+    """
+    Dump a detached partition to <archive_dir>/<name>.csv.gz, then drop it. Returns the file path.
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{name}.csv.gz")
+    partial_path = f"{path}.partial"
+
+    with gzip.open(partial_path, 'wb') as archive:
+        copy_to(cursor, f"COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)", archive)
+    os.replace(partial_path, path)
+
+    cursor.execute(f"DROP TABLE {name}")
+    return path
+
+
+def copy_to(cursor, sql, fileobj):
+    raw_cursor = cursor.cursor
+    if hasattr(raw_cursor, 'copy_expert'):
+        # psycopg2
+        raw_cursor.copy_expert(sql, fileobj)
+        return
+
+    with raw_cursor.copy(sql) as copy:
+        for data in copy:
+            fileobj.write(data)
@@ -0,0 +1,135 @@
+# logging_management/rollups.py
+
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import LatencyRollup
+from .sketch import LatencySketch
+
+
+class LatencyRollupManager:
+    """
+    Folds request logs into per-minute LatencyRollup rows, so latency percentiles
+    can be read without scanning the Log table.
+    """
+
+    bucket_size = datetime.timedelta(minutes=1)
+
+    @classmethod
+    def get_bucket(cls, moment):
+        return moment.replace(second=0, microsecond=0)
+
+    @classmethod
+    def get_action(cls, log_obj):
+        """
+        The view that handled the request, as set by LoggingMiddleware, so ids in the path
+        don't make a row per object. Falls back to the path for logs built elsewhere.
+        """
+        action = getattr(log_obj, 'view_name', None) or log_obj.action
+        return action[:LatencyRollup._meta.get_field('action').max_length]
+
+    @classmethod
+    def get_key(cls, log_obj):
+        return (
+            cls.get_bucket(log_obj.action_started_at),
+            cls.get_action(log_obj),
+            log_obj.method or '',
+            log_obj.status_code or 0,
+        )
+
+    @classmethod
+    def aggregate(cls, logs):
+        """
+        {key: (count, total_ms, max_ms, sketch)} of the logs that have both timestamps.
+        """
+        aggregates = {}
+        for log_obj in logs:
+            if log_obj.action_started_at is None or log_obj.action_completed_at is None:
+                continue
+
+            latency_ms = (log_obj.action_completed_at - log_obj.action_started_at).total_seconds() * 1000
+            key = cls.get_key(log_obj)
+            count, total_ms, max_ms, sketch = aggregates.get(key) or (
+                0, 0.0, 0.0, LatencySketch(settings.LATENCY_ROLLUPS['RELATIVE_ACCURACY'])
+            )
+            sketch.add(latency_ms)
+            aggregates[key] = (count + 1, total_ms + latency_ms, max(max_ms, latency_ms), sketch)
+
+        return aggregates
+
+    @classmethod
+    def record(cls, logs):
+        aggregates = cls.aggregate(logs)
+        if not aggregates:
+            return
+
+        with transaction.atomic():
+            # make sure every row exists, then lock and merge into all of them
+            LatencyRollup.objects.bulk_create(
+                [
+                    LatencyRollup(bucket=bucket, action=action, method=method, status_code=status_code)
+                    for bucket, action, method, status_code in aggregates
+                ],
+                ignore_conflicts=True,
+            )
+
+            buckets = {key[0] for key in aggregates}
+            actions = {key[1] for key in aggregates}
+            rollups = (
+                LatencyRollup.objects.select_for_update()
+                .filter(bucket__in=buckets, action__in=actions)
+                .order_by('id')
+            )
+
+            updated = []
+            for rollup in rollups:
+                aggregate = aggregates.get((rollup.bucket, rollup.action, rollup.method, rollup.status_code))
+                if aggregate is None:
+                    continue
+
+                count, total_ms, max_ms, sketch = aggregate
+                if rollup.sketch:
+                    sketch.merge(LatencySketch.from_dict(rollup.sketch))
+                rollup.count += count
+                rollup.total_ms += total_ms
+                rollup.max_ms = max(rollup.max_ms, max_ms)
+                rollup.sketch = sketch.to_dict()
+                updated.append(rollup)
+
+            LatencyRollup.objects.bulk_update(updated, ['count', 'total_ms', 'max_ms', 'sketch'])
+
+    @classmethod
+    def summarize(cls, rollups, group_by, quantiles):
+        """
+        Merge rollup rows by the group_by fields and compute their quantiles.
+        """
+        groups = {}
+        for rollup in rollups:
+            key = tuple(getattr(rollup, field) for field in group_by)
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = {
+                    'count': 0,
+                    'total_ms': 0.0,
+                    'max_ms': 0.0,
+                    'sketch': LatencySketch(settings.LATENCY_ROLLUPS['RELATIVE_ACCURACY']),
+                }
+
+            group['count'] += rollup.count
+            group['total_ms'] += rollup.total_ms
+            group['max_ms'] = max(group['max_ms'], rollup.max_ms)
+            group['sketch'].merge(LatencySketch.from_dict(rollup.sketch))
+
+        results = []
+        for key, group in groups.items():
+            result = dict(zip(group_by, key))
+            result['count'] = group['count']
+            result['mean_ms'] = group['total_ms'] / group['count'] if group['count'] else None
+            result['max_ms'] = group['max_ms']
+            for quantile in quantiles:
+                result[f"p{quantile:g}"] = group['sketch'].quantile(quantile / 100)
+            results.append(result)
+
+        return sorted(results, key=lambda result: result['count'], reverse=True)
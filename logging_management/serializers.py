@@ -48,4 +48,31 @@ class LogCreateSerializer(serializers.Serializer):
             'payload': instance.payload,
             'ip_addr': instance.ip_addr,
             'action_started_at': instance.action_started_at
-        }
\ No newline at end of file
+        }
+
+class LatencyQuerySerializer(serializers.Serializer):
+    GROUP_BY_FIELDS = ['action', 'method', 'status_code']
+
+    since = serializers.DateTimeField(required=False)
+    until = serializers.DateTimeField(required=False)
+    action = serializers.CharField(required=False)
+    method = serializers.CharField(required=False)
+    status_code = serializers.IntegerField(required=False)
+    group_by = serializers.CharField(required=False, default='action,method')
+    percentiles = serializers.CharField(required=False, default='50,95,99')
+
+    def validate_group_by(self, value):
+        group_by = [field for field in value.split(',') if field]
+        invalid = set(group_by) - set(self.GROUP_BY_FIELDS)
+        if invalid:
+            raise serializers.ValidationError(f"Can only group by {', '.join(self.GROUP_BY_FIELDS)}.")
+        return group_by
+
+    def validate_percentiles(self, value):
+        try:
+            percentiles = [float(percentile) for percentile in value.split(',') if percentile]
+        except ValueError:
+            raise serializers.ValidationError("Percentiles must be numbers.")
+        if not percentiles or any(not 0 <= percentile <= 100 for percentile in percentiles):
+            raise serializers.ValidationError("Percentiles must be between 0 and 100.")
+        return percentiles
@@ -0,0 +1,81 @@
+# logging_management/sketch.py
+
+import math
+
+
+class LatencySketch:
+    """
+    Mergeable quantile sketch over positive values (DDSketch style).
+
+    Values are counted in logarithmic buckets, so any quantile it returns is within
+    `relative_accuracy` of the true value. Sketches with the same accuracy can be
+    merged by adding their bucket counts, which is what makes per-minute rollups
+    combinable over arbitrary time windows.
+    """
+
+    # values at or below this are counted as zero
+    min_value = 1e-3
+
+    def __init__(self, relative_accuracy=0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def _key(self, value):
+        return math.ceil(math.log(value) / self._log_gamma)
+
+    def _value(self, key):
+        # the point in the middle of the bucket, relative error-wise
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def add(self, value, count=1):
+        if value <= self.min_value:
+            self.zero_count += count
+        else:
+            key = self._key(value)
+            self.bins[key] = self.bins.get(key, 0) + count
+        self.count += count
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with different relative accuracies")
+
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if rank < seen:
+                return self._value(key)
+
+        return self._value(max(self.bins))
+
+    def to_dict(self):
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'zero_count': self.zero_count,
+            # JSON object keys have to be strings
+            'bins': {str(key): count for key, count in self.bins.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['relative_accuracy'])
+        sketch.zero_count = data['zero_count']
+        sketch.bins = {int(key): count for key, count in data['bins'].items()}
+        sketch.count = sketch.zero_count + sum(sketch.bins.values())
+        return sketch
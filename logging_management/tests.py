@@ -1,3 +1,308 @@
-from django.test import TestCase
+import datetime
+import json
+import os
+import tempfile
+from unittest import mock, skipIf, skipUnless
 
-# Create your tests here.
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase, override_settings
+from django.utils import timezone
+
+from accounts.blocklist import BlocklistManager
+from friend_management.models import Friend
+from social_network.testing import BaseTestCase
+
+from .benchmark import DEFAULT_SCENARIOS, BenchmarkData, BenchmarkRunner, BenchmarkServer, load_scenarios, percentile
+from .buffer import LogBuffer
+from .metrics import PoolCollector
+from .models import LatencyRollup, Log
+from .partitions import DEFAULT_PARTITION, ensure_partitions, list_partitions, partition_name
+from .rollups import LatencyRollupManager
+
+
+class LogBufferTests(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # batches are written by the tests themselves instead of a flusher thread
+        started = mock.patch.object(LogBuffer, '_ensure_started')
+        started.start()
+        self.addCleanup(started.stop)
+
+    def test_flush_writes_queued_logs_in_batches(self):
+        buffer = LogBuffer(batch_size=2)
+        for index in range(5):
+            buffer.put(Log(action=f"/{index}/"))
+
+        self.assertEqual(Log.objects.count(), 0)
+        buffer.flush()
+
+        self.assertEqual(sorted(Log.objects.values_list('action', flat=True)), [f"/{index}/" for index in range(5)])
+        self.assertEqual((buffer.written, buffer.dropped), (5, 0))
+
+    def test_drop_newest_drops_the_incoming_log(self):
+        buffer = LogBuffer(max_size=1, overflow="drop_newest")
+        buffer.put(Log(action="/first/"))
+        buffer.put(Log(action="/second/"))
+        buffer.flush()
+
+        self.assertEqual(list(Log.objects.values_list('action', flat=True)), ["/first/"])
+        self.assertEqual(buffer.dropped, 1)
+
+    def test_drop_oldest_evicts_the_queued_log(self):
+        buffer = LogBuffer(max_size=1, overflow="drop_oldest")
+        buffer.put(Log(action="/first/"))
+        buffer.put(Log(action="/second/"))
+        buffer.flush()
+
+        self.assertEqual(list(Log.objects.values_list('action', flat=True)), ["/second/"])
+        self.assertEqual(buffer.dropped, 1)
+
+    def test_block_drops_the_log_after_the_timeout(self):
+        buffer = LogBuffer(max_size=1, overflow="block", block_timeout=0.01)
+        buffer.put(Log(action="/first/"))
+        buffer.put(Log(action="/second/"))
+
+        self.assertEqual(buffer.dropped, 1)
+
+    def test_sync_writes_inline_without_closing_the_request_connection(self):
+        buffer = LogBuffer(max_size=1, overflow="sync")
+        buffer.put(Log(action="/first/"))
+        with mock.patch('logging_management.buffer.close_old_connections') as close_old_connections:
+            buffer.put(Log(action="/second/"))
+
+        close_old_connections.assert_not_called()
+        self.assertEqual(list(Log.objects.values_list('action', flat=True)), ["/second/"])
+
+    def test_a_bad_log_only_drops_itself(self):
+        buffer = LogBuffer()
+        buffer.put(Log(action="/first/"))
+        buffer.put(Log(action="/bad/", status_code="not a status code"))
+        buffer.put(Log(action="/third/"))
+
+        with self.assertLogs('logging_management.buffer', 'ERROR'):
+            buffer.flush()
+
+        self.assertEqual(sorted(Log.objects.values_list('action', flat=True)), ["/first/", "/third/"])
+        self.assertEqual((buffer.written, buffer.dropped), (2, 1))
+
+    def test_unknown_overflow_policy(self):
+        with self.assertRaises(ValueError):
+            LogBuffer(overflow="ignore")
+
+
+class LoggingMiddlewareTests(BaseTestCase):
+
+    def test_logs_the_request(self):
+        response = self.get_client().post('/login/', {'email': 'nobody@example.com', 'password': 'password'})
+
+        log = Log.objects.get()
+        self.assertEqual((log.action, log.method, log.status_code), ('/login/', 'POST', response.status_code))
+
+    def test_long_paths_are_truncated(self):
+        path = '/' + 'a' * 200 + '/'
+        self.get_client().get(path)
+
+        self.assertEqual(Log.objects.get().action, path[:Log._meta.get_field('action').max_length])
+
+    @override_settings(LOG_BUFFER=dict(BaseTestCase._overridden_settings['LOG_BUFFER'], ENABLED=True))
+    def test_buffered_logs_are_not_written_in_the_request(self):
+        with mock.patch('logging_management.middleware.log_buffer') as log_buffer:
+            self.get_client().get('/friends/')
+
+        log_buffer.put.assert_called_once()
+        self.assertFalse(Log.objects.exists())
+
+
+class LatencyRollupTests(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.alice = self.create_user('alice@example.com', role='admin')
+        self.client = self.get_client(self.alice)
+
+    def test_requests_are_rolled_up_per_view(self):
+        for user in (self.create_user('bob@example.com'), self.create_user('carol@example.com')):
+            BlocklistManager.block(self.alice.id, user.id)
+            self.assertEqual(self.client.delete(f'/unblock_user/{user.id}/').status_code, 204)
+
+        rollup = LatencyRollup.objects.get(method='DELETE')
+        self.assertEqual((rollup.action, rollup.count), ('unblock_user_by_id', 2))
+
+        response = self.client.get('/logs/latency/', {'action': 'unblock_user_by_id', 'percentiles': '50,99'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['count'] for result in response.json()['results']], [2])
+
+    def test_a_failed_rollup_does_not_fail_the_request(self):
+        with mock.patch.object(LatencyRollupManager, 'record', side_effect=RuntimeError), \
+                self.assertLogs('logging_management.middleware', 'ERROR'):
+            response = self.client.get('/friends/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(Log.objects.filter(action='/friends/').exists())
+
+    def test_logs_without_a_view_fall_back_to_their_path(self):
+        started_at = timezone.now()
+        LatencyRollupManager.record([Log(action='/' + 'a' * 200, method='GET', status_code=200,
+                                         action_started_at=started_at, action_completed_at=started_at)])
+
+        self.assertEqual(LatencyRollup.objects.get().action, '/' + 'a' * 99)
+
+
+class MetricsTests(BaseTestCase):
+
+    def test_metrics_need_an_admin_or_the_metrics_token(self):
+        self.assertEqual(self.get_client().get('/metrics').status_code, 403)
+        self.assertEqual(self.get_client(self.create_user('bob@example.com')).get('/metrics').status_code, 403)
+
+        response = self.get_client(self.create_user('alice@example.com', role='admin')).get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'http_requests_total', response.content)
+
+        with override_settings(METRICS_TOKEN='secret'):
+            client = self.get_client()
+            client.credentials(HTTP_AUTHORIZATION='Bearer secret')
+            self.assertEqual(client.get('/metrics').status_code, 200)
+            client.credentials(HTTP_AUTHORIZATION='Bearer wrong')
+            self.assertEqual(client.get('/metrics').status_code, 403)
+
+    def test_pool_statistics_are_read_at_scrape_time(self):
+        pool = mock.Mock()
+        pool.get_stats.return_value = {
+            'pool_max': 10, 'pool_size': 4, 'pool_available': 1, 'requests_waiting': 2,
+            'requests_num': 7, 'requests_queued': 3, 'requests_wait_ms': 1500, 'requests_errors': 1,
+        }
+        pooled = mock.patch.dict(connection.settings_dict['OPTIONS'], {'pool': True})
+        with pooled, mock.patch.object(connections['default'], 'pool', pool, create=True):
+            self.get_client().get('/friends/')
+            pool.get_stats.assert_not_called()
+
+            samples = {
+                (sample.name, tuple(sample.labels.values())): sample.value
+                for family in PoolCollector().collect() for sample in family.samples
+            }
+
+        self.assertEqual(samples[('db_pool_connections', ('in_use',))], 3)
+        self.assertEqual(samples[('db_pool_requests_total', ('false',))], 4)
+        self.assertEqual(samples[('db_pool_wait_seconds_total', ())], 1.5)
+        self.assertEqual(samples[('db_pool_waiting_requests', ())], 2)
+
+
+class BenchmarkTests(BaseTestCase):
+
+    def test_percentile_is_the_nearest_rank(self):
+        values = list(range(1, 101))
+
+        self.assertEqual((percentile(values, 50), percentile(values, 99), percentile(values, 100)), (50, 99, 100))
+        self.assertIsNone(percentile([], 50))
+
+    def test_load_scenarios_fills_in_the_defaults(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as scenario_file:
+            scenario_file.write('{"name": "friends", "path": "/friends/"}\n\n')
+        self.addCleanup(os.remove, scenario_file.name)
+
+        self.assertEqual(load_scenarios(scenario_file.name), [
+            {'name': 'friends', 'path': '/friends/', 'method': 'GET', 'auth': True, 'weight': 1},
+        ])
+
+    def test_seeded_data_fills_in_the_requests(self):
+        data = BenchmarkData(users=5, friendships=3, pending_requests=2, seed=1)
+        data.seed()
+
+        self.assertEqual((len(data.users), Friend.objects.count(), len(data.pending_requests)), (5, 3, 2))
+
+        scenario = next(scenario for scenario in DEFAULT_SCENARIOS if scenario['name'] == 'accept_friend_request')
+        friend_request_id, to_user_id = data.pending_requests[0]
+        method, path, body, headers = data.build_request(scenario)
+        self.assertEqual((method, path, json.loads(body)), ('POST', '/accept_friend_request/', {'friend_request_id': friend_request_id}))
+        self.assertEqual(headers['Authorization'], f"Bearer {data.tokens[to_user_id]}")
+
+        register = next(scenario for scenario in DEFAULT_SCENARIOS if scenario['name'] == 'register')
+        emails = {json.loads(data.build_request(register)[2])['email'] for _ in range(2)}
+        self.assertEqual(len(emails), 2)
+        self.assertNotIn('Authorization', data.build_request(register)[3])
+
+    def test_report_counts_failed_calls_as_errors(self):
+        scenarios = [{'name': 'friends', 'method': 'GET', 'path': '/friends/', 'auth': False, 'weight': 1}]
+        data = mock.Mock(build_request=mock.Mock(return_value=('GET', '/friends/', None, {})))
+        runner = BenchmarkRunner(mock.Mock(), data, scenarios, total_requests=4, concurrency=2)
+
+        samples = iter([(200, 0.01, 3), (200, 0.02, 3), (500, 0.03, 5), (None, 0.04, None)])
+        with mock.patch.object(runner, '_call', side_effect=lambda *args: next(samples)):
+            runner.run()
+        report = runner.report()
+
+        endpoint = report['endpoints']['friends']
+        self.assertEqual((report['requests'], report['errors']), (4, 2))
+        self.assertEqual(endpoint['status_codes'], {'200': 2, '500': 1, 'None': 1})
+        self.assertEqual(endpoint['latency_ms']['max'], 40)
+        self.assertEqual((endpoint['db_queries']['mean'], endpoint['db_queries']['max']), (11 / 3, 5))
+
+    def test_unreachable_server_is_a_failed_call(self):
+        server = BenchmarkServer()
+        server.start()
+        server.stop()
+        runner = BenchmarkRunner(server, mock.Mock(), [], total_requests=0, concurrency=1, timeout=1)
+
+        status, _, queries = runner._call('GET', '/friends/', None, {})
+        self.assertEqual((status, queries), (None, None))
+
+
+class LogPartitionCommandTests(BaseTestCase):
+
+    @skipIf(connection.vendor == 'postgresql', "runs where partitioning is unavailable")
+    def test_requires_postgresql(self):
+        with self.assertRaisesMessage(CommandError, "requires PostgreSQL"):
+            call_command('manage_log_partitions')
+
+
+@skipUnless(connection.vendor == 'postgresql', "Log partitioning requires PostgreSQL")
+class LogPartitionTests(BaseTestCase):
+
+    def count_rows(self, table):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {table}")
+            return cursor.fetchone()[0]
+
+    def test_creates_partitions_ahead(self):
+        call_command('manage_log_partitions', ahead=2, retention_days=0, stdout=mock.Mock())
+
+        today = timezone.now().date()
+        with connection.cursor() as cursor:
+            names = {name for name, _, _ in list_partitions(cursor)}
+        self.assertLessEqual({partition_name(today + datetime.timedelta(days=day)) for day in range(3)}, names)
+
+    def test_rows_in_the_default_partition_are_moved_to_their_new_partition(self):
+        day = timezone.now().date() + datetime.timedelta(days=365)
+        Log.objects.create(action="/later/", action_started_at=datetime.datetime.combine(day, datetime.time(12), datetime.timezone.utc))
+        self.assertEqual(self.count_rows(DEFAULT_PARTITION), 1)
+
+        with connection.cursor() as cursor:
+            self.assertEqual(ensure_partitions(cursor, day, day, 'daily'), [partition_name(day)])
+
+        self.assertEqual(self.count_rows(DEFAULT_PARTITION), 0)
+        self.assertEqual(self.count_rows(partition_name(day)), 1)
+        self.assertEqual(Log.objects.get().action, "/later/")
+
+
+@skipUnless(connection.vendor == 'postgresql', "Log partitioning requires PostgreSQL")
+class PartitionMigrationTests(TransactionTestCase):
+
+    def migrate(self, *targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(list(targets))
+
+    def test_unpartition_and_partition_again(self):
+        Log.objects.create(action="/kept/", action_started_at=timezone.now())
+        self.addCleanup(self.migrate, *MigrationExecutor(connection).loader.graph.leaf_nodes('logging_management'))
+
+        self.migrate(('logging_management', '0006_keyset_indexes'))
+        self.assertEqual(list(Log.objects.values_list('action', flat=True)), ["/kept/"])
+        later = Log.objects.create(action="/after/", action_started_at=timezone.now())
+        self.assertGreater(later.id, Log.objects.get(action="/kept/").id)
+
+        self.migrate(('logging_management', '0007_partition_log'))
+        self.assertEqual(Log.objects.count(), 2)
+        self.assertGreater(Log.objects.create(action="/last/", action_started_at=timezone.now()).id, later.id)
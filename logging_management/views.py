@@ -1,20 +1,58 @@
 # logging_management/views.py
 
+import datetime
+import hmac
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils import timezone
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 
-from .serializers import LogListSerializer, LogDetailSerializer, LogCreateSerializer
-from .models import Log
+from .serializers import LogListSerializer, LogDetailSerializer, LogCreateSerializer, LatencyQuerySerializer
+from .models import Log, LatencyRollup
+from .metrics import render_metrics
+from .rollups import LatencyRollupManager
 
-from accounts.permissions import RoleBasedPermission
+from accounts.authentication import get_authenticated_user
+from accounts.permissions import RoleBasedPermission, AdminRolePermission
+from social_network.pagination import KeysetPagination
 
 class LogListView(generics.ListAPIView):
-    queryset = Log.objects.all().order_by('-action_started_at')
+    queryset = Log.objects.all().order_by('-action_started_at', '-id')
     serializer_class = LogListSerializer
     permission_classes = (permissions.IsAuthenticated, RoleBasedPermission)
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-action_started_at', '-id')
+
+    throttle_scope = 'logs'
+
+
+class LatencyPercentileView(generics.GenericAPIView):
+    """
+    Request counts and latency percentiles per endpoint, computed from the per-minute rollups.
+    """
+    serializer_class = LatencyQuerySerializer
+    permission_classes = (permissions.IsAuthenticated, AdminRolePermission)
 
     throttle_scope = 'logs'
 
+    def get(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+
+        until = params.get('until') or timezone.now()
+        since = params.get('since') or until - datetime.timedelta(minutes=settings.LATENCY_ROLLUPS['DEFAULT_WINDOW'])
+
+        rollups = LatencyRollup.objects.filter(bucket__gte=LatencyRollupManager.get_bucket(since), bucket__lt=until)
+        for field in ('action', 'method', 'status_code'):
+            if field in params:
+                rollups = rollups.filter(**{field: params[field]})
+
+        results = LatencyRollupManager.summarize(rollups.iterator(), params['group_by'], params['percentiles'])
+        return Response({'since': since, 'until': until, 'results': results})
+
 
 class LogDetailView(generics.RetrieveAPIView):
     queryset = Log.objects.all()
@@ -39,3 +77,27 @@ class LogCreateView(generics.CreateAPIView):
     
     def get_serializer_context(self):
         return {'user_id': self.request.user.id}
+
+
+def can_read_metrics(request):
+    """
+    Whether the request carries METRICS_TOKEN or an admin's access token.
+    """
+    if settings.METRICS_TOKEN and hmac.compare_digest(
+        request.headers.get('Authorization', '').encode(), f"Bearer {settings.METRICS_TOKEN}".encode()
+    ):
+        return True
+
+    user = get_authenticated_user(request)
+    return user is not None and user.role == 'admin'
+
+
+def metrics_view(request):
+    """
+    Prometheus text exposition of the metrics of every worker process.
+    """
+    if not can_read_metrics(request):
+        return HttpResponse(status=status.HTTP_403_FORBIDDEN)
+
+    content, content_type = render_metrics()
+    return HttpResponse(content, content_type=content_type)
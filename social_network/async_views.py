@@ -0,0 +1,125 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.http import JsonResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+from rest_framework.settings import api_settings
+from rest_framework.views import exception_handler
+
+from accounts.authentication import RequestCachedJWTAuthentication
+from accounts.relationships import UserRelationships
+
+from .fieldsets import SparseFieldsetViewMixin
+
+
+class AsyncAPIView(View):
+    """
+    Async counterpart of APIView for read endpoints served under ASGI.
+
+    DRF views are sync only, so this runs the project's JWT authentication, the view's
+    permission classes and DRF's throttles around an async handler, and turns APIExceptions
+    into the same JSON errors DRF's exception handler produces.
+    """
+    permission_classes = api_settings.DEFAULT_PERMISSION_CLASSES
+    throttle_classes = api_settings.DEFAULT_THROTTLE_CLASSES
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # token authenticated like the DRF views, so no CSRF check
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        # what DRF's pagination classes read from a request
+        request.query_params = request.GET
+
+        try:
+            await self.initial(request)
+            return await super().dispatch(request, *args, **kwargs)
+        except Exception as exc:
+            return self.handle_exception(exc)
+
+    async def initial(self, request):
+        self.authenticator = RequestCachedJWTAuthentication()
+        result = await self.authenticator.aauthenticate(request)
+        request.user, request.auth = result if result is not None else (AnonymousUser(), None)
+
+        self.check_permissions(request)
+        await self.check_throttles(request)
+
+    def check_permissions(self, request):
+        for permission in [permission_class() for permission_class in self.permission_classes]:
+            if not permission.has_permission(request, self):
+                if not request.user.is_authenticated:
+                    raise exceptions.NotAuthenticated()
+                raise exceptions.PermissionDenied(getattr(permission, 'message', None))
+
+    async def check_throttles(self, request):
+        # the throttle history lives in the sync cache client
+        durations = []
+        for throttle in [throttle_class() for throttle_class in self.throttle_classes]:
+            if not await sync_to_async(throttle.allow_request, thread_sensitive=False)(request, self):
+                durations.append(throttle.wait())
+
+        if durations:
+            durations = [duration for duration in durations if duration is not None]
+            raise exceptions.Throttled(max(durations, default=None))
+
+    def get_serializer_context(self):
+        return {'request': self.request, 'view': self}
+
+    def filter_queryset(self, queryset):
+        return queryset
+
+    def handle_exception(self, exc):
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            exc.auth_header = self.authenticator.authenticate_header(self.request)
+
+        response = exception_handler(exc, {'view': self, 'request': self.request})
+        if response is None:
+            raise exc
+
+        headers = {header: value for header, value in response.items() if header in ('WWW-Authenticate', 'Retry-After')}
+        return JsonResponse(response.data, status=response.status_code, headers=headers, safe=False)
+
+
+class AsyncListAPIView(SparseFieldsetViewMixin, AsyncAPIView):
+    """
+    Async ListAPIView over users (or items with a nested user named `relationship_user_field`).
+    The page's friend and block status is loaded with the async cache clients before
+    serializing, so the serializer does no I/O of its own.
+    """
+    serializer_class = None
+    pagination_class = api_settings.DEFAULT_PAGINATION_CLASS
+    relationship_user_field = None
+
+    async def aget_queryset(self):
+        raise NotImplementedError
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('context', self.get_serializer_context())
+        return self.serializer_class(*args, **kwargs)
+
+    async def apaginate_queryset(self, queryset):
+        if hasattr(self.paginator, 'apaginate_queryset'):
+            return await self.paginator.apaginate_queryset(queryset, self.request, view=self)
+        return await sync_to_async(self.paginator.paginate_queryset)(queryset, self.request, view=self)
+
+    async def aget_serializer_context(self, page):
+        field = self.relationship_user_field
+        prefix = f"{field}." if field else ""
+        user_ids = [getattr(item, f"{field}_id") if field else item.id for item in page]
+
+        # only the relationships the response shows
+        fieldset = self.get_fieldset()
+        relationships = await UserRelationships(self.request.user, user_ids).aload(
+            friends=fieldset.includes(f"{prefix}is_friend"), blocked=fieldset.includes(f"{prefix}is_blocked"),
+        )
+        return {**self.get_serializer_context(), 'request_user': self.request.user, 'relationships': relationships}
+
+    async def get(self, request, *args, **kwargs):
+        self.paginator = self.pagination_class()
+        page = await self.apaginate_queryset(self.filter_queryset(await self.aget_queryset()))
+
+        serializer = self.get_serializer(page, many=True, context=await self.aget_serializer_context(page))
+        return JsonResponse(self.paginator.get_paginated_response(serializer.data).data)
@@ -0,0 +1,147 @@
+import hashlib
+import json
+import time
+
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from friend_management.cache import UserCacheVersions
+
+
+class BaseVersionedResponseMixin:
+    """
+    List view mixin for pages that only change when the request user's cache version of
+    cache_type (see UserCacheVersions) is bumped.
+
+    The page's strong ETag is derived from that version and the query string, so a client
+    sending it back in If-None-Match gets a 304 without a database query. The rendered body
+    is cached under the same version, and read along with it in one call (UserCacheVersions.read()),
+    so other repeated reads are served from the cache too, and from the process itself when
+    LOCAL_CACHE is enabled, until the next bump reaches it over pub/sub. A page built while the version
+    was bumped gets neither, as it may or may not show the change behind the bump.
+
+    Only the writes that bump the version are covered, not the profiles of the listed users
+    (names, email, role). A profile changed outside the API, e.g. in the admin, shows up in
+    these pages once the version is next bumped, or once the cached body expires for
+    clients that do not send an ETag.
+    """
+    cache_type = None
+    response_cache_key = "response_cache_{{user_id}}_{digest}_{{version}}"
+    response_cache_timeout = 60 * 60
+
+    def get_response_digest(self, request, media_type):
+        params = sorted((key, request.GET.getlist(key)) for key in request.GET)
+        identity = [type(self).__name__, request.user.id, media_type, params]
+        return hashlib.sha1(json.dumps(identity).encode()).hexdigest()
+
+    def read_response(self, request, media_type):
+        """
+        The page's key template, ETag, version, cached (content_type, content) or None, and
+        the rebuild lock (see UserCacheVersions.read()).
+        """
+        digest = self.get_response_digest(request, media_type)
+        key_template = self.response_cache_key.format(digest=digest)
+        version, cached, lock = UserCacheVersions.read(request.user.id, self.cache_type, key_template)
+        return key_template, f'"{digest}-{version}"', version, cached, lock
+
+    async def aread_response(self, request, media_type):
+        digest = self.get_response_digest(request, media_type)
+        key_template = self.response_cache_key.format(digest=digest)
+        version, cached, lock = await UserCacheVersions.aread(request.user.id, self.cache_type, key_template)
+        return key_template, f'"{digest}-{version}"', version, cached, lock
+
+    def is_not_modified(self, request, etag):
+        etags = parse_etags(request.headers.get('If-None-Match', ''))
+        return etag in etags or '*' in etags
+
+
+class VersionedResponseMixin(BaseVersionedResponseMixin):
+    """
+    BaseVersionedResponseMixin for DRF list views.
+    """
+
+    def get(self, request, *args, **kwargs):
+        self.key_template, self.etag, self.version, cached, self.lock = self.read_response(request, request.accepted_media_type)
+
+        if self.is_not_modified(request, self.etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED)
+
+        # the lock holder rebuilds the page even when one is cached, as it is due for an early refresh
+        if cached is not None and self.lock is None:
+            content_type, content = cached
+            return HttpResponse(content, content_type=content_type)
+
+        self.started_at = time.monotonic()
+        try:
+            return super().get(request, *args, **kwargs)
+        except Exception:
+            # errors handled by DRF go through finalize_response(), which releases the lock
+            # too, the others do not
+            lock, self.lock = self.lock, None
+            if lock is not None:
+                lock.release()
+            raise
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if getattr(self, 'etag', None) is None:
+            return response
+
+        lock, self.lock = self.lock, None
+        if isinstance(response, Response) and response.status_code == status.HTTP_200_OK:
+            # built while another request rebuilt the page, which stores it
+            if lock is None:
+                return response
+
+            response.render()
+            # bumped while the page was built
+            if not UserCacheVersions.store(
+                request.user.id, self.cache_type, self.key_template, self.version, (response['Content-Type'], response.content),
+                self.response_cache_timeout, time.monotonic() - self.started_at, lock,
+            ):
+                return response
+        elif lock is not None:
+            lock.release()
+
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = self.etag
+        return response
+
+
+class AsyncVersionedResponseMixin(BaseVersionedResponseMixin):
+    """
+    BaseVersionedResponseMixin for AsyncListAPIView views.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        key_template, etag, version, cached, lock = await self.aread_response(request, 'application/json')
+
+        if self.is_not_modified(request, etag):
+            if lock is not None:
+                await lock.arelease()
+            return HttpResponseNotModified(headers={'ETag': etag})
+
+        if cached is not None and lock is None:
+            content_type, content = cached
+            return HttpResponse(content, content_type=content_type, headers={'ETag': etag})
+
+        started_at = time.monotonic()
+        try:
+            response = await super().get(request, *args, **kwargs)
+        except Exception:
+            if lock is not None:
+                await lock.arelease()
+            raise
+        if lock is None:
+            return response
+
+        if response.status_code != status.HTTP_200_OK:
+            await lock.arelease()
+        elif await UserCacheVersions.astore(
+            request.user.id, self.cache_type, key_template, version, (response['Content-Type'], response.content),
+            self.response_cache_timeout, time.monotonic() - started_at, lock,
+        ):
+            response['ETag'] = etag
+        return response
@@ -0,0 +1,173 @@
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+
+
+class Fieldset:
+    """
+    The ?fields= / ?exclude= selection of a request: comma separated field names, with dots
+    for the fields of nested objects, e.g. ?fields=id,to_user.id,to_user.first_name.
+
+    Naming an object keeps all of its fields, naming one of its fields keeps the object with
+    just the fields named. exclude wins over fields.
+    """
+
+    def __init__(self, fields=None, exclude=()):
+        self.fields = set(fields) if fields is not None else None
+        self.exclude = set(exclude)
+
+    @classmethod
+    def from_query_params(cls, query_params):
+        fields = cls.parse(query_params.get('fields'))
+        return cls(fields, cls.parse(query_params.get('exclude')) or ())
+
+    @staticmethod
+    def parse(value):
+        paths = [path.strip() for path in (value or '').split(',') if path.strip()]
+        return paths or None
+
+    def includes(self, path):
+        """
+        Whether the field at the dotted path is part of the output.
+        """
+        parts = path.split('.')
+        prefixes = {'.'.join(parts[:i]) for i in range(1, len(parts) + 1)}
+        if self.exclude & prefixes:
+            return False
+        if self.fields is None:
+            return True
+        return bool(self.fields & prefixes) or any(field.startswith(f"{path}.") for field in self.fields)
+
+
+def get_field_path(serializer, field_name):
+    """
+    Dotted path of a field of a (possibly nested) serializer from the root serializer.
+    """
+    names = [field_name]
+    while serializer.parent is not None:
+        if serializer.field_name:
+            names.append(serializer.field_name)
+        serializer = serializer.parent
+    return '.'.join(reversed(names))
+
+
+class SparseFieldsetMixin:
+    """
+    Serializer mixin dropping the fields the Fieldset in the context ('fieldset') leaves out.
+    Nested serializers with the mixin are pruned by the paths under their own field name.
+
+    Meta.source_columns maps fields that are not model fields (properties, method fields) to
+    the columns they read, for get_only_fields(). Method fields that only read the primary
+    key need no entry.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+
+        fieldset = self.context.get('fieldset')
+        if fieldset is None:
+            return fields
+
+        return {
+            name: field for name, field in fields.items()
+            if fieldset.includes(get_field_path(self, name))
+        }
+
+
+def get_only_fields(serializer, extra=()):
+    """
+    Model fields for QuerySet.only() that cover the readable fields of the serializer,
+    nested serializers included, plus the `extra` model fields. None when some field's
+    columns cannot be told.
+    """
+    model = serializer.Meta.model
+    source_columns = getattr(serializer.Meta, 'source_columns', {})
+    columns = [model._meta.pk.name]
+
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+
+        if name in source_columns:
+            columns.extend(source_columns[name])
+        elif isinstance(field, serializers.SerializerMethodField):
+            continue
+        elif isinstance(field, serializers.ModelSerializer):
+            nested = get_only_fields(field)
+            if nested is None:
+                return None
+            columns.append(field.source)
+            columns.extend(f"{field.source}__{column}" for column in nested)
+        elif isinstance(field, serializers.BaseSerializer):
+            return None
+        elif field.source != '*' and is_model_field(model, field.source):
+            columns.append(field.source)
+        else:
+            return None
+
+    columns.extend(name for name in extra if is_model_field(model, name))
+    return list(dict.fromkeys(columns))
+
+
+def is_model_field(model, name):
+    try:
+        model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return False
+    return True
+
+
+def apply_only_fields(queryset, columns):
+    """
+    queryset.only(*columns), keeping the relations it select_related()s loadable.
+    """
+    select_related = queryset.query.select_related
+    if isinstance(select_related, dict):
+        for relation in select_related:
+            # only(relation) alone would load every column of the related row
+            if not any(column.startswith(f"{relation}__") for column in columns):
+                related_pk = queryset.model._meta.get_field(relation).related_model._meta.pk.name
+                columns = [*columns, relation, f"{relation}__{related_pk}"]
+    return queryset.only(*dict.fromkeys(columns))
+
+
+class SparseFieldsetViewMixin:
+    """
+    List view mixin for serializers with SparseFieldsetMixin: reads ?fields= / ?exclude=,
+    passes the selection to the serializer and loads only the columns it renders.
+    """
+
+    def get_fieldset(self):
+        if not hasattr(self, '_fieldset'):
+            self._fieldset = Fieldset.from_query_params(self.request.query_params)
+        return self._fieldset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fieldset'] = self.get_fieldset()
+        return context
+
+    def get_ordering_fields(self):
+        if hasattr(self, 'get_keyset_ordering'):
+            ordering = self.get_keyset_ordering()
+        else:
+            ordering = getattr(self, 'keyset_ordering', ())
+        return [field.lstrip('-') for field in ordering]
+
+    def apply_fieldset(self, queryset):
+        """
+        queryset (or anything else with only()) limited to the columns the response needs.
+        """
+        fieldset = self.get_fieldset()
+        if fieldset.fields is None and not fieldset.exclude:
+            return queryset
+
+        # the cursor is read from the ordering fields of the last row
+        columns = get_only_fields(self.get_serializer(), self.get_ordering_fields())
+        if columns is None:
+            return queryset
+        if hasattr(queryset, 'query'):
+            return apply_only_fields(queryset, columns)
+        return queryset.only(*columns)
+
+    def filter_queryset(self, queryset):
+        return self.apply_fieldset(super().filter_queryset(queryset))
@@ -0,0 +1,196 @@
+import bisect
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import BooleanField, Expression, F, Value
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination, _reverse_ordering
+
+
+class RowValueComparison(Expression):
+    """
+    `(a, b, ...) > (x, y, ...)` (or another comparison operator), which compares rows the
+    way an index on (a, b, ...) orders them, so the database can answer it with a range scan.
+    """
+    conditional = True
+    output_field = BooleanField()
+
+    def __init__(self, fields, operator, values):
+        super().__init__()
+        self.fields = [F(field) for field in fields]
+        self.operator = operator
+        self.values = [Value(value) for value in values]
+
+    def get_source_expressions(self):
+        return [*self.fields, *self.values]
+
+    def set_source_expressions(self, expressions):
+        self.fields, self.values = expressions[:len(self.fields)], expressions[len(self.fields):]
+
+    def as_sql(self, compiler, connection):
+        sql, params = [], []
+        for expression in self.fields + self.values:
+            expression_sql, expression_params = compiler.compile(expression)
+            sql.append(expression_sql)
+            params.extend(expression_params)
+
+        count = len(self.fields)
+        return f"({', '.join(sql[:count])}) {self.operator} ({', '.join(sql[count:])})", params
+
+
+class KeysetIds:
+    """
+    The rows of queryset with the given primary keys, for lists whose ids are already at
+    hand (e.g. cached), paginated by KeysetPagination ordered by the primary key alone: the
+    page's ids are picked from the list and only those rows are loaded, by primary key.
+    """
+
+    def __init__(self, queryset, ids):
+        self.queryset = queryset
+        self.ids = sorted(ids)
+
+    def only(self, *fields):
+        return KeysetIds(self.queryset.only(*fields), self.ids)
+
+    def get_page_queryset(self, ordering, position, limit):
+        """
+        The first limit rows past position (or from the start) in ordering.
+        """
+        if ordering[0].startswith('-'):
+            ids = self.ids[:bisect.bisect_left(self.ids, position)] if position is not None else self.ids
+            ids = ids[::-1][:limit]
+        else:
+            ids = self.ids[bisect.bisect_right(self.ids, position):] if position is not None else self.ids
+            ids = ids[:limit]
+        return self.queryset.filter(pk__in=ids).order_by(*ordering)
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Keyset pagination ordered by the view's `keyset_ordering` (or `get_keyset_ordering()`).
+
+    The ordering must end in a unique field, have no null values and sort all its fields in
+    the same direction. The cursor holds the values of all of them for the row the page
+    starts after, and the page is the rows past it in row-value order, e.g.
+    `(created_at, id) > (%s, %s)`. With an index on the ordering every page is a single
+    index range scan, with no OFFSET and no COUNT(*).
+
+    The queryset may also be a KeysetIds. apaginate_queryset() is the same for async views,
+    fetching the page with the async ORM.
+    """
+    page_size_query_param = 'limit'
+    max_page_size = 100
+
+    def get_ordering(self, request, queryset, view):
+        if hasattr(view, 'get_keyset_ordering'):
+            ordering = tuple(view.get_keyset_ordering())
+        else:
+            ordering = tuple(view.keyset_ordering)
+
+        assert len({field.startswith('-') for field in ordering}) == 1, (
+            'Keyset pagination needs an ordering with every field in the same direction.'
+        )
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.get_page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+
+        return self.set_page(list(queryset[:self.page_size + 1]))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        queryset = self.get_page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+
+        return self.set_page([instance async for instance in queryset[:self.page_size + 1]])
+
+    def get_page_queryset(self, queryset, request, view=None):
+        """
+        The queryset to read the page from, ordered and filtered to the rows past the cursor.
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        self.reverse = self.cursor is not None and self.cursor.reverse
+        self.current_position = self.cursor.position if self.cursor is not None else None
+
+        ordering = _reverse_ordering(self.ordering) if self.reverse else self.ordering
+        fields = [field.lstrip('-') for field in ordering]
+
+        if isinstance(queryset, KeysetIds):
+            assert fields == [queryset.queryset.model._meta.pk.name], 'KeysetIds are ordered by the primary key alone.'
+            position = None
+            if self.current_position is not None:
+                position = self.decode_position(queryset.queryset, fields, self.current_position)[0]
+            return queryset.get_page_queryset(ordering, position, self.page_size + 1)
+
+        queryset = queryset.order_by(*ordering)
+        if self.current_position is not None:
+            values = self.decode_position(queryset, fields, self.current_position)
+            operator = '<' if ordering[0].startswith('-') else '>'
+            queryset = queryset.filter(RowValueComparison(fields, operator, values))
+        return queryset
+
+    def decode_position(self, queryset, fields, position):
+        try:
+            values = json.loads(position)
+            if not isinstance(values, list) or len(values) != len(fields):
+                raise ValueError
+            return [self.get_field(queryset, field).to_python(value) for field, value in zip(fields, values)]
+        except (ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def get_field(queryset, name):
+        if name in queryset.query.annotations:
+            return queryset.query.annotations[name].output_field
+        return queryset.model._meta.get_field(name)
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = []
+        for field in ordering:
+            value = instance[field.lstrip('-')] if isinstance(instance, dict) else getattr(instance, field.lstrip('-'))
+            values.append(str(value))
+        return json.dumps(values)
+
+    def set_page(self, results):
+        self.page = list(results[:self.page_size])
+        has_following = len(results) > len(self.page)
+
+        if self.reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = self.current_position is not None
+            self.has_previous = has_following
+        else:
+            self.has_next = has_following
+            self.has_previous = self.current_position is not None
+
+        # the page continues after its last row and goes back from its first one
+        if self.page:
+            self.next_position = self._get_position_from_instance(self.page[-1], self.ordering)
+            self.previous_position = self._get_position_from_instance(self.page[0], self.ordering)
+        else:
+            self.next_position = self.previous_position = self.current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=self.next_position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=self.previous_position))
@@ -35,6 +35,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'accounts',
     'encrypted_model_fields',
     'friend_management',
@@ -46,6 +47,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'logging_management.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -91,6 +93,49 @@ DATABASES = {
     }
 }
 
+# Minimum similarity for the trigram % operator used by user search.
+SEARCH_TRIGRAM_THRESHOLD = float(os.environ.get("SEARCH_TRIGRAM_THRESHOLD", 0.1))
+
+# PostgreSQL connection handling. With DB_POOL each worker process keeps a psycopg 3
+# connection pool (Django's "pool" option), which also serves the ASGI views whose queries run
+# on a new thread per request. Without it connections persist for DB_CONN_MAX_AGE seconds and
+# are health checked before reuse. Timeouts are in seconds, STATEMENT_TIMEOUT in milliseconds
+# (0 for none) and applies to every statement, management commands included.
+DATABASE_CONNECTIONS = {
+    'POOL': bool(int(os.environ.get("DB_POOL", 0))),
+    'POOL_MIN_SIZE': int(os.environ.get("DB_POOL_MIN_SIZE", 2)),
+    'POOL_MAX_SIZE': int(os.environ.get("DB_POOL_MAX_SIZE", 10)),
+    # how long a request waits for a free pooled connection before failing
+    'POOL_TIMEOUT': float(os.environ.get("DB_POOL_TIMEOUT", 10)),
+    'POOL_MAX_IDLE': float(os.environ.get("DB_POOL_MAX_IDLE", 600)),
+    'POOL_MAX_LIFETIME': float(os.environ.get("DB_POOL_MAX_LIFETIME", 3600)),
+    'CONN_MAX_AGE': int(os.environ.get("DB_CONN_MAX_AGE", 60)),
+    'CONNECT_TIMEOUT': int(os.environ.get("DB_CONNECT_TIMEOUT", 10)),
+    'STATEMENT_TIMEOUT': int(os.environ.get("DB_STATEMENT_TIMEOUT", 0)),
+}
+
+if DATABASES["default"]["ENGINE"] == "django.db.backends.postgresql":
+    options = f"-c pg_trgm.similarity_threshold={SEARCH_TRIGRAM_THRESHOLD}"
+    if DATABASE_CONNECTIONS['STATEMENT_TIMEOUT']:
+        options += f" -c statement_timeout={DATABASE_CONNECTIONS['STATEMENT_TIMEOUT']}"
+
+    DATABASES["default"]["OPTIONS"] = {
+        "options": options,
+        "connect_timeout": DATABASE_CONNECTIONS['CONNECT_TIMEOUT'],
+    }
+    DATABASES["default"]["CONN_HEALTH_CHECKS"] = True
+
+    if DATABASE_CONNECTIONS['POOL']:
+        DATABASES["default"]["OPTIONS"]["pool"] = {
+            "min_size": DATABASE_CONNECTIONS['POOL_MIN_SIZE'],
+            "max_size": DATABASE_CONNECTIONS['POOL_MAX_SIZE'],
+            "timeout": DATABASE_CONNECTIONS['POOL_TIMEOUT'],
+            "max_idle": DATABASE_CONNECTIONS['POOL_MAX_IDLE'],
+            "max_lifetime": DATABASE_CONNECTIONS['POOL_MAX_LIFETIME'],
+        }
+    else:
+        DATABASES["default"]["CONN_MAX_AGE"] = DATABASE_CONNECTIONS['CONN_MAX_AGE']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -155,15 +200,18 @@ AUTHENTICATION_BACKENDS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.RequestCachedJWTAuthentication',
     ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
     'PAGE_SIZE': 10,
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.ScopedRateThrottle',
+        'social_network.throttling.MeteredScopedRateThrottle',
     ],
     'DEFAULT_THROTTLE_RATES': {
         'friend_requests': '3/minute',
+        # calls of the bulk friend request endpoints, each with up to FRIEND_REQUEST_BATCH_LIMIT ids;
+        # every id sent through send_friend_requests/ also counts against friend_requests
+        'bulk_friend_requests': '3/minute',
         'login': '5/minute',
         'register': '5/minute',
         'search': '10/minute',
@@ -173,6 +221,102 @@ REST_FRAMEWORK = {
 
 FRIEND_REQUEST_TIMEOUT = int(os.environ.get("FRIEND_REQUEST_TIMEOUT", 24))
 
+# Serve friends/, friend_requests/ and search/ with their async views, for when the project
+# runs under an ASGI server (the production compose file does).
+ASYNC_READ_VIEWS = bool(int(os.environ.get("ASYNC_READ_VIEWS", 0)))
+
+# Most ids accepted by one call of the bulk friend request endpoints
+FRIEND_REQUEST_BATCH_LIMIT = int(os.environ.get("FRIEND_REQUEST_BATCH_LIMIT", 100))
+
+# Authenticate access tokens that carry role/is_active claims without loading the user row.
+# Role changes and deactivations then take effect when the current access token expires.
+JWT_CLAIMS_USER = bool(int(os.environ.get("JWT_CLAIMS_USER", 0)))
+
+FRIEND_SUGGESTIONS_LIMIT = int(os.environ.get("FRIEND_SUGGESTIONS_LIMIT", 50))
+
+# Change feed behind changes/?since=: PAGE_SIZE changes per page by default, up to
+# MAX_PAGE_SIZE. Changes are served once SETTLE_SECONDS old, and pruned by the
+# prune_friendship_changes command after RETENTION_DAYS, PRUNE_BATCH_SIZE per transaction.
+FRIENDSHIP_CHANGES = {
+    'PAGE_SIZE': int(os.environ.get("FRIENDSHIP_CHANGES_PAGE_SIZE", 100)),
+    'MAX_PAGE_SIZE': int(os.environ.get("FRIENDSHIP_CHANGES_MAX_PAGE_SIZE", 1000)),
+    'SETTLE_SECONDS': float(os.environ.get("FRIENDSHIP_CHANGES_SETTLE_SECONDS", 1)),
+    'RETENTION_DAYS': int(os.environ.get("FRIENDSHIP_CHANGES_RETENTION_DAYS", 30)),
+    'PRUNE_BATCH_SIZE': int(os.environ.get("FRIENDSHIP_CHANGES_PRUNE_BATCH_SIZE", 10000)),
+}
+
+# Optional per-process Bloom filter of blocked users, letting blocklist checks skip the cache
+# for users nobody has blocked. Needs the Redis cache backend: new blocks reach the other
+# workers through Redis pub/sub on CHANNEL, and the filter is rebuilt from the database
+# every REFRESH_INTERVAL seconds.
+BLOCKLIST_BLOOM = {
+    'ENABLED': bool(int(os.environ.get("BLOCKLIST_BLOOM_ENABLED", 0))),
+    'CAPACITY': int(os.environ.get("BLOCKLIST_BLOOM_CAPACITY", 100000)),
+    'ERROR_RATE': float(os.environ.get("BLOCKLIST_BLOOM_ERROR_RATE", 0.01)),
+    'REFRESH_INTERVAL': float(os.environ.get("BLOCKLIST_BLOOM_REFRESH_INTERVAL", 30)),
+    'CHANNEL': os.environ.get("BLOCKLIST_BLOOM_CHANNEL", "blocklist_bloom_blocks"),
+}
+
+# Optional per-process cache in front of Redis for friend lists, friend request inboxes,
+# blocklists and the rendered pages of the versioned list views. Writes drop the entries in every worker through Redis pub/sub on CHANNEL;
+# TIMEOUT (seconds) bounds how long an entry can outlive a missed message.
+LOCAL_CACHE = {
+    'ENABLED': bool(int(os.environ.get("LOCAL_CACHE_ENABLED", 0))),
+    'MAX_ENTRIES': int(os.environ.get("LOCAL_CACHE_MAX_ENTRIES", 10000)),
+    'TIMEOUT': float(os.environ.get("LOCAL_CACHE_TIMEOUT", 10)),
+    'CHANNEL': os.environ.get("LOCAL_CACHE_CHANNEL", "local_cache_invalidation"),
+}
+
+# Rebuilding a missing cached value (friend lists, friend request inboxes, blocklists) is left
+# to one request at a time, holding a lock for at most LOCK_TIMEOUT seconds. The others poll
+# every WAIT_INTERVAL seconds for up to WAIT_TIMEOUT, then rebuild it themselves.
+# Values are also rebuilt early, at random, as they near expiry, and served as they are
+# meanwhile; EARLY_REFRESH_BETA > 1 refreshes earlier, 0 turns it off.
+CACHE_RECOMPUTE = {
+    'LOCK_TIMEOUT': float(os.environ.get("CACHE_RECOMPUTE_LOCK_TIMEOUT", 5)),
+    'WAIT_TIMEOUT': float(os.environ.get("CACHE_RECOMPUTE_WAIT_TIMEOUT", 1)),
+    'WAIT_INTERVAL': float(os.environ.get("CACHE_RECOMPUTE_WAIT_INTERVAL", 0.05)),
+    'EARLY_REFRESH_BETA': float(os.environ.get("CACHE_EARLY_REFRESH_BETA", 1)),
+}
+
+# Decrypted emails kept per process, keyed by ciphertext, so users that show up on many
+# pages in a burst are decrypted once.
+EMAIL_DECRYPTION_CACHE_SIZE = int(os.environ.get("EMAIL_DECRYPTION_CACHE_SIZE", 10000))
+
+SEARCH_CACHE_TIMEOUT = int(os.environ.get("SEARCH_CACHE_TIMEOUT", 30))
+SEARCH_MAX_RESULTS = int(os.environ.get("SEARCH_MAX_RESULTS", 500))
+
+# Request logs are buffered in memory and written in batches by a background thread.
+# OVERFLOW is one of "block", "drop_newest", "drop_oldest" or "sync".
+LOG_BUFFER = {
+    'ENABLED': bool(int(os.environ.get("LOG_BUFFER_ENABLED", 1))),
+    'MAX_SIZE': int(os.environ.get("LOG_BUFFER_MAX_SIZE", 10000)),
+    'BATCH_SIZE': int(os.environ.get("LOG_BUFFER_BATCH_SIZE", 500)),
+    'FLUSH_INTERVAL': float(os.environ.get("LOG_BUFFER_FLUSH_INTERVAL", 1.0)),
+    'OVERFLOW': os.environ.get("LOG_BUFFER_OVERFLOW", "block"),
+    'BLOCK_TIMEOUT': float(os.environ.get("LOG_BUFFER_BLOCK_TIMEOUT", 0.05)),
+}
+
+# Per-minute latency rollups, written along with the request logs
+LATENCY_ROLLUPS = {
+    'ENABLED': bool(int(os.environ.get("LATENCY_ROLLUPS_ENABLED", 1))),
+    # changing it makes existing rollups unmergeable with new ones
+    'RELATIVE_ACCURACY': float(os.environ.get("LATENCY_ROLLUPS_RELATIVE_ACCURACY", 0.01)),
+    'DEFAULT_WINDOW': int(os.environ.get("LATENCY_ROLLUPS_DEFAULT_WINDOW", 60)),
+}
+
+# Bearer token a Prometheus scraper sends to read /metrics. Admins' access tokens work too;
+# with no token set they are the only way in.
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+# Log table partitioning (PostgreSQL only), maintained by the manage_log_partitions command
+LOG_PARTITIONS = {
+    'INTERVAL': os.environ.get("LOG_PARTITION_INTERVAL", "daily"),
+    'AHEAD': int(os.environ.get("LOG_PARTITIONS_AHEAD", 7)),
+    'RETENTION_DAYS': int(os.environ.get("LOG_RETENTION_DAYS", 90)),
+    'ARCHIVE_DIR': os.environ.get("LOG_ARCHIVE_DIR", str(BASE_DIR / 'log_archive')),
+}
+
 CACHES = {
     'default': {
         'BACKEND': 'django_redis.cache.RedisCache',
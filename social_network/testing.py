@@ -0,0 +1,96 @@
+"""
+Base test cases.
+
+Tests run against a local memory cache and write request logs inline. RedisTestCase runs
+them against fakeredis instead, for the code paths that only exist with the Redis backend
+(Lua scripts, sets, pub/sub); it is skipped when fakeredis (and lupa for the scripts) is
+not installed.
+"""
+import asyncio
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from accounts.authentication import ClaimsRefreshToken
+from accounts.models import CustomUser
+
+try:
+    import fakeredis
+    from fakeredis import aioredis as fake_aioredis
+except ImportError:
+    fakeredis = None
+
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    LOG_BUFFER=dict(settings.LOG_BUFFER, ENABLED=False),
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+class BaseTestCase(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    @staticmethod
+    def create_user(email, password="password", **extra_fields):
+        extra_fields.setdefault('first_name', email.split('@')[0])
+        return CustomUser.objects.create_user(email, password, **extra_fields)
+
+    @staticmethod
+    def get_client(user=None):
+        client = APIClient()
+        if user is not None:
+            client.credentials(HTTP_AUTHORIZATION=f"Bearer {ClaimsRefreshToken.for_user(user).access_token}")
+        return client
+
+
+if fakeredis is not None:
+    # django-redis keeps its connection pools per URL for the whole process, so every test
+    # shares one fake server and flushes it
+    fake_redis_server = fakeredis.FakeServer()
+
+    FAKE_REDIS_CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': 'redis://localhost:6379/1',
+            'OPTIONS': {
+                'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+                'CONNECTION_POOL_KWARGS': {
+                    'connection_class': fakeredis.FakeConnection,
+                    'server': fake_redis_server,
+                },
+            },
+        }
+    }
+
+
+@skipUnless(fakeredis, "fakeredis is not installed")
+class RedisTestCase(BaseTestCase):
+
+    def setUp(self):
+        redis_caches = override_settings(CACHES=FAKE_REDIS_CACHES)
+        redis_caches.enable()
+        self.addCleanup(redis_caches.disable)
+
+        async_clients = mock.patch('friend_management.cache.get_async_redis_client', self.get_async_redis_client)
+        async_clients.start()
+        self.addCleanup(async_clients.stop)
+
+        super().setUp()
+
+    @staticmethod
+    def get_async_redis_client():
+        asyncio.get_running_loop()
+        return fake_aioredis.FakeRedis(server=fake_redis_server, db=1)
@@ -0,0 +1,45 @@
+import importlib.util
+import io
+import os
+from contextlib import redirect_stdout
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+
+def load_settings(**environ):
+    """
+    A fresh copy of the settings module, run with environ added to the environment.
+    """
+    spec = importlib.util.spec_from_file_location('fresh_settings', os.path.join(os.path.dirname(__file__), 'settings.py'))
+    module = importlib.util.module_from_spec(spec)
+    with mock.patch.dict(os.environ, environ), redirect_stdout(io.StringIO()):
+        spec.loader.exec_module(module)
+    return module
+
+
+class DatabaseSettingsTests(SimpleTestCase):
+    POSTGRES = {'POSTGRES_ENGINE': 'django.db.backends.postgresql'}
+
+    def test_persistent_connections_by_default(self):
+        database = load_settings(**self.POSTGRES, DB_CONN_MAX_AGE='30', DB_STATEMENT_TIMEOUT='5000').DATABASES['default']
+
+        self.assertEqual(database['CONN_MAX_AGE'], 30)
+        self.assertTrue(database['CONN_HEALTH_CHECKS'])
+        self.assertNotIn('pool', database['OPTIONS'])
+        self.assertIn('-c statement_timeout=5000', database['OPTIONS']['options'])
+
+    def test_pool(self):
+        database = load_settings(**self.POSTGRES, DB_POOL='1', DB_POOL_MAX_SIZE='20', DB_POOL_TIMEOUT='2.5').DATABASES['default']
+
+        self.assertEqual(database['OPTIONS']['pool'], {
+            'min_size': 2, 'max_size': 20, 'timeout': 2.5, 'max_idle': 600, 'max_lifetime': 3600,
+        })
+        # pooled connections are not persisted by Django on top of the pool
+        self.assertNotIn('CONN_MAX_AGE', database)
+        self.assertNotIn('statement_timeout', database['OPTIONS']['options'])
+
+    def test_sqlite_is_left_alone(self):
+        database = load_settings(POSTGRES_ENGINE='django.db.backends.sqlite3').DATABASES['default']
+
+        self.assertNotIn('OPTIONS', database)
@@ -0,0 +1,37 @@
+from rest_framework.throttling import ScopedRateThrottle
+
+from logging_management.metrics import THROTTLED
+
+
+class MeteredScopedRateThrottle(ScopedRateThrottle):
+    """
+    ScopedRateThrottle that counts the requests it rejects per scope.
+    """
+
+    def allow_request(self, request, view):
+        allowed = super().allow_request(request, view)
+        if not allowed:
+            THROTTLED.labels(self.scope).inc()
+        return allowed
+
+
+class ItemScopedRateThrottle(MeteredScopedRateThrottle):
+    """
+    Counts every item of a bulk call as one request of the view's `throttle_item_scope`,
+    so a bulk endpoint draws on the same budget as the endpoint taking one item at a time.
+    The view's get_throttle_item_count(request) gives the number of items.
+    """
+
+    scope_attr = 'throttle_item_scope'
+
+    def allow_request(self, request, view):
+        self.item_count = view.get_throttle_item_count(request)
+        return super().allow_request(request, view)
+
+    def throttle_success(self):
+        if len(self.history) + self.item_count > self.num_requests:
+            return self.throttle_failure()
+
+        self.history[:0] = [self.now] * self.item_count
+        self.cache.set(self.key, self.history, self.duration)
+        return True
@@ -15,8 +15,14 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from accounts.views import UserRegisterView, UserLoginView, UserSearchView, BlockedUserListView, BlockedUserCreateView, UnblockedUserView
-from friend_management.views import FriendRequestSendView, FriendRequestAcceptView, FriendRequestRejectView, FriendRequestListView, FriendListView
-from logging_management.views import LogListView, LogCreateView, LogDetailView
+from friend_management.views import FriendRequestSendView, FriendRequestAcceptView, FriendRequestRejectView, FriendRequestListView, FriendListView, FriendSuggestionListView
+from friend_management.views import FriendshipChangeListView
+from friend_management.views import BulkFriendRequestSendView, BulkFriendRequestAcceptView, BulkFriendRequestRejectView
+from logging_management.views import LogListView, LogCreateView, LogDetailView, LatencyPercentileView, metrics_view
+from accounts.async_views import AsyncUserSearchView
+from friend_management.async_views import AsyncFriendListView, AsyncFriendRequestListView
+
+from django.conf import settings
 
 from django.contrib import admin
 from django.urls import path
@@ -37,21 +43,34 @@ schema_view = get_schema_view(
    permission_classes=(permissions.AllowAny,),
 )
 
+if settings.ASYNC_READ_VIEWS:
+    search_view, friend_requests_view, friends_view = AsyncUserSearchView, AsyncFriendRequestListView, AsyncFriendListView
+else:
+    search_view, friend_requests_view, friends_view = UserSearchView, FriendRequestListView, FriendListView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('register/', UserRegisterView.as_view(), name='register'),
     path('login/', UserLoginView.as_view(), name='login'),
-    path('search/', UserSearchView.as_view(), name='search'),
+    path('search/', search_view.as_view(), name='search'),
     path('send_friend_request/', FriendRequestSendView.as_view(), name='send_friend_request'),
     path('accept_friend_request/', FriendRequestAcceptView.as_view(), name='accept_friend_request'),
     path('reject_friend_request/', FriendRequestRejectView.as_view(), name='reject_friend_request'),
-    path('friend_requests/', FriendRequestListView.as_view(), name='friend_requests'),
-    path('friends/', FriendListView.as_view(), name='friends'),
+    path('send_friend_requests/', BulkFriendRequestSendView.as_view(), name='send_friend_requests'),
+    path('accept_friend_requests/', BulkFriendRequestAcceptView.as_view(), name='accept_friend_requests'),
+    path('reject_friend_requests/', BulkFriendRequestRejectView.as_view(), name='reject_friend_requests'),
+    path('friend_requests/', friend_requests_view.as_view(), name='friend_requests'),
+    path('friends/', friends_view.as_view(), name='friends'),
+    path('changes/', FriendshipChangeListView.as_view(), name='friendship_changes'),
+    path('friend_suggestions/', FriendSuggestionListView.as_view(), name='friend_suggestions'),
     path('blocked_users/', BlockedUserListView.as_view(), name='blocked_users'),
     path('block_user/', BlockedUserCreateView.as_view(), name='block_user'),
     path('unblock_user/', UnblockedUserView.as_view(), name='unblock_user'),
+    path('unblock_user/<int:blocked_user_id>/', UnblockedUserView.as_view(), name='unblock_user_by_id'),
     path('logs/', LogListView.as_view(), name='logs'),
     path('logs/create/', LogCreateView.as_view(), name='create_log'),
+    path('logs/latency/', LatencyPercentileView.as_view(), name='log_latency'),
+    path('metrics', metrics_view, name='metrics'),
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),  # Swagger UI
     path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),  # ReDoc
 ]